@@ -1,48 +1,120 @@
 import streamlit as st
-import pandas as pd
 import html as html_module
+import asyncio
 import hashlib
 import hmac
 import ipaddress
+import bisect
+import csv
+import functools
 import json
+import logging
+import math
+import mmap
 import os
+import queue
+import random
+import re
+import signal
+import socket
 import sqlite3
+import subprocess
+import sys
+import threading
 import time
+import unicodedata
 import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from streamlit import runtime
-from streamlit.runtime.scriptrunner import get_script_run_ctx
-from streamlit_js_eval import streamlit_js_eval
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner.script_requests import ScriptRequestType
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem flock, a coerência entre processos fica no PRAGMA data_version
+    fcntl = None
 
 # --- Constantes ---
 DB_NAME = "enquete_app_vfinal_cookie.db"
 MIN_OPTIONS = 2
 MAX_OPTIONS = 10
 DEFAULT_NUM_OPTIONS_ON_NEW = 2
-HISTORICO_LIMIT = 5
+HISTORICO_PAGE_SIZE = 5
+HISTORICO_CACHE_ITENS = 256
+HISTORICO_CACHE_PAGINAS = 512
+ESTADO_CACHE_ITENS = 4096
+SALA_PADRAO = "principal"
+SALA_MAX_LEN = 32
 AUTO_REFRESH_SECONDS = 5
+AUTO_REFRESH_MIN_SECONDS = 1
+AUTO_REFRESH_MAX_SECONDS = 60
+AUTO_REFRESH_BACKOFF = 2
+AUTO_REFRESH_JITTER = 0.5
+AUTO_REFRESH_OVERLOAD_MS = 100
+VOTE_BATCH_MAX = 256
+VOTE_SUBMIT_TIMEOUT = 30
+DATA_VERSION_CHECK_SECONDS = 0.5
+SHARED_VERSIONS = os.environ.get("SHARED_VERSIONS", "1") == "1"
+SHARED_VERSION_SLOTS = 256
+LIVE_TICK_SECONDS = 1
+LIVE_WAIT_FALLBACK_SECONDS = 2
+VOTE_EVENTS_COMPACT_SECONDS = 10
+EPOCH_PURGE_BATCH_ROWS = 500
+EPOCH_PURGE_PAUSE_SECONDS = 0.05
+TAXA_VOTOS_MAX_PONTOS = 240
+EXPORT_CHUNK_ROWS = 1000
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exportacoes")
+EXPORT_TTL_SECONDS = 3600
+PAYLOAD_METRICS = os.environ.get("PAYLOAD_METRICS", "0") == "1"
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0") == "1"
+METRICS_FILE = os.environ.get("METRICS_FILE", "")
+METRICS_FILE_SECONDS = 15
+METRICS_RATE_WINDOW_SECONDS = 60
+VOTE_COUNTER_SHARDS = max(1, int(os.environ.get("VOTE_COUNTER_SHARDS", "1")))
+DB_READER_POOL_SIZE = max(1, int(os.environ.get("DB_READER_POOL_SIZE", "8")))
+VOTER_INDEX_BLOOM = os.environ.get("VOTER_INDEX_BLOOM", "0") == "1"
+VOTER_BLOOM_CAPACITY = int(os.environ.get("VOTER_BLOOM_CAPACITY", "100000"))
+VOTER_BLOOM_FP_RATE = 0.001
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")
+KV_URL = os.environ.get("KV_URL", "")
+KV_PREFIX = os.environ.get("KV_PREFIX", "enquete-app")
+TRUSTED_PROXIES = os.environ.get("TRUSTED_PROXIES", "")
 UTC_TZ = ZoneInfo("UTC")
 BR_TZ = ZoneInfo("America/Sao_Paulo")
 SALT_SECRET = os.environ.get("PASSWORD_SALT", "enquete-app-default-salt-2024")
+PASSWORD_KDF = os.environ.get("PASSWORD_KDF", "pbkdf2")
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get("PASSWORD_PBKDF2_ITERATIONS", "100000"))
+PASSWORD_SCRYPT_N = int(os.environ.get("PASSWORD_SCRYPT_N", "16384"))
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+PASSWORD_HASH_WORKERS = max(1, int(os.environ.get("PASSWORD_HASH_WORKERS", "2")))
+PASSWORD_HASH_QUEUE = 8
+LOGIN_MAX_ATTEMPTS = 5
+LOGIN_WINDOW_SECONDS = 300
+PASSWORD_POLL_SECONDS = 0.25
 
-# --- Page Config ---
-st.set_page_config(
-    page_title="Enquete App | Sua enquete em tempo real",
-    page_icon="📊",
-    layout="centered",
-    initial_sidebar_state="collapsed",
-)
+# --- CSS (estático: um único bloco minificado, emitido uma vez por run completo) ---
+def _minificar_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
 
-# --- CSS (estático, injetado uma vez via constante) ---
-_CSS = """
-<style>
-    .main > div {
-        padding-top: 1rem;
-    }
-    .stApp > header {
-        background-color: transparent;
-    }
+
+_CSS = "<style>" + _minificar_css("""
+    .main { background-color: #ffffff; color: #333333; }
+    .main > div { padding-top: 1rem; }
+    .block-container { padding-top: 1rem; padding-bottom: 0rem; }
+    header { display: none !important; }
+    footer { display: none !important; }
+    #MainMenu { display: none !important; }
+    .stApp > header { background-color: transparent; }
+    div[data-testid="stAppViewBlockContainer"] { padding-top: 0 !important; padding-bottom: 0 !important; }
+    div[data-testid="stVerticalBlock"] { gap: 0 !important; padding-top: 0 !important; padding-bottom: 0 !important; }
+    .element-container { margin-top: 0 !important; margin-bottom: 0 !important; }
     .stButton>button { width: 100%; }
     .sidebar-history-link a {
         font-size: 0.9em;
@@ -53,45 +125,89 @@ _CSS = """
         overflow: hidden;
         text-overflow: ellipsis;
     }
-    .sidebar-history-link a:hover {
-        text-decoration: underline;
-    }
+    .sidebar-history-link a:hover { text-decoration: underline; }
     /* Esconde o iframe invisível do componente que captura o IP no navegador */
-    iframe[title="streamlit_js_eval.streamlit_js_eval"] {
-        display: none !important;
-    }
-</style>
-"""
-st.markdown(_CSS, unsafe_allow_html=True)
+    iframe[title="streamlit_js_eval.streamlit_js_eval"] { display: none !important; }
+    /* Resultados: uma barra por opção, tudo num único elemento */
+    .res p { margin: 0.5rem 0 0.2rem 0; }
+    .res span { display: block; height: 0.5rem; border-radius: 0.25rem; background: #f0f2f6; }
+    .res span i { display: block; height: 100%; border-radius: 0.25rem; background: #ff4b4b; }
+    .rodape { text-align: center; margin-top: 40px; padding: 10px; color: #000000; font-size: 16px; }
+    .rodape a { text-decoration: none; color: inherit; }
+""") + "</style>"
 
 
 # --- Utilitários ---
+# Hash de senha no formato "kdf$custo...$sal$hash", com sal aleatório e os
+# parâmetros gravados junto: trocar PASSWORD_KDF ou o custo vale para os
+# próximos hashes e os já gravados continuam verificáveis. Hex puro (sem "$")
+# é o formato antigo: PBKDF2-SHA256, 100k iterações, sal fixo SALT_SECRET.
+def _parametros_kdf():
+    if PASSWORD_KDF == "scrypt":
+        return "scrypt", [PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P]
+    return "pbkdf2_sha256", [PASSWORD_PBKDF2_ITERATIONS]
+
+
+def _derivar_senha(password, kdf, parametros, sal):
+    if kdf == "scrypt":
+        n, r, p = parametros
+        return hashlib.scrypt(password.encode(), salt=sal, n=n, r=r, p=p, maxmem=128 * r * (n + p + 2), dklen=32)
+    if kdf == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), sal, iterations=parametros[0])
+    raise ValueError(f"KDF desconhecido: {kdf}")
+
+
+def _ler_hash_senha(armazenado):
+    if "$" not in armazenado:
+        return "pbkdf2_sha256", [100_000], SALT_SECRET.encode(), bytes.fromhex(armazenado)
+    kdf, *parametros, sal, digest = armazenado.split("$")
+    return kdf, [int(p) for p in parametros], bytes.fromhex(sal), bytes.fromhex(digest)
+
+
 def hash_password(password):
-    return hashlib.pbkdf2_hmac(
-        "sha256",
-        password.encode(),
-        SALT_SECRET.encode(),
-        iterations=100_000,
-    ).hex()
-
-
-def _public_ip(value):
-    # Retorna o IP público normalizado, ou None. Descarta loopback e redes
-    # privadas (192.168.x/10.x) — que é tudo o que o proxy do Streamlit
-    # Cloud entrega nos headers, inviabilizando a detecção server-side.
+    kdf, parametros = _parametros_kdf()
+    sal = os.urandom(16)
+    digest = _derivar_senha(password, kdf, parametros, sal)
+    return "$".join([kdf, *map(str, parametros), sal.hex(), digest.hex()])
+
+
+def verificar_senha(password, armazenado):
     try:
-        ip_obj = ipaddress.ip_address(value)
-        if isinstance(ip_obj, ipaddress.IPv6Address) and ip_obj.ipv4_mapped:
-            ip_obj = ip_obj.ipv4_mapped
-        return str(ip_obj) if ip_obj.is_global else None
+        kdf, parametros, sal, esperado = _ler_hash_senha(armazenado)
+        return hmac.compare_digest(_derivar_senha(password, kdf, parametros, sal), esperado)
+    except ValueError:
+        return False
+
+
+def hash_senha_desatualizado(armazenado):
+    # Gravado com outro KDF/custo (ou no formato antigo): refeito no próximo login
+    kdf, parametros = _parametros_kdf()
+    return not armazenado.startswith("$".join([kdf, *map(str, parametros)]) + "$")
+
+
+def _ip_normalizado(value, so_publico=False):
+    # IP válido (IPv4 mapeado em IPv6 vira IPv4), ou None. Com so_publico,
+    # descarta loopback e redes privadas (192.168.x/10.x) — que é tudo o que
+    # o proxy do Streamlit Cloud entrega nos headers. Atrás de um proxy
+    # próprio, a rede da sala de aula pode ser privada.
+    try:
+        ip_obj = ipaddress.ip_address(str(value).strip())
     except (ValueError, TypeError):
         return None
+    if isinstance(ip_obj, ipaddress.IPv6Address) and ip_obj.ipv4_mapped:
+        ip_obj = ip_obj.ipv4_mapped
+    if so_publico and not ip_obj.is_global:
+        return None
+    return ip_obj
 
 
 def get_browser_public_ip():
     # IP público obtido no NAVEGADOR do aluno via JS — independe do proxy.
     # Retorna None no 1º render; o valor chega num rerun seguinte.
+    # Import tardio: o componente só é carregado quando usado.
     try:
+        from streamlit_js_eval import streamlit_js_eval
+
         return streamlit_js_eval(
             js_expressions="fetch('https://api.ipify.org').then(r => r.text()).catch(() => null)",
             key="browser_public_ip",
@@ -100,42 +216,135 @@ def get_browser_public_ip():
         return None
 
 
+# Proxies confiáveis (TRUSTED_PROXIES: IPs/CIDRs separados por vírgula).
+# Vazio desliga o modo proxy e o IP vem do navegador, como no Streamlit Cloud.
+_REDES_PROXY = tuple(ipaddress.ip_network(rede.strip(), strict=False) for rede in TRUSTED_PROXIES.split(",") if rede.strip())
+
+
+def resolver_ip_por_proxy(remote_ip, headers, redes=_REDES_PROXY):
+    # IP do cliente a partir da conexão e dos headers, confiando só nos
+    # saltos que vêm de proxies em `redes`: o X-Forwarded-For é lido da
+    # direita para a esquerda e o primeiro endereço fora de `redes` é o
+    # cliente. Quem não passou por um proxy confiável é o próprio cliente
+    # (headers ignorados). Se todos os saltos forem confiáveis, fica o mais
+    # distante. None se a cadeia for inválida.
+    par = _ip_normalizado(remote_ip)
+    if par is None:
+        return None
+    if not any(par in rede for rede in redes):
+        return str(par)
+    cadeia = [salto.strip() for salto in (headers.get("X-Forwarded-For") or "").split(",") if salto.strip()]
+    if not cadeia and headers.get("X-Real-Ip"):
+        cadeia = [headers.get("X-Real-Ip").strip()]
+    cliente = par
+    for salto in reversed(cadeia):
+        cliente = _ip_normalizado(salto)
+        if cliente is None:
+            return None
+        if not any(cliente in rede for rede in redes):
+            break
+    return str(cliente)
+
+
+def _conexao_do_cliente():
+    # Requisição HTTP que abriu o websocket da sessão (API interna do
+    # Streamlit): IP do par e headers. None fora de um run ou se a API mudar.
+    try:
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return None
+        session_info = runtime.get_instance().get_client(ctx.session_id)
+        return getattr(session_info, "request", None)
+    except Exception:
+        return None
+
+
+def ip_visto_pelo_servidor():
+    # IP do cliente segundo a conexão recebida pelo servidor: o par do socket
+    # ou, com TRUSTED_PROXIES, o resolvido pelos saltos confiáveis. Nunca um
+    # valor que o navegador informa sobre si mesmo (limitador de login).
+    requisicao = _conexao_do_cliente()
+    if requisicao is None:
+        return None
+    return resolver_ip_por_proxy(requisicao.remote_ip, requisicao.headers)
+
+
 def get_client_ip():
+    # Resolvido uma vez por sessão: st.session_state é o armazenamento que o
+    # Streamlit já chaveia pelo id da sessão. Com o IP conhecido, o
+    # componente JS não é mais montado nos reruns.
+    if st.session_state.get("client_public_ip"):
+        return st.session_state.client_public_ip
+    # 0) Modo proxy confiável: resolve no servidor já no primeiro run, sem a
+    #    ida e volta do componente JS (e sem a chamada ao ipify)
+    if _REDES_PROXY:
+        ip = ip_visto_pelo_servidor()
+        if ip:
+            st.session_state.client_public_ip = ip
+            return ip
     # 1) IP capturado no navegador (única fonte confiável no Streamlit Cloud)
     browser_ip = get_browser_public_ip()
     if browser_ip:
-        normalized = _public_ip(str(browser_ip).strip())
+        normalized = _ip_normalizado(browser_ip, so_publico=True)
         if normalized:
-            st.session_state.client_public_ip = normalized
-    if st.session_state.get("client_public_ip"):
-        return st.session_state.client_public_ip
-    # 2) Fallback server-side: headers do proxy (aceita apenas IP público)
-    try:
-        xff = st.context.headers.get("X-Forwarded-For") or ""
-        for cand in xff.split(","):
-            pub = _public_ip(cand.strip())
-            if pub:
-                return pub
-        real_ip = st.context.headers.get("X-Real-Ip")
-        if real_ip:
-            pub = _public_ip(real_ip.strip())
-            if pub:
-                return pub
-    except Exception:
-        pass
-    # 3) Fallback final: conexão websocket direta (aceita apenas IP público)
-    try:
-        ctx = get_script_run_ctx()
-        if ctx is not None:
-            session_info = runtime.get_instance().get_client(ctx.session_id)
-            if session_info is not None and session_info.request is not None:
-                return _public_ip(session_info.request.remote_ip)
-    except Exception:
-        pass
+            st.session_state.client_public_ip = str(normalized)
+            return str(normalized)
+    requisicao = _conexao_do_cliente()
+    if requisicao is None:
+        return None
+    # 2) Fallback server-side: headers do proxy, 3) conexão websocket direta
+    #    (aceitam apenas IP público)
+    candidatos = (requisicao.headers.get("X-Forwarded-For") or "").split(",")
+    candidatos += [requisicao.headers.get("X-Real-Ip"), requisicao.remote_ip]
+    for candidato in candidatos:
+        publico = _ip_normalizado(candidato, so_publico=True) if candidato else None
+        if publico:
+            return str(publico)
     return None
 
 
-def format_timestamp_br(timestamp_str):
+def ms_de_iso(timestamp_str):
+    # Texto ISO-8601 (com Z, com fuso ou sem fuso = UTC) -> epoch ms. Só para
+    # dados gravados antes da migração 7 e itens antigos do backend KV
+    if not timestamp_str:
+        return None
+    try:
+        if timestamp_str.endswith("Z"):
+            utc_dt = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
+        else:
+            naive_dt = datetime.fromisoformat(timestamp_str)
+            utc_dt = naive_dt.replace(tzinfo=UTC_TZ) if naive_dt.tzinfo is None else naive_dt
+    except ValueError:
+        try:
+            utc_dt = datetime.strptime(timestamp_str.split(".")[0], "%Y-%m-%d %H:%M:%S").replace(tzinfo=UTC_TZ)
+        except ValueError:
+            return None
+    return int(utc_dt.timestamp()) * 1000 + utc_dt.microsecond // 1000
+
+
+def iso_de_ms(ts_ms):
+    # Epoch ms -> texto ISO-8601 em UTC (ms, sufixo Z), para a exportação
+    if ts_ms is None:
+        return None
+    return datetime.fromtimestamp(ts_ms // 1000, UTC_TZ).strftime("%Y-%m-%dT%H:%M:%S.") + f"{ts_ms % 1000:03d}Z"
+
+
+def format_timestamp_br(ts_ms):
+    # Datas são guardadas como epoch ms; o texto só existe na exibição
+    if ts_ms is None:
+        return "Data não disponível"
+    return datetime.fromtimestamp(ts_ms / 1000, UTC_TZ).astimezone(BR_TZ).strftime("%d/%m/%Y %H:%M:%S")
+
+
+def format_timestamp_br_short(ts_ms):
+    if ts_ms is None:
+        return "Data inválida"
+    return datetime.fromtimestamp(ts_ms / 1000, UTC_TZ).astimezone(BR_TZ).strftime("%d/%m %H:%M")
+
+
+def _format_timestamp_br_iso(timestamp_str):
+    # Formatação a partir do texto ISO-8601 de antes da migração 7. Só a
+    # migração 5 (já publicada) a usa; o resto do app trabalha com epoch ms
     if not timestamp_str:
         return "Data não disponível"
     try:
@@ -153,7 +362,7 @@ def format_timestamp_br(timestamp_str):
             return timestamp_str.split(".")[0]
 
 
-def format_timestamp_br_short(timestamp_str):
+def _format_timestamp_br_short_iso(timestamp_str):
     if not timestamp_str:
         return "Data inválida"
     try:
@@ -171,266 +380,3165 @@ def format_timestamp_br_short(timestamp_str):
             return timestamp_str.split(" ")[0]
 
 
-def _safe_db_execute(fn, default=None):
+def agora_ms():
+    return time.time_ns() // 1_000_000
+
+
+# Votantes gravados em binário no SQLite (migração 7): "ip-<endereço>" vira os
+# 4 ou 16 bytes do IP e "sessao-<uuid>" vira 0x00 + os 16 bytes do UUID (17
+# bytes, para não colidir com um IPv6). Só formas canônicas são convertidas,
+# para a volta dar o mesmo texto; o resto segue como texto.
+_MARCA_SESSAO = b"\x00"
+
+
+def codificar_votante(user_voting_id):
+    # inet_pton/bytes.fromhex: várias vezes mais rápidos que ipaddress/uuid.UUID
+    prefixo, _, valor = user_voting_id.partition("-")
+    if prefixo == "ip":
+        familia = socket.AF_INET6 if ":" in valor else socket.AF_INET
+        try:
+            empacotado = socket.inet_pton(familia, valor)
+        except OSError:
+            return user_voting_id
+        if socket.inet_ntop(familia, empacotado) == valor:
+            return empacotado
+    elif prefixo == "sessao":
+        try:
+            empacotado = bytes.fromhex(valor.replace("-", ""))
+        except ValueError:
+            return user_voting_id
+        if len(empacotado) == 16 and _texto_uuid(empacotado) == valor:
+            return _MARCA_SESSAO + empacotado
+    return user_voting_id
+
+
+def _texto_uuid(empacotado):
+    h = empacotado.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def decodificar_votante(valor):
+    if isinstance(valor, str):
+        return valor
+    if len(valor) == 17 and valor[:1] == _MARCA_SESSAO:
+        return f"sessao-{_texto_uuid(valor[1:])}"
+    return f"ip-{socket.inet_ntop(socket.AF_INET if len(valor) == 4 else socket.AF_INET6, valor)}"
+
+
+def normalizar_sala(sala):
+    # Código de sala vem da URL: minúsculo, só [a-z0-9_-], tamanho limitado
+    sala = "".join(c for c in str(sala or "").strip().lower() if c.isascii() and (c.isalnum() or c in "_-"))
+    return sala[:SALA_MAX_LEN] or SALA_PADRAO
+
+
+def limpar_query_params():
+    # Limpa a URL mantendo só a sala atual
+    sala = st.query_params.get("sala")
+    st.query_params.clear()
+    if sala and normalizar_sala(sala) != SALA_PADRAO:
+        st.query_params["sala"] = normalizar_sala(sala)
+
+
+_RECURSOS_DO_PROCESSO = []
+
+
+def recurso_do_processo(fn):
+    # Singleton por processo via st.cache_resource, que sobrevive aos reruns.
+    # O cache_resource só acerta dentro de um ScriptRunContext: fora dele
+    # (import direto do app, como nos benchmarks) criaria uma instância nova
+    # a cada chamada, então ali o valor fica num memo local. Threads de fundo
+    # precisam de add_script_run_ctx para enxergar a mesma instância.
+    # Sem spinner: ele emitiria um st.empty (e o apagaria) a cada chamada,
+    # dois deltas por get_* em todo rerun.
+    em_cache = st.cache_resource(fn, show_spinner=False)
+    memo = []
+    lock = threading.Lock()
+
+    def obter():
+        if get_script_run_ctx() is not None:
+            return em_cache()
+        with lock:
+            if not memo:
+                memo.append(fn())
+            return memo[0]
+
+    def limpar():
+        em_cache.clear()
+        with lock:
+            memo.clear()
+
+    obter.clear = limpar
+    _RECURSOS_DO_PROCESSO.append(obter)
+    return obter
+
+
+def termos_busca(texto):
+    # Palavras minúsculas e sem acento, como o tokenizer unicode61 do FTS5
+    sem_acento = unicodedata.normalize("NFKD", str(texto or ""))
+    sem_acento = "".join(c for c in sem_acento if not unicodedata.combining(c))
+    return re.findall(r"\w+", sem_acento.lower())
+
+
+# --- Métricas (METRICS_ENABLED=1) ---
+class Metricas:
+    # Contadores e histogramas de latência por (nome, rótulos), exportados no
+    # formato texto do Prometheus. Cada contador também guarda uma janela de
+    # METRICS_RATE_WINDOW_SECONDS contagens por segundo, para as taxas
+    # (reruns/s, votos/s) da página de métricas. Gauges são lidos na hora do
+    # snapshot (registrar_gauge).
+    BALDES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._janelas = {}
+        self._histogramas = {}
+        self._gauges = {}
+        self._inicio = time.monotonic()
+
+    def contar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        segundo = int(time.monotonic())
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+            janela = self._janelas.get(chave)
+            if janela is None:
+                janela = self._janelas[chave] = deque(maxlen=METRICS_RATE_WINDOW_SECONDS + 1)
+            if janela and janela[-1][0] == segundo:
+                janela[-1][1] += valor
+            else:
+                janela.append([segundo, valor])
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        balde = bisect.bisect_left(self.BALDES_LATENCIA, segundos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                # Contagem por balde (+Inf no fim), soma e total
+                histograma = self._histogramas[chave] = [[0] * (len(self.BALDES_LATENCIA) + 1), 0.0, 0]
+            histograma[0][balde] += 1
+            histograma[1] += segundos
+            histograma[2] += 1
+
+    def registrar_gauge(self, nome, ler):
+        # ler() devolve um número ou um dict {rótulo: número}
+        self._gauges[nome] = ler
+
+    def taxa(self, nome, **filtro):
+        # Eventos/s na janela, somando os rótulos que batem com o filtro
+        agora = int(time.monotonic())
+        janela = min(METRICS_RATE_WINDOW_SECONDS, max(1, agora - int(self._inicio)))
+        total = 0
+        with self._lock:
+            for (nome_chave, rotulos), contagens in self._janelas.items():
+                if nome_chave == nome and filtro.items() <= dict(rotulos).items():
+                    total += sum(c for segundo, c in contagens if segundo > agora - janela)
+        return total / janela
+
+    def total(self, nome, **filtro):
+        with self._lock:
+            return sum(
+                valor
+                for (nome_chave, rotulos), valor in self._contadores.items()
+                if nome_chave == nome and filtro.items() <= dict(rotulos).items()
+            )
+
+    def latencias(self):
+        # Por histograma (rótulos): chamadas, média e p50/p95 aproximados (limite
+        # superior do balde), para a tabela da página de métricas
+        with self._lock:
+            histogramas = {chave: (list(h[0]), h[1], h[2]) for chave, h in self._histogramas.items()}
+        linhas = []
+        for (nome, rotulos), (baldes, soma, n) in sorted(histogramas.items()):
+            limites = self.BALDES_LATENCIA + (math.inf,)
+            acumulado, quantis = 0, {}
+            for limite, contagem in zip(limites, baldes):
+                acumulado += contagem
+                for q in (0.5, 0.95):
+                    if q not in quantis and acumulado >= q * n:
+                        quantis[q] = limite
+            linhas.append(
+                {
+                    **dict(rotulos),
+                    "chamadas": n,
+                    "média (ms)": round(soma / n * 1000, 3),
+                    "p50 ≤ (ms)": quantis[0.5] * 1000,
+                    "p95 ≤ (ms)": quantis[0.95] * 1000,
+                }
+            )
+        return linhas
+
+    def texto_prometheus(self):
+        def formatar_rotulos(rotulos, extra=()):
+            pares = [*rotulos, *extra]
+            if not pares:
+                return ""
+            escapados = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pares)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pares, escapados)) + "}"
+
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            histogramas = sorted((chave, (list(h[0]), h[1], h[2])) for chave, h in self._histogramas.items())
+        linhas = []
+        tipos = set()
+        for (nome, rotulos), valor in contadores:
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} counter")
+            linhas.append(f"{nome}{formatar_rotulos(rotulos)} {valor}")
+        for (nome, rotulos), (baldes, soma, n) in histogramas:
+            if nome not in tipos:
+                tipos.add(nome)
+                linhas.append(f"# TYPE {nome} histogram")
+            acumulado = 0
+            for limite, contagem in zip(self.BALDES_LATENCIA + ("+Inf",), baldes):
+                acumulado += contagem
+                linhas.append(f"{nome}_bucket{formatar_rotulos(rotulos, (('le', limite),))} {acumulado}")
+            linhas.append(f"{nome}_sum{formatar_rotulos(rotulos)} {soma:.6f}")
+            linhas.append(f"{nome}_count{formatar_rotulos(rotulos)} {n}")
+        for nome, ler in sorted(self._gauges.items()):
+            try:
+                valor = ler()
+            except Exception:
+                continue
+            if valor is None:
+                continue
+            linhas.append(f"# TYPE {nome} gauge")
+            if isinstance(valor, dict):
+                for rotulo, v in sorted(valor.items()):
+                    linhas.append(f'{nome}{{tipo="{rotulo}"}} {v}')
+            else:
+                linhas.append(f"{nome} {valor}")
+        return "\n".join(linhas) + "\n"
+
+    def gravar_arquivo(self, caminho):
+        # Troca atômica: o coletor de textfile nunca lê um arquivo pela metade
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write(self.texto_prometheus())
+        os.replace(temporario, caminho)
+
+
+_APIS_INTERNAS_AUSENTES = set()
+
+
+def _avisar_api_interna_ausente(nome):
+    # Uma linha no log por API interna do Streamlit que sumiu (upgrade), e
+    # não uma por chamada
+    if nome not in _APIS_INTERNAS_AUSENTES:
+        _APIS_INTERNAS_AUSENTES.add(nome)
+        logging.getLogger(__name__).warning(
+            "API interna do Streamlit indisponível (%s, Streamlit %s): usando o comportamento de reserva",
+            nome,
+            st.__version__,
+        )
+
+
+def _sessoes_ativas():
+    # SessionManager é API interna do Streamlit: None (gauge omitido) fora
+    # do servidor (AppTest) ou se a API mudar
+    try:
+        instancia = runtime.get_instance()
+    except RuntimeError:
+        return None
+    contar = getattr(getattr(instancia, "_session_mgr", None), "num_active_sessions", None)
+    if contar is None:
+        _avisar_api_interna_ausente("Runtime._session_mgr.num_active_sessions")
+        return None
+    return contar()
+
+
+def _gravar_metricas_periodicamente(metricas):
+    while True:
+        time.sleep(METRICS_FILE_SECONDS)
+        try:
+            metricas.gravar_arquivo(METRICS_FILE)
+        except OSError:
+            pass
+
+
+@recurso_do_processo
+def get_metricas():
+    metricas = Metricas()
+    metricas.registrar_gauge("enquete_sessoes_ativas", _sessoes_ativas)
+    metricas.registrar_gauge("enquete_atualizacao", lambda: get_agendador_atualizacao().metricas())
+    if STORAGE_BACKEND == "sqlite":
+        metricas.registrar_gauge("enquete_db_pool", lambda: get_db_pool().metricas())
+    if METRICS_FILE:
+        thread = threading.Thread(target=_gravar_metricas_periodicamente, args=(metricas,), name="metricas", daemon=True)
+        add_script_run_ctx(thread)
+        thread.start()
+    return metricas
+
+
+def _envolver_medicao(fn):
+    nome = fn.__qualname__
+
+    @functools.wraps(fn)
+    def medido(*args, **kwargs):
+        metricas = get_metricas()
+        inicio = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            metricas.contar("enquete_excecoes_total", funcao=nome)
+            raise
+        finally:
+            metricas.contar("enquete_chamadas_total", funcao=nome)
+            metricas.observar("enquete_duracao_segundos", time.perf_counter() - inicio, funcao=nome)
+
+    return medido
+
+
+def medir(fn):
+    # Chamadas, exceções e histograma de latência de fn, rotulados pelo nome.
+    # Com METRICS_ENABLED desligado devolve a própria fn: custo zero. (st.rerun
+    # e st.stop não contam como exceção: não herdam de Exception.)
+    return _envolver_medicao(fn) if METRICS_ENABLED else fn
+
+
+def _safe_db_execute(fn, default=None):
+    try:
+        return fn()
+    except sqlite3.OperationalError:
+        if METRICS_ENABLED:
+            get_metricas().contar("enquete_db_retentativas_total")
+        time.sleep(0.1)
+        try:
+            return fn()
+        except sqlite3.OperationalError as e:
+            if METRICS_ENABLED:
+                get_metricas().contar("enquete_db_falhas_total")
+            st.error(f"Erro de acesso ao banco de dados: {e}")
+            return default
+
+
+# --- Banco de Dados ---
+class PoolConexoes:
+    # Um único escritor serializado (votos e ações do professor) e até
+    # DB_READER_POOL_SIZE leitores somente leitura. Em WAL os leitores não
+    # esperam o escritor, então as leituras escalam com as sessões; nenhuma
+    # sessão compartilha o estado de transação de outra.
+    def __init__(self, caminho, tamanho_leitores=DB_READER_POOL_SIZE):
+        self.caminho = caminho
+        self.tamanho_leitores = tamanho_leitores
+        self._escritor = self._conectar()
+        self._lock_escrita = threading.RLock()
+        self._leitores_livres = queue.LifoQueue()
+        self._vagas_leitura = threading.BoundedSemaphore(tamanho_leitores)
+        self._sentinela = self._conectar(somente_leitura=True)
+        self._lock_sentinela = threading.Lock()
+        self._lock_metricas = threading.Lock()
+        self._metricas = {
+            "leituras": 0,
+            "leituras_em_espera": 0,
+            "espera_leitura_s": 0.0,
+            "escritas": 0,
+            "espera_escrita_s": 0.0,
+            "leitores_abertos": 0,
+            "leitores_em_uso": 0,
+        }
+
+    def _conectar(self, somente_leitura=False):
+        if somente_leitura:
+            uri = f"file:{os.path.abspath(self.caminho)}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=15, check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.caminho, timeout=15, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA busy_timeout=5000;")
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _contar(self, **incrementos):
+        with self._lock_metricas:
+            for chave, valor in incrementos.items():
+                self._metricas[chave] += valor
+
+    @contextmanager
+    def escrita(self):
+        inicio = time.perf_counter()
+        with self._lock_escrita:
+            self._contar(escritas=1, espera_escrita_s=time.perf_counter() - inicio)
+            try:
+                yield self._escritor
+            finally:
+                if self._escritor.in_transaction:
+                    self._escritor.rollback()
+
+    @contextmanager
+    def leitura(self):
+        inicio = time.perf_counter()
+        if not self._vagas_leitura.acquire(blocking=False):
+            self._contar(leituras_em_espera=1)
+            self._vagas_leitura.acquire()
+        try:
+            try:
+                conn = self._leitores_livres.get_nowait()
+            except queue.Empty:
+                conn = self._conectar(somente_leitura=True)
+                self._contar(leitores_abertos=1)
+            self._contar(leituras=1, leitores_em_uso=1, espera_leitura_s=time.perf_counter() - inicio)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._leitores_livres.put(conn)
+                self._contar(leitores_em_uso=-1)
+        finally:
+            self._vagas_leitura.release()
+
+    def data_version(self):
+        # Conexão dedicada: data_version é por conexão e muda a cada commit de
+        # qualquer outra conexão (o escritor deste processo ou outro processo)
+        with self._lock_sentinela:
+            return self._sentinela.execute("PRAGMA data_version").fetchone()[0]
+
+    def metricas(self):
+        with self._lock_metricas:
+            return dict(self._metricas, tamanho_leitores=self.tamanho_leitores)
+
+
+@recurso_do_processo
+def get_db_pool():
+    return PoolConexoes(DB_NAME)
+
+
+class VersoesCompartilhadas:
+    # Contadores de versão num arquivo mapeado em memória ao lado do banco
+    # (DB_NAME-versoes), lidos e escritos por todos os processos que servem o
+    # mesmo SQLite no host. Depois de cada commit, quem gravou incrementa o
+    # contador do que mudou: o estado de uma enquete, os votantes (reset) ou
+    # a lista do histórico, em SHARED_VERSION_SLOTS posições por família
+    # (enquete_id % slots; uma colisão só custa uma invalidação a mais). O
+    # contador 0 soma todas as mudanças: "outro processo gravou algo?" é a
+    # leitura de um inteiro na memória, sem consulta ao banco.
+    FAMILIAS = ("estado", "votantes", "historico")
+
+    def __init__(self, caminho, slots=SHARED_VERSION_SLOTS):
+        self.slots = slots
+        tamanho = 8 * (2 + len(self.FAMILIAS) * slots)
+        self._arquivo = open(caminho, "a+b")
+        if os.fstat(self._arquivo.fileno()).st_size < tamanho:
+            os.ftruncate(self._arquivo.fileno(), tamanho)
+        self._mapa = mmap.mmap(self._arquivo.fileno(), tamanho)
+        self._contadores = memoryview(self._mapa).cast("Q")
+        self._lock = threading.Lock()
+        self._vistos = self._contadores.tolist()
+
+    def _posicao(self, familia, enquete_id):
+        # Posição 1: mudanças que valem para todas as enquetes (config)
+        if enquete_id is None:
+            return 1
+        return 2 + self.FAMILIAS.index(familia) * self.slots + enquete_id % self.slots
+
+    def incrementar(self, familia, enquete_id=None):
+        posicao = self._posicao(familia, enquete_id)
+        fd = self._arquivo.fileno()
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            geral, antes = self._contadores[0], self._contadores[posicao]
+            self._contadores[posicao] = antes + 1
+            self._contadores[0] = geral + 1
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        # Quem chamou já invalidou o próprio cache: a mudança conta como vista,
+        # a não ser que existam mudanças de outro processo ainda não vistas
+        with self._lock:
+            if self._vistos[posicao] == antes:
+                self._vistos[posicao] = antes + 1
+            if self._vistos[0] == geral:
+                self._vistos[0] = geral + 1
+
+    def mudancas(self):
+        # [(familia, slot)] alterados por outros processos desde a chamada
+        # anterior; (None, None) = todas as enquetes
+        with self._lock:
+            if self._contadores[0] == self._vistos[0]:
+                return []
+            atuais = self._contadores.tolist()
+            alteradas = [pos for pos in range(1, len(atuais)) if atuais[pos] != self._vistos[pos]]
+            self._vistos = atuais
+        return [
+            (None, None) if pos == 1 else (self.FAMILIAS[(pos - 2) // self.slots], (pos - 2) % self.slots)
+            for pos in alteradas
+        ]
+
+
+class DifusorVersao:
+    # Pub/sub das versões do estado das enquetes: quem grava publica uma nova
+    # versão e as sessões ociosas esperam num Condition (sem gastar CPU) em
+    # vez de dormir com time.sleep. Cada enquete (sala) tem seu contador, para
+    # um voto numa sala não acordar nem invalidar as outras; o contador global
+    # cobre mudanças que afetam todas (config, gravações de outro processo sem
+    # detalhe). Gravações de outro processo vistas nas VersoesCompartilhadas
+    # sobem o contador do slot (enquete_id % SHARED_VERSION_SLOTS).
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._global = 0
+        self._por_enquete = {}
+        self._por_slot = {}
+
+    def versao(self, enquete_id=None):
+        slot = None if enquete_id is None else enquete_id % SHARED_VERSION_SLOTS
+        return (self._global, self._por_enquete.get(enquete_id, 0), self._por_slot.get(slot, 0))
+
+    def publicar(self, enquete_id=None):
+        with self._cond:
+            if enquete_id is None:
+                self._global += 1
+            else:
+                self._por_enquete[enquete_id] = self._por_enquete.get(enquete_id, 0) + 1
+            self._cond.notify_all()
+
+    def publicar_slot(self, slot):
+        with self._cond:
+            if slot is None:
+                self._global += 1
+            else:
+                self._por_slot[slot] = self._por_slot.get(slot, 0) + 1
+            self._cond.notify_all()
+
+    def aguardar(self, enquete_id, versao_vista, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self.versao(enquete_id) != versao_vista, timeout)
+            return self.versao(enquete_id)
+
+
+class CacheEstado:
+    # Cache do estado das enquetes compartilhado por todas as sessões do
+    # processo. Cada entrada guarda a versão em que foi lida; a versão sobe a
+    # cada escrita feita por este processo (invalidar) e também quando outro
+    # processo grava: pelas VersoesCompartilhadas do SQLite (só as enquetes do
+    # slot alterado, checadas a cada acesso) ou, sem elas, pela versao_externa
+    # do backend (PRAGMA data_version, KV), espaçada e valendo para todas.
+    # Assim N sessões custam ~uma leitura no banco por mudança, e não N
+    # leituras por refresh. As entradas ficam num LRU de ESTADO_CACHE_ITENS
+    # (salas paradas saem primeiro), e cada chave tem sua própria trava de
+    # carga: a leitura lenta de uma sala não segura as outras.
+    # Os valores são compartilhados: tratar como somente leitura.
+    def __init__(self, max_itens=ESTADO_CACHE_ITENS):
+        self._lock = threading.Lock()
+        self._max_itens = max_itens
+        self._cargas = {}
+        self.difusor = DifusorVersao()
+        self.ouvintes_mudanca_externa = []
+        self._data_version = None
+        self._data_version_checado_em = 0.0
+        self._entradas = OrderedDict()
+
+    def invalidar(self, enquete_id=None):
+        self.difusor.publicar(enquete_id)
+        versoes = get_armazenamento().versoes_compartilhadas()
+        if versoes is not None:
+            versoes.incrementar("estado", enquete_id)
+            return
+        # O commit local também mexe no data_version; absorve aqui para não
+        # contar a mesma mudança duas vezes
+        data_version = get_armazenamento().versao_externa()
+        with self._lock:
+            self._data_version = data_version
+
+    def _avisar_ouvintes(self, familia=None, slot=None):
+        for ouvinte in self.ouvintes_mudanca_externa:
+            ouvinte(familia, slot)
+
+    def _checar_mudancas_externas(self):
+        versoes = get_armazenamento().versoes_compartilhadas()
+        if versoes is None:
+            self._checar_data_version()
+            return
+        for familia, slot in versoes.mudancas():
+            self._avisar_ouvintes(familia, slot)
+            if familia != "historico":
+                self.difusor.publicar_slot(slot)
+
+    def _checar_data_version(self):
+        agora = time.monotonic()
+        if agora - self._data_version_checado_em < DATA_VERSION_CHECK_SECONDS:
+            return
+        self._data_version_checado_em = agora
+        data_version = get_armazenamento().versao_externa()
+        with self._lock:
+            mudou = self._data_version is not None and data_version != self._data_version
+            self._data_version = data_version
+        if mudou:
+            self._avisar_ouvintes()
+            self.difusor.publicar()
+
+    def versao(self, enquete_id=None):
+        self._checar_mudancas_externas()
+        return self.difusor.versao(enquete_id)
+
+    def _vigente(self, chave, versao):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] != versao:
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada
+
+    def obter_versionado(self, enquete_id, chave, carregar):
+        versao = self.versao(enquete_id)
+        chave = (enquete_id, *chave)
+        if (entrada := self._vigente(chave, versao)) is not None:
+            return entrada
+        # Uma única carga por chave: as demais sessões da mesma chave esperam
+        # e reaproveitam. A trava [lock, sessões usando] sai do dicionário
+        # com a última sessão, então ele não cresce com chaves já carregadas
+        with self._lock:
+            carga = self._cargas.setdefault(chave, [threading.Lock(), 0])
+            carga[1] += 1
+        try:
+            with carga[0]:
+                if (entrada := self._vigente(chave, versao)) is not None:
+                    return entrada
+                entrada = (versao, carregar())
+                with self._lock:
+                    self._entradas[chave] = entrada
+                    self._entradas.move_to_end(chave)
+                    while len(self._entradas) > self._max_itens:
+                        self._entradas.popitem(last=False)
+                return entrada
+        finally:
+            with self._lock:
+                carga[1] -= 1
+                if not carga[1]:
+                    del self._cargas[chave]
+
+    def obter(self, enquete_id, chave, carregar):
+        return self.obter_versionado(enquete_id, chave, carregar)[1]
+
+
+@recurso_do_processo
+def get_cache_estado():
+    return CacheEstado()
+
+
+class CacheHistorico:
+    # Enquetes arquivadas nunca mudam: ficam indefinidamente, já
+    # renderizadas, num LRU de HISTORICO_CACHE_ITENS itens. As páginas da
+    # lista lateral (LRU de HISTORICO_CACHE_PAGINAS) valem até a sala arquivar
+    # outra enquete, neste processo (invalidar_lista) ou em outro
+    # (mudanca_externa); os votos, que mudam a versão do CacheEstado a todo
+    # momento, não as afetam.
+    # Os valores são compartilhados: tratar como somente leitura.
+    def __init__(self, max_itens=HISTORICO_CACHE_ITENS, max_paginas=HISTORICO_CACHE_PAGINAS):
+        self._lock = threading.Lock()
+        self._max_itens = max_itens
+        self._max_paginas = max_paginas
+        self._itens = OrderedDict()
+        self._paginas = OrderedDict()
+        self._geracao_global = 0
+        self._geracao = {}
+        self._geracao_slot = {}
+
+    def _obter_lru(self, lru, chave, limite, geracao, carregar):
+        # geracao(): marca de validade da entrada, lida antes de carregar; se
+        # mudar durante a carga (invalidação concorrente), o valor não é guardado
+        with self._lock:
+            atual = geracao()
+            entrada = lru.get(chave)
+            if entrada is not None and entrada[0] == atual:
+                lru.move_to_end(chave)
+                return entrada[1]
+        valor = carregar()
+        if valor is None:
+            return None
+        with self._lock:
+            if geracao() == atual:
+                lru[chave] = (atual, valor)
+                lru.move_to_end(chave)
+                while len(lru) > limite:
+                    lru.popitem(last=False)
+        return valor
+
+    def _geracao_da(self, enquete_id):
+        slot = None if enquete_id is None else enquete_id % SHARED_VERSION_SLOTS
+        return (self._geracao_global, self._geracao.get(enquete_id, 0), self._geracao_slot.get(slot, 0))
+
+    def item(self, id_historico, carregar):
+        return self._obter_lru(self._itens, id_historico, self._max_itens, lambda: None, carregar)
+
+    def pagina(self, enquete_id, chave, carregar):
+        return self._obter_lru(
+            self._paginas, (enquete_id, *chave), self._max_paginas, lambda: self._geracao_da(enquete_id), carregar
+        )
+
+    def invalidar_lista(self, enquete_id=None):
+        with self._lock:
+            if enquete_id is None:
+                self._geracao_global += 1
+            else:
+                self._geracao[enquete_id] = self._geracao.get(enquete_id, 0) + 1
+        versoes = get_armazenamento().versoes_compartilhadas()
+        if versoes is not None:
+            versoes.incrementar("historico", enquete_id)
+
+    def mudanca_externa(self, familia=None, slot=None):
+        # Só o arquivamento mexe na lista: votos e resets de outro processo
+        # não a invalidam; sem detalhe (familia None), invalida tudo
+        with self._lock:
+            if familia is None or slot is None:
+                self._geracao_global += 1
+            elif familia == "historico":
+                self._geracao_slot[slot] = self._geracao_slot.get(slot, 0) + 1
+
+
+@recurso_do_processo
+def get_cache_historico():
+    cache = CacheHistorico()
+    get_cache_estado().ouvintes_mudanca_externa.append(cache.mudanca_externa)
+    return cache
+
+
+# --- Schema (migrações versionadas por PRAGMA user_version) ---
+def _migracao_1_schema_inicial(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS configuracao (
+        chave TEXT PRIMARY KEY,
+        valor TEXT
+    )
+    """)
+    # O hash da senha (PBKDF2/scrypt) só é calculado se a senha padrão for
+    # de fato gravada, não a cada partida do app
+    if conn.execute("SELECT 1 FROM configuracao WHERE chave = 'senha_professor'").fetchone() is None:
+        conn.execute(
+            "INSERT INTO configuracao (chave, valor) VALUES (?, ?)",
+            ("senha_professor", hash_password("admin123")),
+        )
+    conn.execute(
+        "INSERT OR IGNORE INTO configuracao (chave, valor) VALUES (?, ?)",
+        ("enquete_ativa", "0"),
+    )
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS enquete_ativa_definicao (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        pergunta TEXT,
+        opcoes_json TEXT
+    )
+    """)
+    default_opcoes_json = json.dumps([""] * DEFAULT_NUM_OPTIONS_ON_NEW)
+    conn.execute(
+        "INSERT OR IGNORE INTO enquete_ativa_definicao (id, pergunta, opcoes_json) VALUES (1, ?, ?)",
+        ("", default_opcoes_json),
+    )
+    # Contadores fatiados: cada opção tem VOTE_COUNTER_SHARDS linhas
+    # (fatias); cada voto incrementa uma fatia e a leitura soma todas.
+    # Bancos anteriores às fatias são convertidos aqui.
+    colunas_votos = [row["name"] for row in conn.execute("PRAGMA table_info(enquete_ativa_votos)")]
+    if colunas_votos and "fatia" not in colunas_votos:
+        conn.execute("ALTER TABLE enquete_ativa_votos RENAME TO enquete_ativa_votos_antiga")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS enquete_ativa_votos (
+        opcao_indice INTEGER NOT NULL,
+        fatia INTEGER NOT NULL DEFAULT 0,
+        contagem INTEGER DEFAULT 0,
+        PRIMARY KEY (opcao_indice, fatia)
+    )
+    """)
+    if colunas_votos and "fatia" not in colunas_votos:
+        conn.execute(
+            "INSERT INTO enquete_ativa_votos (opcao_indice, fatia, contagem) "
+            "SELECT opcao_indice, 0, contagem FROM enquete_ativa_votos_antiga"
+        )
+        conn.execute("DROP TABLE enquete_ativa_votos_antiga")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS enquete_ativa_cookie_votantes (
+        user_voting_id TEXT PRIMARY KEY,
+        vote_timestamp TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS historico_enquetes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'NOW')),
+        pergunta TEXT NOT NULL,
+        opcoes_json TEXT NOT NULL,
+        votos_json TEXT NOT NULL,
+        total_votos INTEGER DEFAULT 0
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_historico_timestamp ON historico_enquetes (timestamp DESC);")
+
+
+def _migracao_2_enquetes_por_sala(conn):
+    # Várias enquetes simultâneas, uma por sala. A enquete única (id = 1)
+    # vira a sala SALA_PADRAO, e a flag global 'enquete_ativa' passa a ser
+    # uma coluna da própria enquete.
+    ativa = conn.execute("SELECT valor FROM configuracao WHERE chave = 'enquete_ativa'").fetchone()
+    conn.execute("ALTER TABLE enquete_ativa_definicao RENAME TO enquete_ativa_definicao_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_definicao (
+        id INTEGER PRIMARY KEY,
+        sala TEXT NOT NULL UNIQUE,
+        pergunta TEXT,
+        opcoes_json TEXT,
+        ativa INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    conn.execute(
+        "INSERT INTO enquete_ativa_definicao (id, sala, pergunta, opcoes_json, ativa) "
+        "SELECT id, ?, pergunta, opcoes_json, ? FROM enquete_ativa_definicao_antiga",
+        (SALA_PADRAO, 1 if ativa and ativa["valor"] == "1" else 0),
+    )
+    conn.execute("DROP TABLE enquete_ativa_definicao_antiga")
+    conn.execute("DELETE FROM configuracao WHERE chave = 'enquete_ativa'")
+
+    conn.execute("ALTER TABLE enquete_ativa_votos RENAME TO enquete_ativa_votos_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_votos (
+        enquete_id INTEGER NOT NULL,
+        opcao_indice INTEGER NOT NULL,
+        fatia INTEGER NOT NULL DEFAULT 0,
+        contagem INTEGER DEFAULT 0,
+        PRIMARY KEY (enquete_id, opcao_indice, fatia)
+    )
+    """)
+    conn.execute(
+        "INSERT INTO enquete_ativa_votos (enquete_id, opcao_indice, fatia, contagem) "
+        "SELECT 1, opcao_indice, fatia, contagem FROM enquete_ativa_votos_antiga"
+    )
+    conn.execute("DROP TABLE enquete_ativa_votos_antiga")
+
+    conn.execute("ALTER TABLE enquete_ativa_cookie_votantes RENAME TO enquete_ativa_cookie_votantes_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_cookie_votantes (
+        enquete_id INTEGER NOT NULL,
+        user_voting_id TEXT NOT NULL,
+        vote_timestamp TEXT,
+        PRIMARY KEY (enquete_id, user_voting_id)
+    )
+    """)
+    conn.execute(
+        "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, user_voting_id, vote_timestamp) "
+        "SELECT 1, user_voting_id, vote_timestamp FROM enquete_ativa_cookie_votantes_antiga"
+    )
+    conn.execute("DROP TABLE enquete_ativa_cookie_votantes_antiga")
+
+    conn.execute(f"ALTER TABLE historico_enquetes ADD COLUMN sala TEXT NOT NULL DEFAULT '{SALA_PADRAO}'")
+    conn.execute("DROP INDEX IF EXISTS idx_historico_timestamp")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_historico_sala_timestamp ON historico_enquetes (sala, timestamp DESC, id DESC)"
+    )
+
+
+def _migracao_3_busca_historico(conn):
+    # Histórico sem limite: busca textual FTS5 sobre pergunta e opções. O
+    # índice usa conteúdo externo (o texto fica só em historico_enquetes) e é
+    # mantido por triggers.
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS historico_fts USING fts5(
+        pergunta, opcoes_json,
+        content='historico_enquetes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS historico_fts_ai AFTER INSERT ON historico_enquetes BEGIN
+        INSERT INTO historico_fts (rowid, pergunta, opcoes_json) VALUES (new.id, new.pergunta, new.opcoes_json);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS historico_fts_ad AFTER DELETE ON historico_enquetes BEGIN
+        INSERT INTO historico_fts (historico_fts, rowid, pergunta, opcoes_json)
+        VALUES ('delete', old.id, old.pergunta, old.opcoes_json);
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS historico_fts_au AFTER UPDATE ON historico_enquetes BEGIN
+        INSERT INTO historico_fts (historico_fts, rowid, pergunta, opcoes_json)
+        VALUES ('delete', old.id, old.pergunta, old.opcoes_json);
+        INSERT INTO historico_fts (rowid, pergunta, opcoes_json) VALUES (new.id, new.pergunta, new.opcoes_json);
+    END
+    """)
+    conn.execute("INSERT INTO historico_fts (historico_fts) VALUES ('rebuild')")
+
+
+def _migracao_4_eventos_de_voto(conn):
+    # Log de votos só de inserção (timestamp em ms e índice da opção), que a
+    # compactação periódica dobra em baldes por segundo. Os baldes de cada
+    # enquete são arquivados junto com ela no histórico (baldes_json).
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS votos_eventos (
+        enquete_id INTEGER NOT NULL,
+        ts_ms INTEGER NOT NULL,
+        opcao_indice INTEGER NOT NULL
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS votos_baldes (
+        enquete_id INTEGER NOT NULL,
+        balde INTEGER NOT NULL,
+        opcao_indice INTEGER NOT NULL,
+        contagem INTEGER NOT NULL,
+        PRIMARY KEY (enquete_id, balde, opcao_indice)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("ALTER TABLE historico_enquetes ADD COLUMN baldes_json TEXT")
+
+
+def _migracao_5_datas_formatadas(conn):
+    # Datas do histórico já formatadas no fuso de Brasília, gravadas uma vez
+    # ao arquivar em vez de a cada exibição. O trigger de UPDATE do FTS passa
+    # a olhar só as colunas indexadas, para o preenchimento abaixo (e futuros
+    # UPDATEs de outras colunas) não reindexar o texto.
+    conn.execute("ALTER TABLE historico_enquetes ADD COLUMN data_br TEXT")
+    conn.execute("ALTER TABLE historico_enquetes ADD COLUMN data_br_curta TEXT")
+    conn.execute("DROP TRIGGER IF EXISTS historico_fts_au")
+    conn.execute("""
+    CREATE TRIGGER historico_fts_au AFTER UPDATE OF pergunta, opcoes_json ON historico_enquetes BEGIN
+        INSERT INTO historico_fts (historico_fts, rowid, pergunta, opcoes_json)
+        VALUES ('delete', old.id, old.pergunta, old.opcoes_json);
+        INSERT INTO historico_fts (rowid, pergunta, opcoes_json) VALUES (new.id, new.pergunta, new.opcoes_json);
+    END
+    """)
+    conn.executemany(
+        "UPDATE historico_enquetes SET data_br = ?, data_br_curta = ? WHERE id = ?",
+        [
+            (_format_timestamp_br_iso(row["timestamp"]), _format_timestamp_br_short_iso(row["timestamp"]), row["id"])
+            for row in conn.execute("SELECT id, timestamp FROM historico_enquetes").fetchall()
+        ],
+    )
+
+
+def _migracao_6_epocas(conn):
+    # Votos, votantes, eventos e baldes passam a ser por época da enquete:
+    # zerar os votos é só abrir uma época nova na definição, em O(1), sem
+    # DELETE no lock do escritor. As linhas de épocas encerradas são
+    # apagadas em lotes pela PurgaEpocas.
+    conn.execute("ALTER TABLE enquete_ativa_definicao ADD COLUMN epoca INTEGER NOT NULL DEFAULT 0")
+
+    conn.execute("ALTER TABLE enquete_ativa_votos RENAME TO enquete_ativa_votos_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_votos (
+        enquete_id INTEGER NOT NULL,
+        epoca INTEGER NOT NULL,
+        opcao_indice INTEGER NOT NULL,
+        fatia INTEGER NOT NULL DEFAULT 0,
+        contagem INTEGER DEFAULT 0,
+        PRIMARY KEY (enquete_id, epoca, opcao_indice, fatia)
+    )
+    """)
+    conn.execute(
+        "INSERT INTO enquete_ativa_votos (enquete_id, epoca, opcao_indice, fatia, contagem) "
+        "SELECT enquete_id, 0, opcao_indice, fatia, contagem FROM enquete_ativa_votos_antiga"
+    )
+    conn.execute("DROP TABLE enquete_ativa_votos_antiga")
+
+    conn.execute("ALTER TABLE enquete_ativa_cookie_votantes RENAME TO enquete_ativa_cookie_votantes_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_cookie_votantes (
+        enquete_id INTEGER NOT NULL,
+        epoca INTEGER NOT NULL,
+        user_voting_id TEXT NOT NULL,
+        vote_timestamp TEXT,
+        PRIMARY KEY (enquete_id, epoca, user_voting_id)
+    )
+    """)
+    conn.execute(
+        "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_timestamp) "
+        "SELECT enquete_id, 0, user_voting_id, vote_timestamp FROM enquete_ativa_cookie_votantes_antiga"
+    )
+    conn.execute("DROP TABLE enquete_ativa_cookie_votantes_antiga")
+
+    conn.execute("ALTER TABLE votos_eventos ADD COLUMN epoca INTEGER NOT NULL DEFAULT 0")
+
+    conn.execute("ALTER TABLE votos_baldes RENAME TO votos_baldes_antiga")
+    conn.execute("""
+    CREATE TABLE votos_baldes (
+        enquete_id INTEGER NOT NULL,
+        epoca INTEGER NOT NULL,
+        balde INTEGER NOT NULL,
+        opcao_indice INTEGER NOT NULL,
+        contagem INTEGER NOT NULL,
+        PRIMARY KEY (enquete_id, epoca, balde, opcao_indice)
+    ) WITHOUT ROWID
+    """)
+    conn.execute(
+        "INSERT INTO votos_baldes (enquete_id, epoca, balde, opcao_indice, contagem) "
+        "SELECT enquete_id, 0, balde, opcao_indice, contagem FROM votos_baldes_antiga"
+    )
+    conn.execute("DROP TABLE votos_baldes_antiga")
+
+
+def _migracao_7_formato_compacto(conn):
+    # Votantes em binário (codificar_votante) numa tabela WITHOUT ROWID e datas
+    # como epoch ms (INTEGER) no lugar de texto ISO-8601: chaves e índices
+    # menores, menos páginas lidas por busca. Texto só na exibição.
+    conn.execute("ALTER TABLE enquete_ativa_cookie_votantes RENAME TO enquete_ativa_cookie_votantes_antiga")
+    conn.execute("""
+    CREATE TABLE enquete_ativa_cookie_votantes (
+        enquete_id INTEGER NOT NULL,
+        epoca INTEGER NOT NULL,
+        user_voting_id BLOB NOT NULL,
+        vote_ts_ms INTEGER,
+        PRIMARY KEY (enquete_id, epoca, user_voting_id)
+    ) WITHOUT ROWID
+    """)
+    conn.executemany(
+        "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_ts_ms) VALUES (?, ?, ?, ?)",
+        (
+            (enquete_id, epoca, codificar_votante(user_voting_id), ms_de_iso(vote_timestamp))
+            for enquete_id, epoca, user_voting_id, vote_timestamp in conn.execute(
+                "SELECT enquete_id, epoca, user_voting_id, vote_timestamp FROM enquete_ativa_cookie_votantes_antiga"
+            ).fetchall()
+        ),
+    )
+    conn.execute("DROP TABLE enquete_ativa_cookie_votantes_antiga")
+
+    # O UPDATE não mexe em pergunta/opcoes_json: o trigger do FTS não dispara
+    conn.execute("ALTER TABLE historico_enquetes ADD COLUMN ts_ms INTEGER")
+    conn.executemany(
+        "UPDATE historico_enquetes SET ts_ms = ? WHERE id = ?",
+        [
+            (ms_de_iso(row["timestamp"]), row["id"])
+            for row in conn.execute("SELECT id, timestamp FROM historico_enquetes").fetchall()
+        ],
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_historico_sala_timestamp")
+    conn.execute("ALTER TABLE historico_enquetes DROP COLUMN timestamp")
+    conn.execute("CREATE INDEX idx_historico_sala_ts ON historico_enquetes (sala, ts_ms DESC, id DESC)")
+
+
+def _migracao_8_indice_eventos_por_epoca(conn):
+    # A PurgaEpocas e a cauda do ritmo de votação filtram votos_eventos por
+    # (enquete_id, epoca); sem índice, cada lote da purga varria o log inteiro
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_votos_eventos_epoca ON votos_eventos (enquete_id, epoca)")
+
+
+# Aplicadas em ordem; a posição na lista (1-based) é a versão registrada em
+# PRAGMA user_version. Nunca editar uma migração já publicada: criar outra.
+_MIGRACOES = [
+    _migracao_1_schema_inicial,
+    _migracao_2_enquetes_por_sala,
+    _migracao_3_busca_historico,
+    _migracao_4_eventos_de_voto,
+    _migracao_5_datas_formatadas,
+    _migracao_6_epocas,
+    _migracao_7_formato_compacto,
+    _migracao_8_indice_eventos_por_epoca,
+]
+SCHEMA_VERSION = len(_MIGRACOES)
+
+
+# --- Armazenamento (backends plugáveis) ---
+class Armazenamento:
+    # Interface dos backends de persistência. As funções db_* abaixo são a
+    # fachada usada pelas telas: cuidam do CacheEstado e delegam a I/O ao
+    # backend escolhido por STORAGE_BACKEND. Escritas rodam sob escrita() e,
+    # depois de gravar, atualizam o índice de votantes e invalidam o cache.
+    @contextmanager
+    def escrita(self):
+        raise NotImplementedError
+
+    def versao_externa(self):
+        # Muda a cada gravação de qualquer processo/réplica
+        raise NotImplementedError
+
+    def versoes_compartilhadas(self):
+        # VersoesCompartilhadas entre os processos do host, ou None: aí a
+        # coerência entre processos fica só na versao_externa
+        return None
+
+    def inicializar(self):
+        raise NotImplementedError
+
+    def buscar_enquete_id(self, sala):
+        raise NotImplementedError
+
+    def criar_enquete(self, sala):
+        raise NotImplementedError
+
+    def carregar_config(self, chave):
+        raise NotImplementedError
+
+    def salvar_config(self, chave, valor):
+        raise NotImplementedError
+
+    def carregar_enquete_ativa(self, enquete_id):
+        raise NotImplementedError
+
+    def salvar_enquete_ativa(self, enquete_id, ativa):
+        raise NotImplementedError
+
+    def carregar_dados_enquete(self, enquete_id):
+        raise NotImplementedError
+
+    def salvar_dados_enquete(self, enquete_id, pergunta, opcoes_lista):
+        raise NotImplementedError
+
+    def limpar_votos(self, enquete_id, num_opcoes):
+        raise NotImplementedError
+
+    def purgar_epocas(self, limite):
+        # Apaga até `limite` linhas de épocas encerradas e devolve quantas.
+        # Backends que zeram apagando direto não têm o que purgar.
+        return 0
+
+    def carregar_resultados(self, enquete_id, num_opcoes):
+        raise NotImplementedError
+
+    def carregar_snapshot(self, enquete_id, user_voting_id=None):
+        # Com user_voting_id, inclui "ja_votou", lido na mesma transação
+        raise NotImplementedError
+
+    def registrar_voto(self, enquete_id, opcao_indice, user_voting_id):
+        raise NotImplementedError
+
+    def registrar_votos_em_lote(self, votos):
+        raise NotImplementedError
+
+    def verificar_votou(self, enquete_id, user_voting_id):
+        raise NotImplementedError
+
+    def carregar_votantes(self):
+        raise NotImplementedError
+
+    def carregar_taxa_votos(self, enquete_id):
+        # Baldes [(segundo epoch, opcao_indice, contagem)] da enquete em curso
+        raise NotImplementedError
+
+    def transicionar_enquete(self, enquete_id, ativa=None, pergunta=None, opcoes_lista=None):
+        # Mudança de ciclo de vida numa única transação: arquiva a enquete em
+        # curso (se ativa e válida), grava a nova definição e/ou o status
+        # (None = mantém) e zera os votos para o número de opções resultante
+        raise NotImplementedError
+
+    def adicionar_ao_historico(self, enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final):
+        raise NotImplementedError
+
+    def carregar_historico(self, enquete_id, limite, antes=None):
+        # Paginação por chave: itens mais antigos que o cursor
+        # antes=(ts_ms, id), do mais novo para o mais antigo
+        raise NotImplementedError
+
+    def buscar_historico(self, enquete_id, termos, limite, antes=None):
+        raise NotImplementedError
+
+    def carregar_enquete_historico(self, id_historico):
+        raise NotImplementedError
+
+    def exportar_historico(self, sala, apos_id, limite):
+        # Próximo lote de itens completos do histórico com id > apos_id, em
+        # ordem de id; sala=None exporta todas as salas
+        raise NotImplementedError
+
+
+def _opcoes_padrao():
+    return [""] * DEFAULT_NUM_OPTIONS_ON_NEW
+
+
+# A fatia sorteada é reduzida ao número de fatias existentes da opção, para
+# continuar válida se VOTE_COUNTER_SHARDS mudar com uma enquete em andamento
+_SQL_INCREMENTAR_FATIA = """
+UPDATE enquete_ativa_votos SET contagem = contagem + ?
+WHERE enquete_id = ? AND epoca = ? AND opcao_indice = ?
+  AND fatia = ? % (
+    SELECT COUNT(*) FROM enquete_ativa_votos WHERE enquete_id = ? AND epoca = ? AND opcao_indice = ?
+  )
+"""
+
+
+def _params_incrementar_fatia(enquete_id, epoca, opcao_indice, n):
+    fatia = random.randrange(VOTE_COUNTER_SHARDS)
+    return (n, enquete_id, epoca, opcao_indice, fatia, enquete_id, epoca, opcao_indice)
+
+
+_SQL_COMPACTAR_EVENTOS = """
+INSERT INTO votos_baldes (enquete_id, epoca, balde, opcao_indice, contagem)
+SELECT enquete_id, epoca, ts_ms / 1000, opcao_indice, COUNT(*) FROM votos_eventos
+WHERE rowid <= ? GROUP BY enquete_id, epoca, ts_ms / 1000, opcao_indice
+ON CONFLICT (enquete_id, epoca, balde, opcao_indice) DO UPDATE SET contagem = contagem + excluded.contagem
+"""
+
+# Tabelas por época e a chave usada para apagar um lote delas
+_TABELAS_POR_EPOCA = (
+    ("enquete_ativa_cookie_votantes", "enquete_id, epoca, user_voting_id"),
+    ("enquete_ativa_votos", "rowid"),
+    ("votos_eventos", "rowid"),
+    ("votos_baldes", "enquete_id, epoca, balde, opcao_indice"),
+)
+
+
+class ArmazenamentoSQLite(Armazenamento):
+    # Arquivo SQLite local (DB_NAME) acessado pelo PoolConexoes
+    def __init__(self):
+        self._compactado_em = time.monotonic()
+        self._versoes = None
+        if SHARED_VERSIONS and fcntl is not None:
+            self._versoes = VersoesCompartilhadas(f"{DB_NAME}-versoes")
+
+    @contextmanager
+    def escrita(self):
+        with get_db_pool().escrita() as conn:
+            yield conn
+
+    def versao_externa(self):
+        return get_db_pool().data_version()
+
+    def versoes_compartilhadas(self):
+        return self._versoes
+
+    def inicializar(self):
+        with get_db_pool().escrita() as conn:
+            # Banco já migrado: uma única leitura de pragma e nada mais
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                conn.execute("BEGIN IMMEDIATE")
+                # Relê sob o lock: outro processo pode ter migrado nesse meio-tempo
+                versao = conn.execute("PRAGMA user_version").fetchone()[0]
+                for numero in range(versao + 1, SCHEMA_VERSION + 1):
+                    _MIGRACOES[numero - 1](conn)
+                    conn.execute(f"PRAGMA user_version = {numero}")
+                conn.commit()
+        # Sobras de épocas encerradas antes de um reinício
+        get_purga_epocas().agendar()
+        return True
+
+    def buscar_enquete_id(self, sala):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute("SELECT id FROM enquete_ativa_definicao WHERE sala = ?", (sala,)).fetchone()
+            return row["id"] if row else None
+
+    def criar_enquete(self, sala):
+        with get_db_pool().escrita() as conn:
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO enquete_ativa_definicao (sala, pergunta, opcoes_json) VALUES (?, '', ?)",
+                    (sala, json.dumps(_opcoes_padrao())),
+                )
+                conn.commit()
+                enquete_id = conn.execute("SELECT id FROM enquete_ativa_definicao WHERE sala = ?", (sala,)).fetchone()["id"]
+            except sqlite3.Error as e:
+                st.error(f"Erro ao criar a sala: {e}")
+                return None
+            get_cache_estado().invalidar()
+            return enquete_id
+
+    def carregar_config(self, chave):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute("SELECT valor FROM configuracao WHERE chave = ?", (chave,)).fetchone()
+            return row["valor"] if row else None
+
+    def salvar_config(self, chave, valor):
+        with get_db_pool().escrita() as conn:
+            try:
+                conn.execute("REPLACE INTO configuracao (chave, valor) VALUES (?, ?)", (chave, valor))
+                conn.commit()
+                get_cache_estado().invalidar()
+            except sqlite3.Error as e:
+                st.error(f"Erro ao salvar configuração: {e}")
+
+    def carregar_enquete_ativa(self, enquete_id):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute("SELECT ativa FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()
+            return bool(row and row["ativa"])
+
+    def salvar_enquete_ativa(self, enquete_id, ativa):
+        with get_db_pool().escrita() as conn:
+            try:
+                conn.execute("UPDATE enquete_ativa_definicao SET ativa = ? WHERE id = ?", (1 if ativa else 0, enquete_id))
+                conn.commit()
+                get_cache_estado().invalidar(enquete_id)
+            except sqlite3.Error as e:
+                st.error(f"Erro ao salvar status da enquete: {e}")
+
+    def carregar_dados_enquete(self, enquete_id):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute(
+                "SELECT pergunta, opcoes_json FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)
+            ).fetchone()
+            if row and row["opcoes_json"]:
+                try:
+                    return {"pergunta": row["pergunta"], "opcoes": json.loads(row["opcoes_json"])}
+                except json.JSONDecodeError:
+                    pass
+            return {"pergunta": "", "opcoes": _opcoes_padrao()}
+
+    def salvar_dados_enquete(self, enquete_id, pergunta, opcoes_lista):
+        with get_db_pool().escrita() as conn:
+            try:
+                conn.execute(
+                    "UPDATE enquete_ativa_definicao SET pergunta = ?, opcoes_json = ? WHERE id = ?",
+                    (pergunta, json.dumps(opcoes_lista), enquete_id),
+                )
+                conn.commit()
+                get_cache_estado().invalidar(enquete_id)
+            except sqlite3.Error as e:
+                st.error(f"Erro ao salvar enquete: {e}")
+
+    def limpar_votos(self, enquete_id, num_opcoes):
+        with get_db_pool().escrita() as conn:
+            try:
+                self._zerar_votos(conn, enquete_id, num_opcoes)
+                conn.commit()
+                get_purga_epocas().agendar()
+                get_indice_votantes().limpar(enquete_id)
+                get_cache_estado().invalidar(enquete_id)
+            except sqlite3.Error as e:
+                st.error(f"Erro ao limpar votos: {e}")
+
+    def _zerar_votos(self, conn, enquete_id, num_opcoes):
+        # Dentro da transação de quem chamou. Zerar é abrir uma época nova,
+        # com os contadores (todas as fatias) de uma vez só por executemany;
+        # as linhas da época anterior ficam para a PurgaEpocas, que quem
+        # chamou agenda depois do commit
+        epoca = conn.execute(
+            "UPDATE enquete_ativa_definicao SET epoca = epoca + 1 WHERE id = ? RETURNING epoca", (enquete_id,)
+        ).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO enquete_ativa_votos (enquete_id, epoca, opcao_indice, fatia, contagem) VALUES (?, ?, ?, ?, 0)",
+            ((enquete_id, epoca, i, fatia) for i in range(num_opcoes) for fatia in range(VOTE_COUNTER_SHARDS)),
+        )
+
+    def purgar_epocas(self, limite):
+        # Um lote de até `limite` linhas de épocas encerradas, numa transação
+        # curta. As épocas só crescem: ler a atual fora da transação no
+        # máximo deixa linhas para o próximo lote.
+        with get_db_pool().escrita() as conn:
+            epocas = conn.execute("SELECT id, epoca FROM enquete_ativa_definicao").fetchall()
+            restante = limite
+            for enquete_id, epoca in epocas:
+                for tabela, chave in _TABELAS_POR_EPOCA:
+                    if restante <= 0:
+                        break
+                    restante -= conn.execute(
+                        f"""DELETE FROM {tabela} WHERE ({chave}) IN (
+                            SELECT {chave} FROM {tabela} WHERE enquete_id = ? AND epoca < ? LIMIT ?
+                        )""",
+                        (enquete_id, epoca, restante),
+                    ).rowcount
+            conn.commit()
+            return limite - restante
+
+    def transicionar_enquete(self, enquete_id, ativa=None, pergunta=None, opcoes_lista=None):
+        with get_db_pool().escrita() as conn:
+            try:
+                # BEGIN IMMEDIATE: o lock de escrita vem na largada, então o
+                # resultado arquivado é exatamente o que o reset apaga, e os
+                # alunos (um snapshot = uma transação de leitura) veem o
+                # estado anterior inteiro ou o novo inteiro, nunca uma mistura
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT ativa, pergunta, opcoes_json, epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                try:
+                    opcoes_atuais = json.loads(row["opcoes_json"] or "[]")
+                except json.JSONDecodeError:
+                    opcoes_atuais = []
+                arquivou = bool(row["ativa"] and row["pergunta"].strip() and len(opcoes_atuais) >= MIN_OPTIONS)
+                if arquivou:
+                    contagens = {
+                        r[0]: r[1]
+                        for r in conn.execute(
+                            "SELECT opcao_indice, SUM(contagem) FROM enquete_ativa_votos "
+                            "WHERE enquete_id = ? AND epoca = ? GROUP BY opcao_indice",
+                            (enquete_id, row["epoca"]),
+                        )
+                    }
+                    votos_lista = [contagens.get(i, 0) for i in range(len(opcoes_atuais))]
+                    self._gravar_historico(
+                        conn, enquete_id, row["pergunta"], opcoes_atuais, votos_lista, sum(contagens.values())
+                    )
+                if pergunta is not None:
+                    conn.execute(
+                        "UPDATE enquete_ativa_definicao SET pergunta = ?, opcoes_json = ? WHERE id = ?",
+                        (pergunta, json.dumps(opcoes_lista), enquete_id),
+                    )
+                else:
+                    opcoes_lista = opcoes_atuais
+                if ativa is not None:
+                    conn.execute("UPDATE enquete_ativa_definicao SET ativa = ? WHERE id = ?", (1 if ativa else 0, enquete_id))
+                self._zerar_votos(conn, enquete_id, max(MIN_OPTIONS, min(len(opcoes_lista), MAX_OPTIONS)))
+                conn.commit()
+            except sqlite3.Error as e:
+                st.error(f"Erro ao atualizar a enquete: {e}")
+                return False
+            get_purga_epocas().agendar()
+            get_indice_votantes().limpar(enquete_id)
+            if arquivou:
+                get_cache_historico().invalidar_lista(enquete_id)
+            get_cache_estado().invalidar(enquete_id)
+            return True
+
+    def carregar_resultados(self, enquete_id, num_opcoes):
+        with get_db_pool().leitura() as conn:
+            votos_rows = conn.execute(
+                "SELECT opcao_indice, SUM(contagem) AS contagem FROM enquete_ativa_votos "
+                "WHERE enquete_id = ? AND epoca = (SELECT epoca FROM enquete_ativa_definicao WHERE id = ?) "
+                "GROUP BY opcao_indice ORDER BY opcao_indice ASC",
+                (enquete_id, enquete_id),
+            ).fetchall()
+            votos_lista = [0] * num_opcoes
+            for row in votos_rows:
+                if 0 <= row["opcao_indice"] < num_opcoes:
+                    votos_lista[row["opcao_indice"]] = row["contagem"]
+            total_votos = sum(row["contagem"] for row in votos_rows)
+            return {"votos": votos_lista, "total_votos": total_votos}
+
+    def carregar_snapshot(self, enquete_id, user_voting_id=None):
+        # Uma única consulta (logo, uma única transação de leitura): flag de
+        # ativa, definição, contagens, total e "ja_votou" nunca discordam entre si
+        with get_db_pool().leitura() as conn:
+            row = conn.execute(
+                """SELECT
+                    d.ativa,
+                    d.pergunta,
+                    d.opcoes_json,
+                    (SELECT json_group_array(json_array(opcao_indice, contagem)) FROM (
+                        SELECT opcao_indice, SUM(contagem) AS contagem FROM enquete_ativa_votos
+                        WHERE enquete_id = d.id AND epoca = d.epoca GROUP BY opcao_indice
+                    )) AS votos_json,
+                    EXISTS(SELECT 1 FROM enquete_ativa_cookie_votantes
+                        WHERE enquete_id = d.id AND epoca = d.epoca AND user_voting_id = ?) AS ja_votou
+                FROM enquete_ativa_definicao d WHERE d.id = ?""",
+                (codificar_votante(user_voting_id) if user_voting_id else None, enquete_id),
+            ).fetchone()
+            pergunta, opcoes = "", _opcoes_padrao()
+            ativa, votos_pares = False, []
+            if row:
+                ativa = bool(row["ativa"])
+                try:
+                    if row["opcoes_json"]:
+                        pergunta, opcoes = row["pergunta"], json.loads(row["opcoes_json"])
+                except json.JSONDecodeError:
+                    pass
+                votos_pares = json.loads(row["votos_json"] or "[]")
+            votos = [0] * len(opcoes)
+            for opcao_indice, contagem in votos_pares:
+                if 0 <= opcao_indice < len(opcoes):
+                    votos[opcao_indice] = contagem
+            snapshot = {"ativa": ativa, "pergunta": pergunta, "opcoes": opcoes, "votos": votos, "total_votos": sum(votos)}
+            if user_voting_id:
+                snapshot["ja_votou"] = bool(row and row["ja_votou"])
+            return snapshot
+
+    def registrar_voto(self, enquete_id, opcao_indice, user_voting_id):
+        with get_db_pool().escrita() as conn:
+            try:
+                # A época é lida já com o lock de escrita: um reset de outro
+                # processo não passa entre a leitura e o voto
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()
+                if row is None:
+                    return False
+                epoca = row["epoca"]
+                ts_ms = agora_ms()
+                conn.execute(
+                    "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_ts_ms) "
+                    "VALUES (?, ?, ?, ?)",
+                    (enquete_id, epoca, codificar_votante(user_voting_id), ts_ms),
+                )
+                cursor = conn.execute(_SQL_INCREMENTAR_FATIA, _params_incrementar_fatia(enquete_id, epoca, opcao_indice, 1))
+                if cursor.rowcount == 0:
+                    conn.rollback()
+                    return False
+                conn.execute(
+                    "INSERT INTO votos_eventos (enquete_id, epoca, ts_ms, opcao_indice) VALUES (?, ?, ?, ?)",
+                    (enquete_id, epoca, ts_ms, opcao_indice),
+                )
+                self._compactar_se_devido(conn)
+                conn.commit()
+                get_indice_votantes().adicionar(enquete_id, user_voting_id)
+                get_cache_estado().invalidar(enquete_id)
+                return True
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                return False
+            except sqlite3.Error:
+                conn.rollback()
+                return False
+
+    def registrar_votos_em_lote(self, votos):
+        # Numa única transação (um fsync por lote)
+        with get_db_pool().escrita() as conn:
+            aceitos = [False] * len(votos)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                enquete_ids = list({v[0] for v in votos})
+                # Opções da época atual de cada enquete, já com o lock de escrita
+                epocas = {}
+                opcoes_validas = set()
+                for row in conn.execute(
+                    "SELECT DISTINCT v.enquete_id, v.epoca, v.opcao_indice FROM enquete_ativa_votos v "
+                    "JOIN enquete_ativa_definicao d ON d.id = v.enquete_id AND d.epoca = v.epoca "
+                    "WHERE v.enquete_id IN (%s)" % ",".join("?" * len(enquete_ids)),
+                    enquete_ids,
+                ):
+                    epocas[row["enquete_id"]] = row["epoca"]
+                    opcoes_validas.add((row["enquete_id"], row["opcao_indice"]))
+                ts_ms = agora_ms()
+                incrementos = {}
+                eventos = []
+                for pos, (enquete_id, opcao_indice, user_voting_id) in enumerate(votos):
+                    if (enquete_id, opcao_indice) not in opcoes_validas:
+                        continue
+                    epoca = epocas[enquete_id]
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO enquete_ativa_cookie_votantes "
+                        "(enquete_id, epoca, user_voting_id, vote_ts_ms) VALUES (?, ?, ?, ?)",
+                        (enquete_id, epoca, codificar_votante(user_voting_id), ts_ms),
+                    )
+                    if cursor.rowcount == 1:
+                        aceitos[pos] = True
+                        chave = (enquete_id, opcao_indice)
+                        incrementos[chave] = incrementos.get(chave, 0) + 1
+                        eventos.append((enquete_id, epoca, ts_ms, opcao_indice))
+                conn.executemany(
+                    _SQL_INCREMENTAR_FATIA,
+                    [_params_incrementar_fatia(e, epocas[e], o, n) for (e, o), n in incrementos.items()],
+                )
+                conn.executemany(
+                    "INSERT INTO votos_eventos (enquete_id, epoca, ts_ms, opcao_indice) VALUES (?, ?, ?, ?)", eventos
+                )
+                self._compactar_se_devido(conn)
+                conn.commit()
+                if incrementos:
+                    indice = get_indice_votantes()
+                    for (enquete_id, _, user_voting_id), aceito in zip(votos, aceitos):
+                        if aceito:
+                            indice.adicionar(enquete_id, user_voting_id)
+                    for enquete_id in {e for e, _ in incrementos}:
+                        get_cache_estado().invalidar(enquete_id)
+                return aceitos
+            except sqlite3.Error:
+                conn.rollback()
+                return [False] * len(votos)
+
+    def verificar_votou(self, enquete_id, user_voting_id):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM enquete_ativa_cookie_votantes WHERE enquete_id = ? "
+                "AND epoca = (SELECT epoca FROM enquete_ativa_definicao WHERE id = ?) AND user_voting_id = ?",
+                (enquete_id, enquete_id, codificar_votante(user_voting_id)),
+            ).fetchone()
+            return row is not None
+
+    def carregar_votantes(self):
+        with get_db_pool().escrita() as conn:
+            return [
+                (row["enquete_id"], decodificar_votante(row["user_voting_id"]))
+                for row in conn.execute(
+                    "SELECT v.enquete_id, v.user_voting_id FROM enquete_ativa_cookie_votantes v "
+                    "JOIN enquete_ativa_definicao d ON d.id = v.enquete_id AND d.epoca = v.epoca"
+                )
+            ]
+
+    def _compactar_eventos(self, conn):
+        # Dobra os eventos gravados até aqui nos baldes por segundo, dentro da
+        # transação de quem chamou. O limite por rowid deixa de fora eventos
+        # que outro processo insira no meio do caminho.
+        ultimo = conn.execute("SELECT MAX(rowid) FROM votos_eventos").fetchone()[0]
+        if ultimo is not None:
+            conn.execute(_SQL_COMPACTAR_EVENTOS, (ultimo,))
+            conn.execute("DELETE FROM votos_eventos WHERE rowid <= ?", (ultimo,))
+        self._compactado_em = time.monotonic()
+
+    def _compactar_se_devido(self, conn):
+        # Compactação periódica de carona no commit dos votos: sem transação
+        # nem invalidação de cache extras
+        if time.monotonic() - self._compactado_em >= VOTE_EVENTS_COMPACT_SECONDS:
+            self._compactar_eventos(conn)
+
+    def carregar_taxa_votos(self, enquete_id):
+        # Baldes já compactados mais a cauda de eventos ainda não compactada
+        with get_db_pool().leitura() as conn:
+            return [
+                tuple(row)
+                for row in conn.execute(
+                    """WITH atual AS (SELECT id, epoca FROM enquete_ativa_definicao WHERE id = ?)
+                    SELECT balde, opcao_indice, SUM(contagem) FROM (
+                        SELECT balde, opcao_indice, contagem FROM votos_baldes, atual
+                        WHERE enquete_id = atual.id AND votos_baldes.epoca = atual.epoca
+                        UNION ALL
+                        SELECT ts_ms / 1000, opcao_indice, COUNT(*) FROM votos_eventos, atual
+                        WHERE enquete_id = atual.id AND votos_eventos.epoca = atual.epoca
+                        GROUP BY ts_ms / 1000, opcao_indice
+                    ) GROUP BY balde, opcao_indice ORDER BY balde""",
+                    (enquete_id,),
+                )
+            ]
+
+    def _gravar_historico(self, conn, enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final):
+        # Arquiva os baldes da enquete junto com o resultado, dentro da
+        # transação de quem chamou
+        self._compactar_eventos(conn)
+        ts_ms = agora_ms()
+        conn.execute(
+            """INSERT INTO historico_enquetes
+            (sala, ts_ms, data_br, data_br_curta, pergunta, opcoes_json, votos_json, total_votos, baldes_json)
+            SELECT d.sala, ?, ?, ?, ?, ?, ?, ?, (
+                SELECT json_group_array(json_array(balde, opcao_indice, contagem)) FROM votos_baldes
+                WHERE enquete_id = d.id AND epoca = d.epoca
+            ) FROM enquete_ativa_definicao d WHERE d.id = ?""",
+            (
+                ts_ms,
+                format_timestamp_br(ts_ms),
+                format_timestamp_br_short(ts_ms),
+                pergunta,
+                json.dumps(opcoes_lista),
+                json.dumps(votos_lista),
+                total_votos_final,
+                enquete_id,
+            ),
+        )
+
+    def adicionar_ao_historico(self, enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final):
+        with get_db_pool().escrita() as conn:
+            try:
+                self._gravar_historico(conn, enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final)
+                conn.commit()
+                get_cache_historico().invalidar_lista(enquete_id)
+                get_cache_estado().invalidar(enquete_id)
+                return True
+            except sqlite3.Error as e:
+                st.error(f"Erro ao salvar enquete no histórico: {e}")
+                return False
+
+    def carregar_historico(self, enquete_id, limite, antes=None):
+        # Busca no índice (sala, ts_ms DESC, id DESC): custo proporcional
+        # à página, não ao tamanho do arquivo, em qualquer profundidade
+        filtro, params = "", [enquete_id]
+        if antes is not None:
+            filtro, params = "AND (h.ts_ms, h.id) < (?, ?)", params + list(antes)
+        with get_db_pool().leitura() as conn:
+            return conn.execute(
+                f"""SELECT h.id, h.pergunta, h.ts_ms, h.data_br_curta FROM historico_enquetes h
+                WHERE h.sala = (SELECT sala FROM enquete_ativa_definicao WHERE id = ?) {filtro}
+                ORDER BY h.ts_ms DESC, h.id DESC LIMIT ?""",
+                params + [limite],
+            ).fetchall()
+
+    def buscar_historico(self, enquete_id, termos, limite, antes=None):
+        # Prefixo de cada palavra ("elei*" acha "eleição"); ids crescem com o
+        # ts_ms, então ORDER BY rowid DESC percorre o FTS já em ordem
+        consulta = " ".join(f'"{termo}"*' for termo in termos)
+        filtro, params = "", [consulta, enquete_id]
+        if antes is not None:
+            filtro, params = "AND historico_fts.rowid < ?", params + [antes[1]]
+        with get_db_pool().leitura() as conn:
+            return conn.execute(
+                f"""SELECT h.id, h.pergunta, h.ts_ms, h.data_br_curta FROM historico_fts
+                JOIN historico_enquetes h ON h.id = historico_fts.rowid
+                WHERE historico_fts MATCH ?
+                  AND h.sala = (SELECT sala FROM enquete_ativa_definicao WHERE id = ?) {filtro}
+                ORDER BY historico_fts.rowid DESC LIMIT ?""",
+                params + [limite],
+            ).fetchall()
+
+    def carregar_enquete_historico(self, id_historico):
+        with get_db_pool().leitura() as conn:
+            row = conn.execute(
+                "SELECT pergunta, opcoes_json, votos_json, total_votos, ts_ms, data_br, baldes_json "
+                "FROM historico_enquetes WHERE id = ?",
+                (id_historico,),
+            ).fetchone()
+            if row:
+                return {
+                    "pergunta": row["pergunta"],
+                    "opcoes": json.loads(row["opcoes_json"]),
+                    "votos": json.loads(row["votos_json"]),
+                    "total_votos": row["total_votos"],
+                    "ts_ms": row["ts_ms"],
+                    "data_br": row["data_br"] or format_timestamp_br(row["ts_ms"]),
+                    "baldes": json.loads(row["baldes_json"] or "[]"),
+                }
+            return None
+
+    def exportar_historico(self, sala, apos_id, limite):
+        filtro, params = "", [apos_id]
+        if sala is not None:
+            filtro, params = "AND sala = ?", params + [sala]
+        with get_db_pool().leitura() as conn:
+            return [
+                {
+                    "id": row["id"],
+                    "sala": row["sala"],
+                    "ts_ms": row["ts_ms"],
+                    "pergunta": row["pergunta"],
+                    "opcoes": json.loads(row["opcoes_json"]),
+                    "votos": json.loads(row["votos_json"]),
+                    "total_votos": row["total_votos"],
+                    "baldes": json.loads(row["baldes_json"] or "[]"),
+                }
+                for row in conn.execute(
+                    f"""SELECT id, sala, ts_ms, pergunta, opcoes_json, votos_json, total_votos, baldes_json
+                    FROM historico_enquetes WHERE id > ? {filtro} ORDER BY id LIMIT ?""",
+                    params + [limite],
+                )
+            ]
+
+
+class ArmazemKVMemoria:
+    # Substituto em processo de um servidor chave-valor/contador (subconjunto
+    # dos comandos do Redis, com a mesma semântica e a mesma assinatura do
+    # cliente redis-py com decode_responses=True). Serve para testes e para
+    # rodar o backend KV sem servidor; não é compartilhado entre processos.
+    # Cada escrita sobe a versão da chave, que o WATCH do pipeline confere.
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._dados = {}
+        self._versoes = {}
+
+    def _tocar(self, chave):
+        self._versoes[chave] = self._versoes.get(chave, 0) + 1
+
+    def pipeline(self, transaction=True):
+        return _PipelineKVMemoria(self)
+
+    def get(self, chave):
+        with self._lock:
+            return self._dados.get(chave)
+
+    def set(self, chave, valor, nx=False):
+        with self._lock:
+            if nx and chave in self._dados:
+                return None
+            self._dados[chave] = str(valor)
+            self._tocar(chave)
+            return True
+
+    def incr(self, chave, amount=1):
+        with self._lock:
+            valor = int(self._dados.get(chave, 0)) + amount
+            self._dados[chave] = str(valor)
+            self._tocar(chave)
+            return valor
+
+    def delete(self, *chaves):
+        with self._lock:
+            for chave in chaves:
+                self._tocar(chave)
+            return sum(1 for chave in chaves if self._dados.pop(chave, None) is not None)
+
+    def hget(self, chave, campo):
+        with self._lock:
+            return self._dados.get(chave, {}).get(str(campo))
+
+    def hgetall(self, chave):
+        with self._lock:
+            return dict(self._dados.get(chave, {}))
+
+    def hset(self, chave, key=None, value=None, mapping=None):
+        campos = dict(mapping or {})
+        if key is not None:
+            campos[key] = value
+        with self._lock:
+            hash_ = self._dados.setdefault(chave, {})
+            novos = sum(1 for campo in campos if str(campo) not in hash_)
+            hash_.update({str(campo): str(valor) for campo, valor in campos.items()})
+            self._tocar(chave)
+            return novos
+
+    def hsetnx(self, chave, campo, valor):
+        with self._lock:
+            hash_ = self._dados.setdefault(chave, {})
+            if str(campo) in hash_:
+                return False
+            hash_[str(campo)] = str(valor)
+            self._tocar(chave)
+            return True
+
+    def hexists(self, chave, campo):
+        with self._lock:
+            return str(campo) in self._dados.get(chave, {})
+
+    def hincrby(self, chave, campo, amount=1):
+        with self._lock:
+            hash_ = self._dados.setdefault(chave, {})
+            valor = int(hash_.get(str(campo), 0)) + amount
+            hash_[str(campo)] = str(valor)
+            self._tocar(chave)
+            return valor
+
+    def sadd(self, chave, *valores):
+        with self._lock:
+            conjunto = self._dados.setdefault(chave, set())
+            novos = {str(v) for v in valores} - conjunto
+            conjunto.update(novos)
+            self._tocar(chave)
+            return len(novos)
+
+    def sismember(self, chave, valor):
+        with self._lock:
+            return str(valor) in self._dados.get(chave, set())
+
+    def smembers(self, chave):
+        with self._lock:
+            return set(self._dados.get(chave, set()))
+
+    def sinter(self, *chaves):
+        with self._lock:
+            conjuntos = [self._dados.get(chave, set()) for chave in chaves]
+            return set.intersection(*conjuntos) if conjuntos else set()
+
+    def zadd(self, chave, mapping):
+        # Conjunto ordenado: lista de (score, membro) em ordem + dict de scores
+        with self._lock:
+            itens, scores = self._dados.setdefault(chave, ([], {}))
+            novos = 0
+            for membro, score in mapping.items():
+                membro, score = str(membro), float(score)
+                if membro in scores:
+                    itens.remove((scores[membro], membro))
+                else:
+                    novos += 1
+                scores[membro] = score
+                bisect.insort(itens, (score, membro))
+            self._tocar(chave)
+            return novos
+
+    def zrevrangebyscore(self, chave, max, min, start=None, num=None):
+        def limite(valor):
+            valor = str(valor)
+            aberto = valor.startswith("(")
+            return float(valor.lstrip("(")), aberto
+
+        (maximo, max_aberto), (minimo, min_aberto) = limite(max), limite(min)
+        inicio = start or 0
+        with self._lock:
+            itens, _ = self._dados.get(chave, ([], {}))
+            if max_aberto:
+                fim = bisect.bisect_left(itens, (maximo,))
+            else:
+                fim = bisect.bisect_right(itens, (maximo, "\U0010ffff"))
+            selecionados = []
+            for pos in range(fim - 1 - inicio, -1, -1):
+                score, membro = itens[pos]
+                if score < minimo or (score == minimo and min_aberto):
+                    break
+                selecionados.append(membro)
+                if num is not None and len(selecionados) == num:
+                    break
+            return selecionados
+
+
+class ConflitoKV(Exception):
+    # Chave vigiada (WATCH) mudou antes do EXEC; o WatchError do redis-py
+    pass
+
+
+class _PipelineKVMemoria:
+    # MULTI/EXEC do ArmazemKVMemoria: enfileira os comandos e os executa de
+    # uma vez sob o lock do armazém, como uma transação do Redis. Depois de
+    # watch(), os comandos rodam na hora (leituras) até multi(), como no
+    # redis-py; o execute() levanta ConflitoKV se uma chave vigiada mudou.
+    def __init__(self, armazem):
+        self._armazem = armazem
+        self._comandos = []
+        self._vigiadas = None
+        self._imediato = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def reset(self):
+        self._comandos = []
+        self._vigiadas = None
+        self._imediato = False
+
+    def watch(self, *chaves):
+        with self._armazem._lock:
+            self._vigiadas = {chave: self._armazem._versoes.get(chave, 0) for chave in chaves}
+        self._imediato = True
+
+    def multi(self):
+        self._imediato = False
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._armazem, nome)
+        if self._imediato:
+            return metodo
+
+        def enfileirar(*args, **kwargs):
+            self._comandos.append((metodo, args, kwargs))
+            return self
+
+        return enfileirar
+
+    def execute(self):
+        try:
+            with self._armazem._lock:
+                for chave, versao in (self._vigiadas or {}).items():
+                    if self._armazem._versoes.get(chave, 0) != versao:
+                        raise ConflitoKV(chave)
+                return [metodo(*args, **kwargs) for metodo, args, kwargs in self._comandos]
+        finally:
+            self.reset()
+
+
+class ArmazenamentoKV(Armazenamento):
+    # Estado num servidor chave-valor/contador compartilhado (Redis ou
+    # compatível), para várias réplicas do app atrás de um balanceador.
+    # Voto único: o lote de votos vigia (WATCH) o conjunto de votantes e as
+    # contagens da enquete e grava SADD e HINCRBY num MULTI/EXEC, então só
+    # uma réplica "ganha" cada votante, e uma transição no meio refaz o lote.
+    # Contagens em HINCRBY dispensam as fatias do SQLite. Toda escrita
+    # incrementa a chave "versao", que as outras réplicas observam como o
+    # PRAGMA data_version do SQLite.
+    # Ritmo de votação: em vez de log + compactação (que exigiria um lock
+    # entre réplicas), cada voto já cai no balde do seu segundo via HINCRBY.
+    def __init__(self, kv, prefixo=KV_PREFIX):
+        self.kv = kv
+        self.prefixo = prefixo
+        self._lock_escrita = threading.RLock()
+        self._conflitos = (ConflitoKV,)
+        if not isinstance(kv, ArmazemKVMemoria):
+            from redis.exceptions import WatchError
+
+            self._conflitos += (WatchError,)
+
+    def _k(self, *partes):
+        return ":".join((self.prefixo, *map(str, partes)))
+
+    def _gravou(self):
+        self.kv.incr(self._k("versao"))
+
+    @contextmanager
+    def escrita(self):
+        with self._lock_escrita:
+            yield self.kv
+
+    def versao_externa(self):
+        return int(self.kv.get(self._k("versao")) or 0)
+
+    def inicializar(self):
+        # Hash da senha só se ela ainda não existe; nx evita sobrescrever
+        # a de outra réplica que inicializou ao mesmo tempo
+        if self.kv.get(self._k("config", "senha_professor")) is None:
+            self.kv.set(self._k("config", "senha_professor"), hash_password("admin123"), nx=True)
+        return True
+
+    def buscar_enquete_id(self, sala):
+        enquete_id = self.kv.hget(self._k("salas"), sala)
+        return int(enquete_id) if enquete_id is not None else None
+
+    def criar_enquete(self, sala):
+        with self.escrita():
+            novo_id = self.kv.incr(self._k("seq", "enquete"))
+            self.kv.hset(
+                self._k("enquete", novo_id),
+                mapping={"sala": sala, "pergunta": "", "opcoes_json": json.dumps(_opcoes_padrao()), "ativa": "0"},
+            )
+            if not self.kv.hsetnx(self._k("salas"), sala, novo_id):
+                # Outra réplica criou a sala primeiro: descarta a nossa
+                self.kv.delete(self._k("enquete", novo_id))
+            self._gravou()
+            get_cache_estado().invalidar()
+            return self.buscar_enquete_id(sala)
+
+    def carregar_config(self, chave):
+        return self.kv.get(self._k("config", chave))
+
+    def salvar_config(self, chave, valor):
+        with self.escrita():
+            self.kv.set(self._k("config", chave), valor)
+            self._gravou()
+            get_cache_estado().invalidar()
+
+    def carregar_enquete_ativa(self, enquete_id):
+        return self.kv.hget(self._k("enquete", enquete_id), "ativa") == "1"
+
+    def salvar_enquete_ativa(self, enquete_id, ativa):
+        with self.escrita():
+            self.kv.hset(self._k("enquete", enquete_id), "ativa", "1" if ativa else "0")
+            self._gravou()
+            get_cache_estado().invalidar(enquete_id)
+
+    def carregar_dados_enquete(self, enquete_id):
+        return self._dados_da_definicao(self.kv.hgetall(self._k("enquete", enquete_id)))
+
+    def _dados_da_definicao(self, definicao):
+        if definicao.get("opcoes_json"):
+            try:
+                return {"pergunta": definicao.get("pergunta", ""), "opcoes": json.loads(definicao["opcoes_json"])}
+            except json.JSONDecodeError:
+                pass
+        return {"pergunta": "", "opcoes": _opcoes_padrao()}
+
+    def salvar_dados_enquete(self, enquete_id, pergunta, opcoes_lista):
+        with self.escrita():
+            self.kv.hset(self._k("enquete", enquete_id), mapping={"pergunta": pergunta, "opcoes_json": json.dumps(opcoes_lista)})
+            self._gravou()
+            get_cache_estado().invalidar(enquete_id)
+
+    def limpar_votos(self, enquete_id, num_opcoes):
+        with self.escrita():
+            self.kv.delete(
+                self._k("enquete", enquete_id, "votos"),
+                self._k("enquete", enquete_id, "votantes"),
+                self._k("enquete", enquete_id, "baldes"),
+            )
+            self.kv.hset(self._k("enquete", enquete_id, "votos"), mapping={i: 0 for i in range(num_opcoes)})
+            self._gravou()
+            get_indice_votantes().limpar(enquete_id)
+            get_cache_estado().invalidar(enquete_id)
+
+    def transicionar_enquete(self, enquete_id, ativa=None, pergunta=None, opcoes_lista=None):
+        chave = self._k("enquete", enquete_id)
+        chave_votos = self._k("enquete", enquete_id, "votos")
+        chave_baldes = self._k("enquete", enquete_id, "baldes")
+        with self.escrita(), self.kv.pipeline() as pipe:
+            # WATCH + MULTI/EXEC: lê definição, contagens e baldes vigiando as
+            # chaves (e os votantes) e grava reset, enquete nova e arquivo num
+            # EXEC só. Se um voto (ou outra réplica) mexer nelas no meio, o EXEC
+            # falha e tudo é relido, e os alunos nunca veem mistura. O voto
+            # também vigia contagens e votantes (registrar_votos_em_lote): um
+            # voto aceito conta na enquete arquivada ou na nova, com o votante
+            # no conjunto da mesma enquete.
+            chave_votantes = self._k("enquete", enquete_id, "votantes")
+            while True:
+                try:
+                    pipe.watch(chave, chave_votos, chave_votantes, chave_baldes)
+                    definicao = pipe.hgetall(chave)
+                    if not definicao:
+                        pipe.reset()
+                        get_indice_votantes().limpar(enquete_id)
+                        get_cache_estado().invalidar(enquete_id)
+                        return False
+                    anterior = self._dados_da_definicao(definicao)
+                    contagens, baldes = pipe.hgetall(chave_votos), pipe.hgetall(chave_baldes)
+                    novas_opcoes = anterior["opcoes"] if pergunta is None else opcoes_lista
+                    num_opcoes = max(MIN_OPTIONS, min(len(novas_opcoes), MAX_OPTIONS))
+                    arquivar = (
+                        definicao.get("ativa") == "1"
+                        and anterior["pergunta"].strip()
+                        and len(anterior["opcoes"]) >= MIN_OPTIONS
+                    )
+                    # O id vem antes do MULTI; uma nova tentativa só deixa um buraco na sequência
+                    id_historico = self.kv.incr(self._k("seq", "historico")) if arquivar else None
+                    pipe.multi()
+                    pipe.delete(chave_votos, chave_votantes, chave_baldes)
+                    pipe.hset(chave_votos, mapping={i: 0 for i in range(num_opcoes)})
+                    mudancas = {}
+                    if pergunta is not None:
+                        mudancas.update(pergunta=pergunta, opcoes_json=json.dumps(opcoes_lista))
+                    if ativa is not None:
+                        mudancas["ativa"] = "1" if ativa else "0"
+                    if mudancas:
+                        pipe.hset(chave, mapping=mudancas)
+                    if arquivar:
+                        votos = self._votos(contagens, len(anterior["opcoes"]))
+                        self._gravar_historico(
+                            pipe,
+                            id_historico,
+                            definicao["sala"],
+                            anterior["pergunta"],
+                            anterior["opcoes"],
+                            votos,
+                            sum(votos),
+                            self._baldes(baldes),
+                        )
+                    pipe.incr(self._k("versao"))
+                    pipe.execute()
+                    break
+                except self._conflitos:
+                    continue
+            get_indice_votantes().limpar(enquete_id)
+            if arquivar:
+                get_cache_historico().invalidar_lista(enquete_id)
+            get_cache_estado().invalidar(enquete_id)
+            return True
+
+    def _votos(self, contagens, num_opcoes):
+        votos = [0] * num_opcoes
+        for opcao_indice, contagem in contagens.items():
+            if 0 <= int(opcao_indice) < num_opcoes:
+                votos[int(opcao_indice)] = int(contagem)
+        return votos
+
+    def carregar_resultados(self, enquete_id, num_opcoes):
+        votos = self._votos(self.kv.hgetall(self._k("enquete", enquete_id, "votos")), num_opcoes)
+        return {"votos": votos, "total_votos": sum(votos)}
+
+    def carregar_snapshot(self, enquete_id, user_voting_id=None):
+        # Definição, contagens e "ja_votou" numa única transação (MULTI/EXEC),
+        # como a consulta única do SQLite
+        with self.kv.pipeline() as pipe:
+            pipe.hgetall(self._k("enquete", enquete_id))
+            pipe.hgetall(self._k("enquete", enquete_id, "votos"))
+            if user_voting_id:
+                pipe.sismember(self._k("enquete", enquete_id, "votantes"), user_voting_id)
+            definicao, contagens, *votou = pipe.execute()
+        dados = self._dados_da_definicao(definicao)
+        votos = self._votos(contagens, len(dados["opcoes"]))
+        snapshot = dict(dados, ativa=definicao.get("ativa") == "1", votos=votos, total_votos=sum(votos))
+        if user_voting_id:
+            snapshot["ja_votou"] = bool(votou[0])
+        return snapshot
+
+    def registrar_voto(self, enquete_id, opcao_indice, user_voting_id):
+        return self.registrar_votos_em_lote([(enquete_id, opcao_indice, user_voting_id)])[0]
+
+    def registrar_votos_em_lote(self, votos):
+        # WATCH nas contagens e nos votantes das enquetes do lote, checagens
+        # (opção existe, ainda não votou) e um EXEC só com SADD, HINCRBY das
+        # contagens e dos baldes. Uma transição (ou voto de outra réplica)
+        # entre a leitura e o EXEC derruba o lote, que é refeito contra a
+        # enquete nova: votante e voto caem sempre na mesma enquete.
+        balde = int(time.time())
+        enquetes = {enquete_id for enquete_id, _, _ in votos}
+        vigiadas = [self._k("enquete", e, sufixo) for e in enquetes for sufixo in ("votos", "votantes")]
+        with self.escrita(), self.kv.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*vigiadas)
+                    aceitos = [False] * len(votos)
+                    incrementos = {}
+                    novos = set()
+                    for pos, (enquete_id, opcao_indice, user_voting_id) in enumerate(votos):
+                        if (enquete_id, user_voting_id) in novos or not pipe.hexists(
+                            self._k("enquete", enquete_id, "votos"), opcao_indice
+                        ):
+                            continue
+                        if pipe.sismember(self._k("enquete", enquete_id, "votantes"), user_voting_id):
+                            continue
+                        novos.add((enquete_id, user_voting_id))
+                        aceitos[pos] = True
+                        chave = (enquete_id, opcao_indice)
+                        incrementos[chave] = incrementos.get(chave, 0) + 1
+                    if not incrementos:
+                        pipe.reset()
+                        return aceitos
+                    pipe.multi()
+                    for enquete_id, user_voting_id in novos:
+                        pipe.sadd(self._k("enquete", enquete_id, "votantes"), user_voting_id)
+                    for (enquete_id, opcao_indice), n in incrementos.items():
+                        pipe.hincrby(self._k("enquete", enquete_id, "votos"), opcao_indice, n)
+                        pipe.hincrby(self._k("enquete", enquete_id, "baldes"), f"{balde}:{opcao_indice}", n)
+                    pipe.incr(self._k("versao"))
+                    pipe.execute()
+                    break
+                except self._conflitos:
+                    continue
+            indice = get_indice_votantes()
+            for (enquete_id, _, user_voting_id), aceito in zip(votos, aceitos):
+                if aceito:
+                    indice.adicionar(enquete_id, user_voting_id)
+            for enquete_id in {e for e, _ in incrementos}:
+                get_cache_estado().invalidar(enquete_id)
+            return aceitos
+
+    def verificar_votou(self, enquete_id, user_voting_id):
+        return bool(self.kv.sismember(self._k("enquete", enquete_id, "votantes"), user_voting_id))
+
+    def carregar_votantes(self):
+        return [
+            (int(enquete_id), user_voting_id)
+            for enquete_id in self.kv.hgetall(self._k("salas")).values()
+            for user_voting_id in self.kv.smembers(self._k("enquete", enquete_id, "votantes"))
+        ]
+
+    def _baldes(self, campos):
+        baldes = []
+        for campo, contagem in campos.items():
+            balde, opcao_indice = campo.split(":")
+            baldes.append((int(balde), int(opcao_indice), int(contagem)))
+        return sorted(baldes)
+
+    def carregar_taxa_votos(self, enquete_id):
+        return self._baldes(self.kv.hgetall(self._k("enquete", enquete_id, "baldes")))
+
+    def _gravar_historico(
+        self, destino, id_historico, sala, pergunta, opcoes_lista, votos_lista, total_votos_final, baldes
+    ):
+        # destino: o próprio kv ou um pipeline já em MULTI
+        ts_ms = agora_ms()
+        destino.set(
+            self._k("historico", id_historico),
+            json.dumps(
+                {
+                    "id": id_historico,
+                    "sala": sala,
+                    "pergunta": pergunta,
+                    "opcoes": opcoes_lista,
+                    "votos": votos_lista,
+                    "total_votos": total_votos_final,
+                    "ts_ms": ts_ms,
+                    "data_br": format_timestamp_br(ts_ms),
+                    "data_br_curta": format_timestamp_br_short(ts_ms),
+                    "baldes": baldes,
+                }
+            ),
+        )
+        destino.zadd(self._k("sala", sala, "historico"), {id_historico: id_historico})
+        for termo in set(termos_busca(pergunta) + termos_busca(" ".join(opcoes_lista))):
+            destino.sadd(self._k("sala", sala, "termo", termo), id_historico)
+
+    def adicionar_ao_historico(self, enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final):
+        with self.escrita():
+            sala = self.kv.hget(self._k("enquete", enquete_id), "sala")
+            if sala is None:
+                return False
+            self._gravar_historico(
+                self.kv,
+                self.kv.incr(self._k("seq", "historico")),
+                sala,
+                pergunta,
+                opcoes_lista,
+                votos_lista,
+                total_votos_final,
+                self.carregar_taxa_votos(enquete_id),
+            )
+            self._gravou()
+            get_cache_historico().invalidar_lista(enquete_id)
+            get_cache_estado().invalidar(enquete_id)
+            return True
+
+    def _itens_historico(self, ids):
+        itens = []
+        for id_historico in ids:
+            item = self.carregar_enquete_historico(id_historico)
+            if item:
+                itens.append(
+                    {
+                        "id": int(id_historico),
+                        "pergunta": item["pergunta"],
+                        "ts_ms": item["ts_ms"],
+                        "data_br_curta": item["data_br_curta"],
+                    }
+                )
+        return itens
+
+    def carregar_historico(self, enquete_id, limite, antes=None):
+        # Conjunto ordenado por id (score = id, que cresce com ts_ms)
+        sala = self.kv.hget(self._k("enquete", enquete_id), "sala")
+        if sala is None:
+            return []
+        maximo = f"({antes[1]}" if antes is not None else "+inf"
+        ids = self.kv.zrevrangebyscore(self._k("sala", sala, "historico"), maximo, "-inf", start=0, num=limite)
+        return self._itens_historico(ids)
+
+    def buscar_historico(self, enquete_id, termos, limite, antes=None):
+        # Índice invertido simples (palavra inteira -> ids), sem prefixo
+        sala = self.kv.hget(self._k("enquete", enquete_id), "sala")
+        if sala is None or not termos:
+            return []
+        ids = self.kv.sinter(*(self._k("sala", sala, "termo", termo) for termo in termos))
+        ids = sorted((int(i) for i in ids), reverse=True)
+        if antes is not None:
+            ids = [i for i in ids if i < antes[1]]
+        return self._itens_historico(ids[:limite])
+
+    def carregar_enquete_historico(self, id_historico):
+        bruto = self.kv.get(self._k("historico", id_historico))
+        if not bruto:
+            return None
+        item = json.loads(bruto)
+        item.setdefault("baldes", [])
+        if "ts_ms" not in item:
+            # Gravado antes do formato compacto, com data em texto ISO-8601
+            item["ts_ms"] = ms_de_iso(item.pop("timestamp", None))
+        if "data_br" not in item:
+            item["data_br"] = format_timestamp_br(item["ts_ms"])
+            item["data_br_curta"] = format_timestamp_br_short(item["ts_ms"])
+        return item
+
+    def exportar_historico(self, sala, apos_id, limite):
+        # Os ids do histórico são sequenciais (seq:historico): percorre a
+        # partir do cursor, um item por vez, até completar o lote
+        ultimo_id = int(self.kv.get(self._k("seq", "historico")) or 0)
+        itens = []
+        for id_historico in range(apos_id + 1, ultimo_id + 1):
+            item = self.carregar_enquete_historico(id_historico)
+            if item and (sala is None or item["sala"] == sala):
+                itens.append(item)
+                if len(itens) >= limite:
+                    break
+        return itens
+
+
+def conectar_kv(url=KV_URL):
+    # Sem KV_URL usa o substituto em processo (uma réplica só); com KV_URL
+    # conecta num Redis. redis-py é dependência opcional, importada só aqui.
+    if not url:
+        return ArmazemKVMemoria()
+    import redis
+
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+@recurso_do_processo
+def get_armazenamento():
+    if STORAGE_BACKEND == "kv":
+        return ArmazenamentoKV(conectar_kv())
+    return ArmazenamentoSQLite()
+
+
+@recurso_do_processo
+def _init_db_once():
+    return get_armazenamento().inicializar()
+
+
+# --- Fachada db_* (cache + backend) ---
+@medir
+def db_obter_enquete_id(sala, criar=False):
+    # Cada sala tem sua enquete. Sala que não existe: None, ou a cria se
+    # `criar` (só o painel do professor, já autenticado, pede isso). A sala
+    # padrão é criada na primeira visita, de qualquer tela
+    sala = normalizar_sala(sala)
+    armazenamento = get_armazenamento()
+    enquete_id = _safe_db_execute(
+        lambda: get_cache_estado().obter(None, ("sala", sala), lambda: armazenamento.buscar_enquete_id(sala)),
+        default=None,
+    )
+    if enquete_id is not None or not (criar or sala == SALA_PADRAO):
+        return enquete_id
+    return armazenamento.criar_enquete(sala)
+
+
+@medir
+def db_adicionar_ao_historico(enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final):
+    if not pergunta or not opcoes_lista:
+        return
+    get_armazenamento().adicionar_ao_historico(enquete_id, pergunta, opcoes_lista, votos_lista, total_votos_final)
+
+
+@medir
+def db_carregar_historico(enquete_id, limite=HISTORICO_PAGE_SIZE, antes=None, busca=""):
+    # Uma página do histórico da sala, do mais novo para o mais antigo. O
+    # cursor `antes` é o (ts_ms, id) do último item da página anterior.
+    # Páginas vêm do CacheHistorico; a checagem de mudanças externas do
+    # CacheEstado invalida a lista se outro processo arquivou na sala.
+    termos = termos_busca(busca)
+    armazenamento = get_armazenamento()
+
+    def carregar():
+        if termos:
+            itens = armazenamento.buscar_historico(enquete_id, termos, limite, antes)
+        else:
+            itens = armazenamento.carregar_historico(enquete_id, limite, antes)
+        pagina = [dict(item) for item in itens]
+        for item in pagina:
+            # Linhas gravadas antes da migração 5 ou por carga em massa
+            if not item.get("data_br_curta"):
+                item["data_br_curta"] = format_timestamp_br_short(item["ts_ms"])
+        return pagina
+
+    def ler():
+        get_cache_estado().versao()
+        return get_cache_historico().pagina(enquete_id, (limite, antes, tuple(termos)), carregar)
+
+    result = _safe_db_execute(ler, default=[])
+    return result if result is not None else []
+
+
+@medir
+def db_carregar_enquete_historico_por_id(id_historico):
+    return _safe_db_execute(lambda: get_armazenamento().carregar_enquete_historico(id_historico), default=None)
+
+
+@medir
+def db_carregar_enquete_historico_renderizada(id_historico):
+    # Enquete arquivada pronta para exibir (HTML dos resultados e série do
+    # ritmo já montados), no LRU do CacheHistorico: arquivadas não mudam.
+    def carregar():
+        dados = get_armazenamento().carregar_enquete_historico(id_historico)
+        if not dados:
+            return None
+        opcoes = dados.get("opcoes", [])
+        total_votos = dados.get("total_votos", 0)
+        tem_resultados = bool(opcoes) and total_votos > 0
+        return {
+            "pergunta": dados["pergunta"],
+            "data_br": dados["data_br"],
+            "opcoes": opcoes,
+            "total_votos": total_votos,
+            "html": html_resultados(opcoes, list(dados.get("votos", [])), total_votos) if tem_resultados else None,
+            "taxa": serie_taxa_votos(dados.get("baldes", []), opcoes) if tem_resultados else None,
+        }
+
+    return _safe_db_execute(lambda: get_cache_historico().item(id_historico, carregar), default=None)
+
+
+@medir
+def db_carregar_config_valor(chave, default=None):
+    result = _safe_db_execute(
+        lambda: get_cache_estado().obter(None, ("config", chave), lambda: get_armazenamento().carregar_config(chave)),
+        default=default,
+    )
+    return result if result is not None else default
+
+
+@medir
+def db_salvar_config_valor(chave, valor):
+    get_armazenamento().salvar_config(chave, valor)
+
+
+@medir
+def db_carregar_enquete_ativa(enquete_id):
+    result = _safe_db_execute(
+        lambda: get_cache_estado().obter(enquete_id, ("ativa",), lambda: get_armazenamento().carregar_enquete_ativa(enquete_id)),
+        default=False,
+    )
+    return bool(result)
+
+
+@medir
+def db_salvar_enquete_ativa(enquete_id, ativa):
+    get_armazenamento().salvar_enquete_ativa(enquete_id, ativa)
+
+
+@medir
+def db_carregar_dados_enquete(enquete_id):
+    return _safe_db_execute(
+        lambda: get_cache_estado().obter(enquete_id, ("definicao",), lambda: get_armazenamento().carregar_dados_enquete(enquete_id)),
+        default={"pergunta": "", "opcoes": _opcoes_padrao()},
+    )
+
+
+@medir
+def db_salvar_dados_enquete(enquete_id, pergunta, opcoes_lista):
+    get_armazenamento().salvar_dados_enquete(enquete_id, pergunta, opcoes_lista)
+
+
+@medir
+def db_limpar_votos_e_cookies(enquete_id, num_opcoes_enquete_atual):
+    num_opcoes_valido = max(MIN_OPTIONS, min(num_opcoes_enquete_atual, MAX_OPTIONS))
+    get_armazenamento().limpar_votos(enquete_id, num_opcoes_valido)
+
+
+# Transições do ciclo de vida: cada uma é uma única transação no backend
+# (arquivo da enquete em curso, nova definição/status e votos zerados)
+@medir
+def db_ativar_enquete(enquete_id, pergunta, opcoes_lista):
+    return get_armazenamento().transicionar_enquete(enquete_id, ativa=True, pergunta=pergunta, opcoes_lista=opcoes_lista)
+
+
+@medir
+def db_desativar_enquete(enquete_id):
+    return get_armazenamento().transicionar_enquete(enquete_id, ativa=False)
+
+
+@medir
+def db_arquivar_e_resetar(enquete_id):
+    # Mesma pergunta, votação recomeça do zero
+    return get_armazenamento().transicionar_enquete(enquete_id)
+
+
+@medir
+def db_carregar_resultados(enquete_id, num_opcoes_enquete_atual):
+    return _safe_db_execute(
+        lambda: get_cache_estado().obter(
+            enquete_id,
+            ("resultados", num_opcoes_enquete_atual),
+            lambda: get_armazenamento().carregar_resultados(enquete_id, num_opcoes_enquete_atual),
+        ),
+        default={"votos": [0] * num_opcoes_enquete_atual, "total_votos": 0},
+    )
+
+
+@medir
+def db_carregar_snapshot(enquete_id, user_voting_id=None):
+    # Estado completo e coerente da enquete. A parte comum a todas as sessões
+    # vem do CacheEstado com o carimbo de versão; só "ja_votou" é por sessão.
+    # Respondido pelo IndiceVotantes, vale se a versão não mudou durante a
+    # consulta (o índice muda antes da versão subir, a cada voto e reset).
+    # Se só o banco sabe, snapshot e "ja_votou" vêm juntos, numa transação.
+    vazio = {
+        "ativa": False,
+        "pergunta": "",
+        "opcoes": _opcoes_padrao(),
+        "votos": [0] * DEFAULT_NUM_OPTIONS_ON_NEW,
+        "total_votos": 0,
+    }
+    cache = get_cache_estado()
+    armazenamento = get_armazenamento()
+
+    def carregar():
+        while True:
+            versao, estado = cache.obter_versionado(
+                enquete_id, ("snapshot",), lambda: armazenamento.carregar_snapshot(enquete_id)
+            )
+            if not user_voting_id or enquete_id is None:
+                return versao, dict(estado, ja_votou=False)
+            ja_votou = get_indice_votantes().contem(enquete_id, user_voting_id)
+            if ja_votou is None:
+                return versao, armazenamento.carregar_snapshot(enquete_id, user_voting_id)
+            if cache.versao(enquete_id) == versao:
+                return versao, dict(estado, ja_votou=ja_votou)
+
+    versao, estado = _safe_db_execute(carregar, default=(None, dict(vazio, ja_votou=False)))
+    return dict(estado, versao=versao, enquete_id=enquete_id, user_voting_id=user_voting_id)
+
+
+@medir
+def db_carregar_taxa_votos(enquete_id, opcoes):
+    # Série do ritmo de votação da enquete em curso. Fica no CacheEstado, na
+    # versão da enquete: refeita uma vez por mudança, não a cada refresh.
+    return _safe_db_execute(
+        lambda: get_cache_estado().obter(
+            enquete_id,
+            ("taxa_votos", tuple(opcoes)),
+            lambda: serie_taxa_votos(get_armazenamento().carregar_taxa_votos(enquete_id), opcoes),
+        ),
+        default=None,
+    )
+
+
+@medir
+def db_registrar_voto(enquete_id, opcao_indice, user_voting_id):
+    aceito = get_armazenamento().registrar_voto(enquete_id, opcao_indice, user_voting_id)
+    if METRICS_ENABLED:
+        get_metricas().contar("enquete_votos_total", resultado="aceito" if aceito else "recusado")
+    return aceito
+
+
+@medir
+def db_registrar_votos_em_lote(votos):
+    # Grava um lote de (enquete_id, opcao_indice, user_voting_id). Retorna um
+    # bool por voto, na mesma ordem.
+    aceitos = get_armazenamento().registrar_votos_em_lote(votos)
+    if METRICS_ENABLED:
+        metricas = get_metricas()
+        num_aceitos = sum(aceitos)
+        metricas.contar("enquete_votos_total", num_aceitos, resultado="aceito")
+        metricas.contar("enquete_votos_total", len(aceitos) - num_aceitos, resultado="recusado")
+    return aceitos
+
+
+class _VotoPendente:
+    __slots__ = ("enquete_id", "opcao_indice", "user_voting_id", "evento", "aceito")
+
+    def __init__(self, enquete_id, opcao_indice, user_voting_id):
+        self.enquete_id = enquete_id
+        self.opcao_indice = opcao_indice
+        self.user_voting_id = user_voting_id
+        self.evento = threading.Event()
+        self.aceito = False
+
+
+class FilaVotos:
+    # Group commit no estilo "líder": com o escritor parado, o voto é gravado
+    # na hora (lote de 1, sem espera); enquanto um commit está em andamento,
+    # os votos que chegam se acumulam e saem juntos no próximo lote (até
+    # VOTE_BATCH_MAX). Quem vota recebe uma resposta síncrona: True (aceito),
+    # False (recusado, ou tirado da fila no timeout sem ser gravado) ou None
+    # (já estava sendo gravado quando o timeout venceu: resultado incerto,
+    # a próxima leitura do snapshot diz se entrou).
+    def __init__(self, gravar_lote, max_lote=VOTE_BATCH_MAX):
+        self._gravar_lote = gravar_lote
+        self._max_lote = max_lote
+        self._cond = threading.Condition()
+        self._pendentes = []
+        self._ids_pendentes = set()
+        self._thread = threading.Thread(target=self._loop, name="fila-votos", daemon=True)
+        # Herda o contexto do run que criou a fila: sem ele os get_* chamados
+        # na thread não acertariam o cache_resource
+        add_script_run_ctx(self._thread)
+        self._thread.start()
+
+    @medir
+    def registrar(self, enquete_id, opcao_indice, user_voting_id, timeout=VOTE_SUBMIT_TIMEOUT):
+        voto = _VotoPendente(enquete_id, opcao_indice, user_voting_id)
+        with self._cond:
+            # Deduplicação em memória: segundo clique do mesmo votante
+            # enquanto o primeiro ainda está na fila é recusado na hora
+            if (enquete_id, user_voting_id) in self._ids_pendentes:
+                return False
+            self._ids_pendentes.add((enquete_id, user_voting_id))
+            self._pendentes.append(voto)
+            self._cond.notify()
+        if voto.evento.wait(timeout):
+            return voto.aceito
+        with self._cond:
+            # Ainda na fila: sai dela e é recusado de verdade
+            if voto in self._pendentes:
+                self._pendentes.remove(voto)
+                self._ids_pendentes.discard((enquete_id, user_voting_id))
+                return False
+        # Já no lote em gravação: o commit ainda pode ter entrado
+        return voto.aceito if voto.evento.is_set() else None
+
+    def _proximo_lote(self):
+        with self._cond:
+            while not self._pendentes:
+                self._cond.wait()
+            lote = self._pendentes[: self._max_lote]
+            del self._pendentes[: self._max_lote]
+            return lote
+
+    def _apurar_lote(self, lote):
+        votos = [(v.enquete_id, v.opcao_indice, v.user_voting_id) for v in lote]
+        try:
+            return self._gravar_lote(votos)
+        except Exception:
+            # Sem saber se o commit aconteceu (a falha pode ser depois dele),
+            # confere no banco cada voto: o escritor faz rollback de qualquer
+            # transação aberta ao sair, então o que não está lá não entrou
+            logging.getLogger(__name__).exception("Falha ao gravar lote de %d votos", len(lote))
+            try:
+                armazenamento = get_armazenamento()
+                return [armazenamento.verificar_votou(e, u) for e, _, u in votos]
+            except Exception:
+                logging.getLogger(__name__).exception("Falha ao conferir o lote de votos no banco")
+                return [None] * len(lote)
+
+    def _loop(self):
+        while True:
+            lote = self._proximo_lote()
+            aceitos = self._apurar_lote(lote)
+            with self._cond:
+                for voto in lote:
+                    self._ids_pendentes.discard((voto.enquete_id, voto.user_voting_id))
+            for voto, aceito in zip(lote, aceitos):
+                voto.aceito = aceito
+                voto.evento.set()
+
+
+@recurso_do_processo
+def get_fila_votos():
+    return FilaVotos(db_registrar_votos_em_lote)
+
+
+class PurgaEpocas:
+    # Limpeza de baixa prioridade das épocas encerradas: acordada a cada
+    # reset (e uma vez na partida, para sobras de antes de um reinício),
+    # apaga lotes de EPOCH_PURGE_BATCH_ROWS linhas, cada um numa transação
+    # curta, com uma pausa entre eles para os votos passarem na frente no
+    # lock do escritor.
+    def __init__(self, lote=EPOCH_PURGE_BATCH_ROWS, pausa=EPOCH_PURGE_PAUSE_SECONDS):
+        self.lote = lote
+        self.pausa = pausa
+        self._pendente = threading.Event()
+        self._pendente.set()
+        self._thread = threading.Thread(target=self._loop, name="purga-epocas", daemon=True)
+        add_script_run_ctx(self._thread)
+        self._thread.start()
+
+    def agendar(self):
+        self._pendente.set()
+
+    def _loop(self):
+        while True:
+            self._pendente.wait()
+            self._pendente.clear()
+            try:
+                while (apagadas := get_armazenamento().purgar_epocas(self.lote)) > 0:
+                    if METRICS_ENABLED:
+                        get_metricas().contar("enquete_purga_linhas_total", apagadas)
+                    time.sleep(self.pausa)
+            except sqlite3.Error:
+                # Banco ocupado: tenta de novo no próximo reset
+                pass
+
+
+@recurso_do_processo
+def get_purga_epocas():
+    return PurgaEpocas()
+
+
+class FiltroBloom:
+    # Bitset com k hashes derivados de um blake2b (double hashing). Sem falso
+    # negativo; falso positivo ~taxa_fp até `capacidade` itens.
+    def __init__(self, capacidade=VOTER_BLOOM_CAPACITY, taxa_fp=VOTER_BLOOM_FP_RATE):
+        self.num_bits = max(8, int(-capacidade * math.log(taxa_fp) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacidade * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posicoes(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def adicionar(self, item):
+        for pos in self._posicoes(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posicoes(item))
+
+
+class IndiceVotantes:
+    # Quem já votou em cada enquete, em memória: o "esse IP já votou?" de
+    # cada rerun não toca no SQLite. Conjunto exato por padrão; com
+    # VOTER_INDEX_BLOOM=1 usa um filtro de Bloom por enquete (memória
+    # constante) e só os "talvez" são confirmados no banco. A PK de
+    # enquete_ativa_cookie_votantes continua sendo a garantia final de
+    # unicidade. As mutações acontecem sob o lock do escritor, na mesma ordem
+    # dos commits.
+    # Com vários processos no mesmo banco, um voto gravado por outro processo
+    # deixa incompleto o slot da enquete (enquete_id % SHARED_VERSION_SLOTS):
+    # ali o "não votou" passa a ser confirmado no banco, sem recarregar o
+    # índice inteiro. Sem os slots (KV, PRAGMA data_version), uma mudança
+    # externa pode ser voto ou reset de qualquer sala: o índice esvazia e
+    # tudo o que ele não viu gravar depois vai ao backend (PK no SQLite,
+    # SISMEMBER no KV), sem recarregar os votantes de todas as salas.
+    def __init__(self, usar_bloom=VOTER_INDEX_BLOOM):
+        self.usar_bloom = usar_bloom
+        self._lock = threading.Lock()
+        self._obsoleto = True
+        self._por_enquete = {}
+        self._slots_incompletos = set()
+        self._tudo_incompleto = False
+
+    def aquecer(self):
+        armazenamento = get_armazenamento()
+        with armazenamento.escrita():
+            rows = armazenamento.carregar_votantes()
+            with self._lock:
+                self._por_enquete = {}
+                for enquete_id, user_voting_id in rows:
+                    self._adicionar(enquete_id, user_voting_id)
+                self._slots_incompletos = set()
+                self._tudo_incompleto = False
+                self._obsoleto = False
+
+    def marcar_obsoleto(self):
+        # Outro processo/réplica gravou: recarrega no próximo acesso
+        self._obsoleto = True
+
+    def mudanca_externa(self, familia=None, slot=None):
+        if familia is None or slot is None:
+            # Como um reset em todas as salas, sob o lock do escritor
+            with get_armazenamento().escrita(), self._lock:
+                self._por_enquete = {}
+                self._tudo_incompleto = True
+        elif familia == "estado":
+            with self._lock:
+                self._slots_incompletos.add(slot)
+        elif familia == "votantes":
+            # Reset em outro processo. Sob o lock do escritor: um voto local
+            # commitado antes do reset entra no índice antes de ser apagado
+            with get_armazenamento().escrita(), self._lock:
+                for enquete_id in [e for e in self._por_enquete if e % SHARED_VERSION_SLOTS == slot]:
+                    del self._por_enquete[enquete_id]
+                self._slots_incompletos.add(slot)
+
+    def _adicionar(self, enquete_id, user_voting_id):
+        membros = self._por_enquete.get(enquete_id)
+        if membros is None:
+            membros = self._por_enquete[enquete_id] = FiltroBloom() if self.usar_bloom else set()
+        if self.usar_bloom:
+            membros.adicionar(user_voting_id)
+        else:
+            membros.add(user_voting_id)
+
+    def adicionar(self, enquete_id, user_voting_id):
+        with self._lock:
+            self._adicionar(enquete_id, user_voting_id)
+
+    def limpar(self, enquete_id):
+        with self._lock:
+            self._por_enquete.pop(enquete_id, None)
+        versoes = get_armazenamento().versoes_compartilhadas()
+        if versoes is not None:
+            versoes.incrementar("votantes", enquete_id)
+
+    def contem(self, enquete_id, user_voting_id):
+        # True/False definitivos, ou None quando só o banco pode responder
+        if self._obsoleto:
+            self.aquecer()
+        with self._lock:
+            membros = self._por_enquete.get(enquete_id)
+            if membros is None or user_voting_id not in membros:
+                incompleto = self._tudo_incompleto or enquete_id % SHARED_VERSION_SLOTS in self._slots_incompletos
+                return None if incompleto else False
+            return None if self.usar_bloom else True
+
+
+@recurso_do_processo
+def get_indice_votantes():
+    indice = IndiceVotantes()
+    get_cache_estado().ouvintes_mudanca_externa.append(indice.mudanca_externa)
+    return indice
+
+
+@medir
+def db_verificar_se_cookie_votou(enquete_id, user_voting_id):
+    if not user_voting_id or enquete_id is None:
+        return False
+    indice = get_indice_votantes()
+    em_memoria = indice.contem(enquete_id, user_voting_id)
+    if em_memoria is not None:
+        return em_memoria
+    # "Talvez" do Bloom ou slot com votos de outro processo: uma consulta
+    # pela chave primária, sem guardar a resposta por votante
+    result = _safe_db_execute(lambda: get_armazenamento().verificar_votou(enquete_id, user_voting_id), default=False)
+    return bool(result)
+
+
+# --- Exportação (CSV / Parquet) ---
+# Pipeline de geradores: lotes de EXPORT_CHUNK_ROWS itens lidos por cursor de
+# id -> linhas do conjunto escolhido -> escritor incremental. A memória fica
+# em ~um lote, qualquer que seja o tamanho do histórico.
+EXPORT_CONJUNTOS = {
+    "historico": {"id": int, "sala": str, "timestamp": str, "pergunta": str, "opcoes": str, "votos": str, "total_votos": int},
+    "ritmo": {"historico_id": int, "sala": str, "segundo": str, "opcao_indice": int, "opcao": str, "votos": int},
+}
+EXPORT_FORMATOS = {"csv": ".csv", "parquet": ".parquet"}
+
+
+def lotes_historico(sala=None, tamanho_lote=EXPORT_CHUNK_ROWS):
+    armazenamento = get_armazenamento()
+    apos_id = 0
+    while True:
+        lote = armazenamento.exportar_historico(sala, apos_id, tamanho_lote)
+        if not lote:
+            return
+        yield lote
+        apos_id = lote[-1]["id"]
+
+
+def _linhas_historico(lotes):
+    # Opções e votos seguem como JSON, uma enquete por linha
+    for lote in lotes:
+        yield [
+            {
+                "id": item["id"],
+                "sala": item["sala"],
+                "timestamp": iso_de_ms(item["ts_ms"]),
+                "pergunta": item["pergunta"],
+                "opcoes": json.dumps(item["opcoes"], ensure_ascii=False),
+                "votos": json.dumps(item["votos"]),
+                "total_votos": item["total_votos"],
+            }
+            for item in lote
+        ]
+
+
+def _linhas_ritmo(lotes):
+    # Baldes de votos por segundo arquivados com cada enquete
+    for lote in lotes:
+        linhas = [
+            {
+                "historico_id": item["id"],
+                "sala": item["sala"],
+                "segundo": datetime.fromtimestamp(balde, UTC_TZ).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "opcao_indice": opcao_indice,
+                "opcao": item["opcoes"][opcao_indice] if 0 <= opcao_indice < len(item["opcoes"]) else "",
+                "votos": contagem,
+            }
+            for item in lote
+            for balde, opcao_indice, contagem in item.get("baldes", [])
+        ]
+        if linhas:
+            yield linhas
+
+
+def _escrever_csv(lotes, colunas, arquivo):
+    escritor = csv.DictWriter(arquivo, fieldnames=list(colunas))
+    escritor.writeheader()
+    n = 0
+    for linhas in lotes:
+        escritor.writerows(linhas)
+        n += len(linhas)
+    return n
+
+
+def _escrever_parquet(lotes, colunas, destino):
+    # Um row group por lote. pyarrow já vem com o Streamlit; importado só aqui.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = pa.schema([(coluna, pa.int64() if tipo is int else pa.string()) for coluna, tipo in colunas.items()])
+    n = 0
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for linhas in lotes:
+            escritor.write_table(pa.Table.from_pylist(linhas, schema=esquema))
+            n += len(linhas)
+    return n
+
+
+def exportar(conjunto, formato, destino, sala=None, tamanho_lote=EXPORT_CHUNK_ROWS):
+    # Grava o conjunto ("historico" ou "ritmo") em destino (caminho ou, no
+    # CSV, um arquivo texto já aberto). Retorna o número de linhas.
+    lotes = lotes_historico(sala, tamanho_lote)
+    linhas = _linhas_historico(lotes) if conjunto == "historico" else _linhas_ritmo(lotes)
+    colunas = EXPORT_CONJUNTOS[conjunto]
+    if formato == "parquet":
+        return _escrever_parquet(linhas, colunas, destino)
+    if not isinstance(destino, str):
+        return _escrever_csv(linhas, colunas, destino)
+    with open(destino, "w", newline="", encoding="utf-8") as arquivo:
+        return _escrever_csv(linhas, colunas, arquivo)
+
+
+def _limpar_exportacoes_antigas(ttl=EXPORT_TTL_SECONDS):
+    # Apaga as exportações com mais de `ttl` segundos e devolve quanto falta
+    # para a próxima expirar (None se não sobrou nenhuma)
+    agora = time.time()
+    proxima = None
     try:
-        return fn()
-    except sqlite3.OperationalError:
-        time.sleep(0.1)
+        nomes = os.listdir(EXPORT_DIR)
+    except OSError:
+        return None
+    for nome in nomes:
+        caminho = os.path.join(EXPORT_DIR, nome)
         try:
-            return fn()
-        except sqlite3.OperationalError as e:
-            st.error(f"Erro de acesso ao banco de dados: {e}")
-            return default
+            restante = os.path.getmtime(caminho) + ttl - agora
+            if restante <= 0:
+                os.remove(caminho)
+            elif proxima is None or restante < proxima:
+                proxima = restante
+        except OSError:
+            pass
+    return proxima
 
 
-# --- Banco de Dados ---
-@st.cache_resource
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME, timeout=15, check_same_thread=False)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA busy_timeout=5000;")
-    conn.row_factory = sqlite3.Row
-    return conn
+class LimpezaExportacoes:
+    # O servidor estático do Streamlit entrega qualquer arquivo da pasta sem
+    # login: o prazo do link é garantido apagando o arquivo. A thread varre a
+    # pasta na partida, dorme até a próxima expiração e é acordada a cada
+    # exportação nova.
+    def __init__(self, ttl=EXPORT_TTL_SECONDS):
+        self.ttl = ttl
+        self._nova = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="limpeza-exportacoes", daemon=True)
+        add_script_run_ctx(self._thread)
+        self._thread.start()
 
+    def agendar(self):
+        self._nova.set()
 
-@st.cache_resource
-def _init_db_once():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS configuracao (
-        chave TEXT PRIMARY KEY,
-        valor TEXT
-    )
-    """)
-    admin_password_hash = hash_password("admin123")
-    cursor.execute(
-        "INSERT OR IGNORE INTO configuracao (chave, valor) VALUES (?, ?)",
-        ("senha_professor", admin_password_hash),
-    )
-    cursor.execute(
-        "INSERT OR IGNORE INTO configuracao (chave, valor) VALUES (?, ?)",
-        ("enquete_ativa", "0"),
-    )
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS enquete_ativa_definicao (
-        id INTEGER PRIMARY KEY CHECK (id = 1),
-        pergunta TEXT,
-        opcoes_json TEXT
-    )
-    """)
-    default_opcoes_json = json.dumps([""] * DEFAULT_NUM_OPTIONS_ON_NEW)
-    cursor.execute(
-        "INSERT OR IGNORE INTO enquete_ativa_definicao (id, pergunta, opcoes_json) VALUES (1, ?, ?)",
-        ("", default_opcoes_json),
-    )
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS enquete_ativa_votos (
-        opcao_indice INTEGER PRIMARY KEY,
-        contagem INTEGER DEFAULT 0
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS enquete_ativa_cookie_votantes (
-        user_voting_id TEXT PRIMARY KEY,
-        vote_timestamp TEXT
-    )
-    """)
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS historico_enquetes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'NOW')),
-        pergunta TEXT NOT NULL,
-        opcoes_json TEXT NOT NULL,
-        votos_json TEXT NOT NULL,
-        total_votos INTEGER DEFAULT 0
-    )
-    """)
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_historico_timestamp ON historico_enquetes (timestamp DESC);")
-    conn.commit()
-    return True
+    def _loop(self):
+        while True:
+            proxima = _limpar_exportacoes_antigas(self.ttl)
+            self._nova.wait(None if proxima is None else proxima + 0.05)
+            self._nova.clear()
 
 
-def db_adicionar_ao_historico(pergunta, opcoes_lista, votos_lista, total_votos_final):
-    if not pergunta or not opcoes_lista:
-        return
-    conn = get_db_connection()
-    try:
-        conn.execute(
-            "INSERT INTO historico_enquetes (pergunta, opcoes_json, votos_json, total_votos) VALUES (?, ?, ?, ?)",
-            (pergunta, json.dumps(opcoes_lista), json.dumps(votos_lista), total_votos_final),
-        )
-        conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Erro ao salvar enquete no histórico: {e}")
-        return
-    _db_manter_limite_historico()
+@recurso_do_processo
+def get_limpeza_exportacoes():
+    return LimpezaExportacoes()
 
 
-def _db_manter_limite_historico(limite=HISTORICO_LIMIT):
-    conn = get_db_connection()
+def gerar_exportacao(conjunto, formato, sala=None):
+    # Grava em static/exportacoes (servido do disco pelo Streamlit com
+    # server.enableStaticServing), com nome imprevisível. O download sai do
+    # arquivo, sem passar o conteúdo pela memória do app.
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    nome = f"{conjunto}-{sala or 'todas'}-{datetime.now(UTC_TZ).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex}{EXPORT_FORMATOS[formato]}"
+    caminho = os.path.join(EXPORT_DIR, nome)
+    temporario = caminho + ".parcial"
     try:
-        row = conn.execute("SELECT COUNT(*) as count FROM historico_enquetes").fetchone()
-        if row and row["count"] > limite:
-            num_to_delete = row["count"] - limite
-            conn.execute(
-                """DELETE FROM historico_enquetes WHERE id IN (
-                    SELECT id FROM historico_enquetes ORDER BY timestamp ASC, id ASC LIMIT ?
-                )""",
-                (num_to_delete,),
-            )
-            conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Erro ao manter limite do histórico: {e}")
-
-
-def db_carregar_historico(limite=HISTORICO_LIMIT):
-    def _query():
-        conn = get_db_connection()
-        return conn.execute(
-            "SELECT id, pergunta, timestamp FROM historico_enquetes ORDER BY timestamp DESC, id DESC LIMIT ?",
-            (limite,),
-        ).fetchall()
-    result = _safe_db_execute(_query, default=[])
-    return result if result is not None else []
+        linhas = exportar(conjunto, formato, temporario, sala)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    get_limpeza_exportacoes().agendar()
+    return {"nome": nome, "url": f"app/static/exportacoes/{nome}", "linhas": linhas, "bytes": os.path.getsize(caminho)}
 
 
-def db_carregar_enquete_historico_por_id(id_historico):
-    def _query():
-        conn = get_db_connection()
-        row = conn.execute(
-            "SELECT pergunta, opcoes_json, votos_json, total_votos, timestamp FROM historico_enquetes WHERE id = ?",
-            (id_historico,),
-        ).fetchone()
-        if row:
+# --- Medição do payload por rerun ---
+class MedidorPayload:
+    # Bytes (ForwardMsg serializadas) e elementos novos enviados ao navegador
+    # por rerun, agregados por rótulo: o run completo (app_router) e cada
+    # fragmento ao vivo. Base para acompanhar o orçamento de payload.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_rotulo = {}
+
+    def registrar(self, rotulo, n_bytes, elementos):
+        with self._lock:
+            m = self._por_rotulo.setdefault(rotulo, {"reruns": 0, "bytes": 0, "elementos": 0, "max_bytes": 0})
+            m["reruns"] += 1
+            m["bytes"] += n_bytes
+            m["elementos"] += elementos
+            m["max_bytes"] = max(m["max_bytes"], n_bytes)
+
+    def resumo(self):
+        with self._lock:
             return {
-                "pergunta": row["pergunta"],
-                "opcoes": json.loads(row["opcoes_json"]),
-                "votos": json.loads(row["votos_json"]),
-                "total_votos": row["total_votos"],
-                "timestamp": row["timestamp"],
+                rotulo: dict(m, bytes_por_rerun=m["bytes"] / m["reruns"], elementos_por_rerun=m["elementos"] / m["reruns"])
+                for rotulo, m in self._por_rotulo.items()
             }
-        return None
-    return _safe_db_execute(_query, default=None)
 
 
-def db_carregar_config_valor(chave, default=None):
-    def _query():
-        conn = get_db_connection()
-        row = conn.execute("SELECT valor FROM configuracao WHERE chave = ?", (chave,)).fetchone()
-        if row:
-            if chave == "enquete_ativa":
-                return row["valor"] == "1"
-            return row["valor"]
-        return default
-    result = _safe_db_execute(_query, default=default)
-    return result if result is not None else default
+@recurso_do_processo
+def get_medidor_payload():
+    return MedidorPayload()
 
 
-def db_salvar_config_valor(chave, valor):
-    conn = get_db_connection()
-    valor_db = "1" if (chave == "enquete_ativa" and valor) else ("0" if chave == "enquete_ativa" else valor)
-    try:
-        conn.execute("REPLACE INTO configuracao (chave, valor) VALUES (?, ?)", (chave, valor_db))
-        conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Erro ao salvar configuração: {e}")
+def _instalar_contador_payload(ctx):
+    # Envolve a fila de saída da sessão uma vez; cada medição ativa (run
+    # completo e fragmentos aninhados) soma o que passar por ela
+    contadores = ctx.__dict__.get("_contadores_payload")
+    if contadores is None:
+        contadores = ctx.__dict__["_contadores_payload"] = []
+        enfileirar = ctx._enqueue
 
+        def enfileirar_medindo(msg):
+            n_bytes = msg.ByteSize()
+            elemento = msg.HasField("delta") and msg.delta.HasField("new_element")
+            for contador in contadores:
+                contador[0] += n_bytes
+                contador[1] += elemento
+            enfileirar(msg)
 
-def db_carregar_dados_enquete():
-    def _query():
-        conn = get_db_connection()
-        row = conn.execute("SELECT pergunta, opcoes_json FROM enquete_ativa_definicao WHERE id = 1").fetchone()
-        if row and row["opcoes_json"]:
-            try:
-                return {"pergunta": row["pergunta"], "opcoes": json.loads(row["opcoes_json"])}
-            except json.JSONDecodeError:
-                pass
-        return {"pergunta": "", "opcoes": [""] * DEFAULT_NUM_OPTIONS_ON_NEW}
-    result = _safe_db_execute(_query, default={"pergunta": "", "opcoes": [""] * DEFAULT_NUM_OPTIONS_ON_NEW})
-    return result
+        ctx._enqueue = enfileirar_medindo
+    return contadores
 
 
-def db_salvar_dados_enquete(pergunta, opcoes_lista):
-    conn = get_db_connection()
-    try:
-        conn.execute(
-            "REPLACE INTO enquete_ativa_definicao (id, pergunta, opcoes_json) VALUES (1, ?, ?)",
-            (pergunta, json.dumps(opcoes_lista)),
-        )
-        conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Erro ao salvar enquete: {e}")
+def medir_payload(fn):
+    # Hook de medição: com PAYLOAD_METRICS=1 registra no MedidorPayload (e
+    # no stderr) o que cada chamada de fn enviou. Desligado, devolve a
+    # própria fn: custo zero.
+    if not PAYLOAD_METRICS:
+        return fn
 
+    @functools.wraps(fn)
+    def medido(*args, **kwargs):
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return fn(*args, **kwargs)
+        contadores = _instalar_contador_payload(ctx)
+        contador = [0, 0]
+        contadores.append(contador)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            contadores.remove(contador)
+            get_medidor_payload().registrar(fn.__name__, *contador)
+            print(f"[payload] {fn.__name__}: {contador[0]} bytes, {contador[1]} elementos", file=sys.stderr)
 
-def db_limpar_votos_e_cookies(num_opcoes_enquete_atual):
-    conn = get_db_connection()
-    try:
-        conn.execute("DELETE FROM enquete_ativa_votos")
-        conn.execute("DELETE FROM enquete_ativa_cookie_votantes")
-        num_opcoes_valido = max(MIN_OPTIONS, min(num_opcoes_enquete_atual, MAX_OPTIONS))
-        for i in range(num_opcoes_valido):
-            conn.execute("INSERT INTO enquete_ativa_votos (opcao_indice, contagem) VALUES (?, 0)", (i,))
-        conn.commit()
-    except sqlite3.Error as e:
-        st.error(f"Erro ao limpar votos: {e}")
-
-
-def db_carregar_resultados(num_opcoes_enquete_atual):
-    def _query():
-        conn = get_db_connection()
-        votos_rows = conn.execute(
-            "SELECT opcao_indice, contagem FROM enquete_ativa_votos ORDER BY opcao_indice ASC"
-        ).fetchall()
-        total_row = conn.execute("SELECT SUM(contagem) as total_votos FROM enquete_ativa_votos").fetchone()
-        total_votos = total_row["total_votos"] if total_row and total_row["total_votos"] is not None else 0
-        votos_lista = [0] * num_opcoes_enquete_atual
-        for row in votos_rows:
-            if 0 <= row["opcao_indice"] < num_opcoes_enquete_atual:
-                votos_lista[row["opcao_indice"]] = row["contagem"]
-        return {"votos": votos_lista, "total_votos": total_votos}
-    result = _safe_db_execute(_query, default={"votos": [0] * num_opcoes_enquete_atual, "total_votos": 0})
-    return result
-
-
-def db_registrar_voto(opcao_indice, user_voting_id):
-    conn = get_db_connection()
-    try:
-        vote_ts = datetime.now(UTC_TZ).isoformat()
-        conn.execute(
-            "INSERT INTO enquete_ativa_cookie_votantes (user_voting_id, vote_timestamp) VALUES (?, ?)",
-            (user_voting_id, vote_ts),
-        )
-        cursor = conn.execute(
-            "UPDATE enquete_ativa_votos SET contagem = contagem + 1 WHERE opcao_indice = ?",
-            (opcao_indice,),
-        )
-        if cursor.rowcount == 0:
-            conn.rollback()
-            return False
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        conn.rollback()
-        return False
-    except sqlite3.Error:
-        conn.rollback()
-        return False
+    return medido
 
 
-def db_verificar_se_cookie_votou(user_voting_id):
-    if not user_voting_id:
-        return False
+# --- Senhas (hash fora da thread do script) ---
+class PoolSenhas:
+    # PBKDF2/scrypt custam ~100 ms de CPU por tentativa. Rodam num pool de
+    # PASSWORD_HASH_WORKERS threads, não na thread do script: o hashlib solta
+    # o GIL, e uma rajada de logins ocupa no máximo esse número de núcleos.
+    # Com PASSWORD_HASH_QUEUE pedidos já em andamento, o próximo é recusado
+    # na hora em vez de entrar numa fila sem fim. O script não espera o hash:
+    # guarda o Future e um fragmento confere a cada PASSWORD_POLL_SECONDS.
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, fila=PASSWORD_HASH_QUEUE):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="senhas")
+        self._vagas = threading.BoundedSemaphore(fila)
 
-    def _query():
-        conn = get_db_connection()
-        row = conn.execute(
-            "SELECT 1 FROM enquete_ativa_cookie_votantes WHERE user_voting_id = ?",
-            (user_voting_id,),
-        ).fetchone()
-        return row is not None
-    result = _safe_db_execute(_query, default=False)
-    return bool(result)
+    def submeter(self, fn, *args):
+        # Future de fn(*args), ou None se o pool estiver lotado. A vaga volta
+        # quando o hash termina, mesmo que ninguém leia o resultado
+        if not self._vagas.acquire(blocking=False):
+            return None
+        try:
+            futuro = self._executor.submit(fn, *args)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        return futuro
+
+
+@recurso_do_processo
+def get_pool_senhas():
+    return PoolSenhas()
+
+
+class LimitadorTentativas:
+    # Janela deslizante de LOGIN_WINDOW_SECONDS por chave (o IP público visto
+    # pelo servidor ou a sessão, nunca um valor informado pelo navegador;
+    # ver chave_limite_login). Consultado antes de
+    # qualquer hash: quem passou de LOGIN_MAX_ATTEMPTS não gasta CPU. Por
+    # processo; o limite do PoolSenhas vale para todas as chaves juntas.
+    def __init__(self, maximo=LOGIN_MAX_ATTEMPTS, janela=LOGIN_WINDOW_SECONDS):
+        self.maximo = maximo
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._tentativas = {}
+
+    def reservar(self, chave):
+        # Conta uma tentativa e devolve 0, ou os segundos até a próxima ser aceita
+        agora = time.monotonic()
+        with self._lock:
+            if len(self._tentativas) > 4096:
+                # Esquece as chaves sem tentativa dentro da janela
+                for antiga in [c for c, t in self._tentativas.items() if t[-1] <= agora - self.janela]:
+                    del self._tentativas[antiga]
+            tentativas = self._tentativas.setdefault(chave, deque())
+            while tentativas and tentativas[0] <= agora - self.janela:
+                tentativas.popleft()
+            if len(tentativas) >= self.maximo:
+                return tentativas[0] + self.janela - agora
+            tentativas.append(agora)
+            return 0
+
+    def limpar(self, chave):
+        with self._lock:
+            self._tentativas.pop(chave, None)
+
+
+@recurso_do_processo
+def get_limitador_login():
+    return LimitadorTentativas()
+
+
+def _verificar_e_renovar(senha, armazenado):
+    # Roda no PoolSenhas: confere a senha e, se o hash gravado usa outro
+    # KDF/custo, já devolve o novo (o custo do hash extra fica no pool)
+    if not verificar_senha(senha, armazenado):
+        return False, None
+    return True, (hash_password(senha) if hash_senha_desatualizado(armazenado) else None)
+
+
+def chave_limite_login():
+    # Cota por IP só com um IP público visto pelo servidor. Sem TRUSTED_PROXIES
+    # atrás de um proxy (Streamlit Cloud), o par é o proxy, com um endereço
+    # privado: uma chave única deixaria qualquer aluno travar o login do
+    # professor, então a cota passa a ser da sessão. Fora de um run, todos
+    # dividem uma chave só.
+    ip = ip_visto_pelo_servidor()
+    if _ip_normalizado(ip, so_publico=True):
+        return f"ip-{ip}"
+    ctx = get_script_run_ctx()
+    return f"sessao-{ctx.session_id}" if ctx is not None else "sem-conexao"
+
+
+def _contar_login(resultado):
+    if METRICS_ENABLED:
+        get_metricas().contar("enquete_login_total", resultado=resultado)
+
+
+def iniciar_login(senha, chave):
+    # ("pendente", Future) com o hash já no PoolSenhas, ou o resultado final:
+    # ("limitado", segundos de espera), ("ocupado", 0), ("senha_incorreta", 0)
+    espera = get_limitador_login().reservar(chave)
+    if espera:
+        resultado = ("limitado", espera)
+    elif not (armazenado := db_carregar_config_valor("senha_professor")):
+        resultado = ("senha_incorreta", 0)
+    elif (futuro := get_pool_senhas().submeter(_verificar_e_renovar, senha, armazenado)) is None:
+        resultado = ("ocupado", 0)
+    else:
+        return ("pendente", futuro)
+    _contar_login(resultado[0])
+    return resultado
+
+
+def concluir_login(futuro, chave):
+    # Resultado de um login "pendente" cujo hash terminou: "ok" ou "senha_incorreta"
+    verificado, novo_hash = futuro.result()
+    if verificado:
+        get_limitador_login().limpar(chave)
+        if novo_hash:
+            db_salvar_config_valor("senha_professor", novo_hash)
+    resultado = "ok" if verificado else "senha_incorreta"
+    _contar_login(resultado)
+    return resultado
+
+
+@st.experimental_fragment(run_every=PASSWORD_POLL_SECONDS)
+def _fragmento_hash_pendente(chave_estado, mensagem, concluir):
+    # Hash em andamento no PoolSenhas: o run do script termina na hora e este
+    # fragmento confere o Future; pronto, conclui e refaz a página inteira
+    futuro = st.session_state.get(chave_estado)
+    if futuro is not None and not futuro.done():
+        st.info(mensagem)
+        return
+    st.session_state.pop(chave_estado, None)
+    if futuro is not None:
+        concluir(futuro)
+    st.rerun()
 
 
 # --- Session State ---
@@ -447,28 +3555,54 @@ def initialize_session_state():
 
 
 # --- Telas ---
+def _concluir_login_pendente(futuro):
+    resultado = concluir_login(futuro, st.session_state.pop("login_chave", None))
+    if resultado == "ok":
+        st.session_state.modo = "professor"
+        st.session_state.pagina_professor = "painel"
+    else:
+        st.session_state.login_resultado = (resultado, 0)
+
+
 def mostrar_tela_login():
     st.title("🔐 Login do Professor")
+    if st.session_state.get("login_pendente") is not None:
+        _fragmento_hash_pendente("login_pendente", "Verificando a senha...", _concluir_login_pendente)
+        return
     senha_digitada = st.text_input("Senha", type="password", key="login_senha_vfinal")
+    resultado, espera = st.session_state.pop("login_resultado", (None, 0))
     if st.button("Entrar", key="login_entrar_vfinal"):
-        senha_hash_db = db_carregar_config_valor("senha_professor")
-        if senha_hash_db and hmac.compare_digest(hash_password(senha_digitada), senha_hash_db):
-            st.session_state.modo = "professor"
-            st.session_state.pagina_professor = "painel"
-            st.success("Login realizado com sucesso!")
+        chave = chave_limite_login()
+        resultado, espera = iniciar_login(senha_digitada, chave)
+        if resultado == "pendente":
+            st.session_state.login_pendente = espera
+            st.session_state.login_chave = chave
             st.rerun()
-        else:
-            st.error("Senha incorreta!")
+    if resultado == "limitado":
+        st.error(f"Muitas tentativas. Tente novamente em {math.ceil(espera)} s.")
+    elif resultado == "ocupado":
+        st.error("Servidor ocupado verificando outros logins. Tente novamente em instantes.")
+    elif resultado == "senha_incorreta":
+        st.error("Senha incorreta!")
 
 
 def mostrar_painel_professor():
     st.title("🖥️ Painel do Professor")
-    col_nav1, col_nav2 = st.columns(2)
+    if aviso := st.session_state.pop("aviso_painel", None):
+        st.success(aviso)
+    # A página de métricas só existe com METRICS_ENABLED=1
+    col_nav1, *col_metricas, col_nav2 = st.columns(3 if METRICS_ENABLED else 2)
     with col_nav1:
         if st.button("🔐 Alterar Senha", key="painel_btn_alt_senha", use_container_width=True):
             st.session_state.pagina_professor = "alterar_senha"
             st.rerun()
             return
+    for col in col_metricas:
+        with col:
+            if st.button("📈 Métricas", key="painel_btn_metricas", use_container_width=True):
+                st.session_state.pagina_professor = "metricas"
+                st.rerun()
+                return
     with col_nav2:
         if st.button("🚪 Logout", key="painel_btn_logout", use_container_width=True):
             st.session_state.modo = "login_professor"
@@ -478,8 +3612,27 @@ def mostrar_painel_professor():
             return
     st.divider()
 
-    enquete_ativa_db = db_carregar_config_valor("enquete_ativa", False)
-    dados_enquete_db = db_carregar_dados_enquete()
+    enquete_id = st.session_state.enquete_id
+    st.subheader("Sala")
+    col_sala1, col_sala2 = st.columns([3, 1])
+    with col_sala1:
+        nova_sala = st.text_input(
+            "Código da sala",
+            value=st.session_state.sala,
+            key="painel_sala_codigo",
+            help="Cada sala tem sua própria enquete. Os alunos entram pelo link com ?sala=<código>.",
+        )
+    with col_sala2:
+        st.write("")
+        if st.button("Trocar", key="painel_sala_trocar", use_container_width=True):
+            st.query_params["sala"] = normalizar_sala(nova_sala)
+            st.rerun()
+            return
+    st.caption(f"Link dos alunos: `?sala={st.session_state.sala}`")
+    st.divider()
+
+    enquete_ativa_db = db_carregar_enquete_ativa(enquete_id)
+    dados_enquete_db = db_carregar_dados_enquete(enquete_id)
     opcoes_salvas = dados_enquete_db.get("opcoes", [])
     num_opcoes_atuais = len(opcoes_salvas) if opcoes_salvas else st.session_state.num_opcoes_edicao
     if "num_opcoes_edicao_loaded" not in st.session_state or st.session_state.num_opcoes_edicao_loaded != num_opcoes_atuais:
@@ -520,72 +3673,100 @@ def mostrar_painel_professor():
         submit_save_enquete = st.form_submit_button("Salvar e Ativar Enquete")
 
     if submit_save_enquete:
-        dados_enquete_anterior = db_carregar_dados_enquete()
-        enquete_estava_ativa = db_carregar_config_valor("enquete_ativa", False)
-        if enquete_estava_ativa and dados_enquete_anterior.get("pergunta", "").strip():
-            num_opcoes_anterior = len(dados_enquete_anterior.get("opcoes", []))
-            if num_opcoes_anterior >= MIN_OPTIONS:
-                resultados_anterior = db_carregar_resultados(num_opcoes_anterior)
-                db_adicionar_ao_historico(
-                    dados_enquete_anterior["pergunta"],
-                    dados_enquete_anterior["opcoes"],
-                    resultados_anterior["votos"],
-                    resultados_anterior["total_votos"],
-                )
         opcoes_finais = [opt.strip() for opt in opcoes_form_inputs[: st.session_state.num_opcoes_edicao]]
         opcoes_validas_count = sum(1 for opt in opcoes_finais if opt)
         if not pergunta_form.strip() or opcoes_validas_count < MIN_OPTIONS:
             st.error(f"A pergunta não pode ser vazia e deve haver pelo menos {MIN_OPTIONS} opções preenchidas.")
-        else:
-            db_salvar_dados_enquete(pergunta_form, opcoes_finais)
-            db_salvar_config_valor("enquete_ativa", True)
-            db_limpar_votos_e_cookies(len(opcoes_finais))
+        elif db_ativar_enquete(enquete_id, pergunta_form, opcoes_finais):
             st.success("Enquete salva, ativada e votos resetados!")
             st.rerun()
 
     if enquete_ativa_db:
-        if st.button("Desativar Enquete", key="painel_desativar_db_vfinal"):
-            dados_enquete_a_desativar = db_carregar_dados_enquete()
-            if dados_enquete_a_desativar.get("pergunta", "").strip():
-                num_opcoes_desativada = len(dados_enquete_a_desativar.get("opcoes", []))
-                if num_opcoes_desativada >= MIN_OPTIONS:
-                    resultados_desativada = db_carregar_resultados(num_opcoes_desativada)
-                    db_adicionar_ao_historico(
-                        dados_enquete_a_desativar["pergunta"],
-                        dados_enquete_a_desativar["opcoes"],
-                        resultados_desativada["votos"],
-                        resultados_desativada["total_votos"],
-                    )
-            db_salvar_config_valor("enquete_ativa", False)
-            num_opcoes_calc = len(dados_enquete_a_desativar.get("opcoes", []))
-            db_limpar_votos_e_cookies(max(MIN_OPTIONS, num_opcoes_calc))
-            st.success("Enquete desativada, resultados arquivados e votos resetados!")
-            st.rerun()
+        col_desativar, col_reiniciar = st.columns(2)
+        with col_desativar:
+            if st.button("Desativar Enquete", key="painel_desativar_db_vfinal") and db_desativar_enquete(enquete_id):
+                st.success("Enquete desativada, resultados arquivados e votos resetados!")
+                st.rerun()
+        with col_reiniciar:
+            if st.button("Arquivar e Reiniciar Votação", key="painel_reiniciar_db_vfinal") and db_arquivar_e_resetar(
+                enquete_id
+            ):
+                st.success("Resultados arquivados e votação reiniciada!")
+                st.rerun()
 
-    st.subheader("Status da Enquete")
-    enquete_ativa_status = db_carregar_config_valor("enquete_ativa", False)
+    enquete_ativa_status = db_carregar_enquete_ativa(enquete_id)
     if enquete_ativa_status:
-        st.success("Enquete ATIVA")
+        _fragmento_resultados_professor(enquete_id)
     else:
+        st.subheader("Status da Enquete")
         st.error("Enquete INATIVA")
+        st.subheader("Resultados da Votação")
+        st.info("A enquete está inativa. Ative-a para ver os resultados ou permitir novos votos.")
 
-    st.subheader("Resultados da Votação")
-    if enquete_ativa_status:
-        dados_atuais = db_carregar_dados_enquete()
-        num_opcoes_resultados = len(dados_atuais.get("opcoes", []))
-        if num_opcoes_resultados > 0:
-            resultados_display = db_carregar_resultados(num_opcoes_resultados)
-            mostrar_resultados(dados_atuais, resultados_display)
-        else:
-            st.info("A enquete ativa não possui opções configuradas.")
-        time.sleep(AUTO_REFRESH_SECONDS)
+    st.divider()
+    mostrar_exportacao()
+
+
+def mostrar_exportacao():
+    st.subheader("Exportar Dados")
+    col_exp1, col_exp2, col_exp3 = st.columns(3)
+    with col_exp1:
+        conjunto = st.selectbox(
+            "Dados",
+            list(EXPORT_CONJUNTOS),
+            format_func={"historico": "Histórico de enquetes", "ritmo": "Ritmo de votação"}.get,
+            key="painel_export_conjunto",
+        )
+    with col_exp2:
+        formato = st.selectbox("Formato", list(EXPORT_FORMATOS), format_func=str.upper, key="painel_export_formato")
+    with col_exp3:
+        todas_salas = st.checkbox("Todas as salas", key="painel_export_todas_salas")
+    if st.button("Gerar Arquivo", key="painel_export_gerar"):
+        with st.spinner("Gerando arquivo..."):
+            st.session_state.exportacao = gerar_exportacao(conjunto, formato, None if todas_salas else st.session_state.sala)
+    exportacao = st.session_state.get("exportacao")
+    if exportacao:
+        # Link direto para o arquivo estático: o navegador baixa do disco
+        st.markdown(
+            f"<a href='{exportacao['url']}' download='{exportacao['nome']}'>⬇️ Baixar {html_module.escape(exportacao['nome'])}</a>",
+            unsafe_allow_html=True,
+        )
+        st.caption(
+            f"{exportacao['linhas']} linhas, {exportacao['bytes'] / 1024:.1f} KB. "
+            f"O arquivo é apagado do servidor {EXPORT_TTL_SECONDS // 60} minutos após gerado."
+        )
+
+
+@st.experimental_fragment(run_every=LIVE_TICK_SECONDS)
+@medir_payload
+@medir
+def _fragmento_resultados_professor(enquete_id):
+    # Só esta região é re-renderizada ao vivo; o resto do painel não roda
+    snapshot = _snapshot_ao_vivo(enquete_id)
+    if not snapshot["ativa"]:
         st.rerun()
+    st.subheader("Status da Enquete")
+    st.success("Enquete ATIVA")
+    st.subheader("Resultados da Votação")
+    if snapshot["opcoes"]:
+        mostrar_resultados(snapshot, snapshot)
+        if snapshot["total_votos"]:
+            mostrar_taxa_votos(db_carregar_taxa_votos(enquete_id, snapshot["opcoes"]))
     else:
-        st.info("A enquete está inativa. Ative-a para ver os resultados ou permitir novos votos.")
+        st.info("A enquete ativa não possui opções configuradas.")
+
+
+def _concluir_troca_de_senha(futuro):
+    db_salvar_config_valor("senha_professor", futuro.result())
+    st.session_state.aviso_painel = "Senha alterada com sucesso!"
+    st.session_state.pagina_professor = "painel"
 
 
 def mostrar_tela_alterar_senha():
     st.title("🔑 Alterar Senha do Professor")
+    if st.session_state.get("senha_pendente") is not None:
+        _fragmento_hash_pendente("senha_pendente", "Gravando a nova senha...", _concluir_troca_de_senha)
+        return
     with st.form("alt_senha_frm_vfinal"):
         nova_senha = st.text_input("Nova Senha", type="password", key="alt_nova_senha_vfinal")
         confirmar = st.text_input("Confirmar Nova Senha", type="password", key="alt_confirma_vfinal")
@@ -597,10 +3778,10 @@ def mostrar_tela_alterar_senha():
                 st.error("Senhas não coincidem.")
             elif len(nova_senha) < 6:
                 st.error("Senha curta (mínimo 6 caracteres).")
+            elif (futuro := get_pool_senhas().submeter(hash_password, nova_senha)) is None:
+                st.error("Servidor ocupado. Tente novamente em instantes.")
             else:
-                db_salvar_config_valor("senha_professor", hash_password(nova_senha))
-                st.success("Senha alterada com sucesso!")
-                st.session_state.pagina_professor = "painel"
+                st.session_state.senha_pendente = futuro
                 st.rerun()
     st.divider()
     if st.button("Voltar ao Painel", key="alt_voltar_vfinal"):
@@ -608,43 +3789,75 @@ def mostrar_tela_alterar_senha():
         st.rerun()
 
 
+def mostrar_tela_metricas():
+    st.title("📈 Métricas do Processo")
+    metricas = get_metricas()
+    reruns_por_segundo = metricas.taxa("enquete_chamadas_total", funcao="app_router") + sum(
+        metricas.taxa("enquete_chamadas_total", funcao=nome)
+        for nome in ("_fragmento_resultados_professor", "_fragmento_aguardando_enquete", "_fragmento_resultados_aluno")
+    )
+    col1, col2, col3, col4 = st.columns(4)
+    sessoes = _sessoes_ativas()
+    col1.metric("Sessões ativas", "—" if sessoes is None else sessoes)
+    col2.metric("Reruns/s", f"{reruns_por_segundo:.1f}")
+    col3.metric("Votos/s", f"{metricas.taxa('enquete_votos_total', resultado='aceito'):.1f}")
+    col4.metric(
+        "Retentativas no banco",
+        metricas.total("enquete_db_retentativas_total"),
+        help=f"{metricas.total('enquete_db_falhas_total')} falharam de novo após a retentativa",
+    )
+    st.caption(f"Taxas na janela dos últimos {METRICS_RATE_WINDOW_SECONDS}s.")
+    st.subheader("Latência por função")
+    latencias = metricas.latencias()
+    if latencias:
+        st.dataframe(latencias, use_container_width=True, hide_index=True)
+    else:
+        st.info("Nenhuma chamada medida ainda.")
+    with st.expander("Snapshot Prometheus"):
+        if METRICS_FILE:
+            st.caption(f"Gravado a cada {METRICS_FILE_SECONDS}s em `{METRICS_FILE}`.")
+        st.code(metricas.texto_prometheus(), language="text")
+    st.divider()
+    col_b1, col_b2 = st.columns(2)
+    with col_b1:
+        if st.button("🔄 Atualizar", key="metricas_atualizar", use_container_width=True):
+            st.rerun()
+    with col_b2:
+        if st.button("Voltar ao Painel", key="metricas_voltar", use_container_width=True):
+            st.session_state.pagina_professor = "painel"
+            st.rerun()
+
+
 def mostrar_tela_aluno():
     if "user_voting_id" not in st.session_state or not st.session_state.user_voting_id:
         st.info("⌛ Identificador de votação da sessão sendo preparado... Por favor, aguarde um momento.")
         return
 
-    config_enquete_ativa = db_carregar_config_valor("enquete_ativa", False)
-    if not config_enquete_ativa:
+    enquete_id = st.session_state.enquete_id
+    user_id_for_vote = st.session_state.user_voting_id
+    snapshot = _snapshot_ao_vivo(enquete_id, user_id_for_vote)
+    if not snapshot["ativa"]:
         st.title("⌛ Aguardando Nova Enquete...")
         st.info("Nenhuma enquete ativa no momento. A tela atualiza automaticamente.")
-        # O rerun acontece no final do router, após o rodapé — dormir aqui
-        # deixaria um rodapé "fantasma" do run anterior visível na tela
-        st.session_state["_auto_refresh"] = True
+        _fragmento_aguardando_enquete(enquete_id, user_id_for_vote)
         return
 
-    dados_enquete_db = db_carregar_dados_enquete()
-    opcoes_enquete_lista = dados_enquete_db.get("opcoes", [])
+    opcoes_enquete_lista = snapshot["opcoes"]
     num_opcoes_atual = len(opcoes_enquete_lista)
 
-    if not dados_enquete_db.get("pergunta", "").strip() or num_opcoes_atual < MIN_OPTIONS:
+    if not snapshot["pergunta"].strip() or num_opcoes_atual < MIN_OPTIONS:
         st.title("⌛ Enquete em Configuração")
         st.info("A enquete atual ainda não está pronta. Por favor, aguarde.")
         return
 
-    resultados_db = db_carregar_resultados(num_opcoes_atual)
-
-    user_id_for_vote = st.session_state.user_voting_id
-    ja_votou_db = db_verificar_se_cookie_votou(user_id_for_vote)
-    st.session_state.voto_registrado_nesta_sessao = ja_votou_db
+    st.session_state.voto_registrado_nesta_sessao = snapshot["ja_votou"]
 
     st.title("📊 Participe da enquete")
-    st.header(dados_enquete_db.get("pergunta", "Enquete sem pergunta definida"))
+    st.header(snapshot["pergunta"] or "Enquete sem pergunta definida")
 
     if st.session_state.voto_registrado_nesta_sessao:
         st.success("🙂 Seu voto foi registrado na enquete! Por favor aguarde os demais colegas votarem...")
-        mostrar_resultados(dados_enquete_db, resultados_db)
-        # O rerun acontece no final do router, após o rodapé
-        st.session_state["_auto_refresh"] = True
+        _fragmento_resultados_aluno(enquete_id, user_id_for_vote, snapshot["pergunta"], opcoes_enquete_lista)
     else:
         opcoes_validas_aluno = [opt for opt in opcoes_enquete_lista if opt and opt.strip()]
         if not opcoes_validas_aluno:
@@ -670,7 +3883,7 @@ def mostrar_tela_aluno():
                 st.error("Falha ao verificar sua identificação. Por favor, recarregue a página.")
                 return
 
-            if db_verificar_se_cookie_votou(user_id_for_vote):
+            if db_verificar_se_cookie_votou(enquete_id, user_id_for_vote):
                 st.warning("Voto já registrado para este dispositivo/navegador.")
                 st.session_state.voto_registrado_nesta_sessao = True
                 st.rerun()
@@ -684,10 +3897,15 @@ def mostrar_tela_aluno():
                     st.error("Opção inválida. Tente novamente.")
                     return
 
-                if db_registrar_voto(indice_real, user_id_for_vote):
+                aceito = get_fila_votos().registrar(enquete_id, indice_real, user_id_for_vote)
+                if aceito:
                     st.session_state.voto_registrado_nesta_sessao = True
                     st.success("Voto registrado com sucesso!")
                     st.rerun()
+                elif aceito is None:
+                    # Gravação em andamento: o snapshot do próximo run diz se entrou
+                    st.info("Seu voto está sendo processado. A página será atualizada.")
+                    st.rerun()
                 else:
                     st.error("Erro: Voto já registrado ou opção inválida.")
                     st.session_state.voto_registrado_nesta_sessao = True
@@ -696,6 +3914,188 @@ def mostrar_tela_aluno():
                 st.warning("Selecione uma opção.")
 
 
+class AgendadorAtualizacao:
+    # Decide quando cada sessão ao vivo volta a renderizar. O tick do
+    # navegador (LIVE_TICK_SECONDS) só é fixado no run completo, então o
+    # ritmo real é a espera do lado do servidor, por sessão (estado):
+    # - sem mudança, revalida após `intervalo`, que dobra a cada ciclo
+    #   parado (AUTO_REFRESH_SECONDS até AUTO_REFRESH_MAX_SECONDS);
+    # - com mudança (votação ativa), acorda na hora, mas no máximo uma vez a
+    #   cada `espaco` (AUTO_REFRESH_MIN_SECONDS), somando os votos do meio;
+    # - com o servidor sobrecarregado (leituras do snapshot acima de
+    #   AUTO_REFRESH_OVERLOAD_MS em média, ou mais leituras em voo que o pool
+    #   de leitores), o `espaco` também dobra a cada ciclo;
+    # - os prazos levam ±AUTO_REFRESH_JITTER, e quem acorda por uma mudança
+    #   ainda espera um atraso aleatório de até AUTO_REFRESH_JITTER * espaco:
+    #   as sessões acordadas pelo mesmo voto (ou com o tick em fase, depois
+    #   de um run completo de todas) não renderizam todas no mesmo instante.
+    def __init__(self, limite_em_voo=DB_READER_POOL_SIZE):
+        self._lock = threading.Lock()
+        self._limite_em_voo = limite_em_voo
+        self._em_voo = 0
+        self._latencia_ms = 0.0
+
+    @contextmanager
+    def leitura(self):
+        with self._lock:
+            self._em_voo += 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            with self._lock:
+                self._em_voo -= 1
+                self._latencia_ms += 0.2 * (duracao_ms - self._latencia_ms)
+
+    def sobrecarregado(self):
+        return self._latencia_ms > AUTO_REFRESH_OVERLOAD_MS or self._em_voo > self._limite_em_voo
+
+    def metricas(self):
+        with self._lock:
+            return {"leituras_em_voo": self._em_voo, "latencia_media_ms": round(self._latencia_ms, 3)}
+
+    @staticmethod
+    def novo_estado():
+        return {"intervalo": AUTO_REFRESH_SECONDS, "espaco": AUTO_REFRESH_MIN_SECONDS, "ultimo": time.monotonic()}
+
+    @staticmethod
+    def _jitter(segundos):
+        return segundos * random.uniform(1 - AUTO_REFRESH_JITTER, 1 + AUTO_REFRESH_JITTER)
+
+    def aguardar(self, estado, cache, enquete_id, versao_vista, interromper=lambda: False, bloqueio_max=None):
+        # Bloqueia até a próxima renderização da sessão; True se a versão
+        # mudou. Espera em fatias de até 0,5 s para sair logo se a sessão
+        # tiver algo mais urgente (interromper). Interrompida, ou passados
+        # `bloqueio_max` segundos, devolve False sem mexer na agenda: o
+        # próximo tick continua de onde esta espera parou.
+        cedo = estado["ultimo"] + self._jitter(estado["espaco"])
+        prazo = estado["ultimo"] + self._jitter(estado["intervalo"])
+        limite = None if bloqueio_max is None else time.monotonic() + bloqueio_max
+        espalhado = False
+        while True:
+            versao = cache.versao(enquete_id)
+            mudou = versao != versao_vista
+            agora = time.monotonic()
+            if mudou and not espalhado:
+                espalhado = True
+                cedo = max(cedo, agora + random.uniform(0, AUTO_REFRESH_JITTER * estado["espaco"]))
+            if (mudou and agora >= cedo) or agora >= prazo:
+                break
+            if interromper() or (limite is not None and agora >= limite):
+                return False
+            fatia = 0.5 if limite is None else min(limite - agora, 0.5)
+            if mudou:
+                time.sleep(min(cedo - agora, fatia))
+            else:
+                cache.difusor.aguardar(enquete_id, versao, min(prazo - agora, fatia))
+        if self.sobrecarregado():
+            estado["espaco"] = min(estado["espaco"] * AUTO_REFRESH_BACKOFF, AUTO_REFRESH_MAX_SECONDS)
+        else:
+            estado["espaco"] = AUTO_REFRESH_MIN_SECONDS
+        if mudou:
+            estado["intervalo"] = AUTO_REFRESH_SECONDS
+        else:
+            estado["intervalo"] = min(estado["intervalo"] * AUTO_REFRESH_BACKOFF, AUTO_REFRESH_MAX_SECONDS)
+        estado["ultimo"] = time.monotonic()
+        return mudou
+
+
+@recurso_do_processo
+def get_agendador_atualizacao():
+    return AgendadorAtualizacao()
+
+
+def _sessao_tem_pedido_urgente(ctx):
+    # Clique num widget (rerun completo) ou sessão encerrada enquanto a
+    # sessão espera: os ticks do próprio fragmento só se acumulam na fila.
+    # ScriptRequests é API interna do Streamlit: None se ela mudou e não dá
+    # para saber (aí a espera tem limite curto, ver _snapshot_ao_vivo).
+    if not hasattr(ctx, "script_requests"):
+        _avisar_api_interna_ausente("ScriptRunContext.script_requests")
+        return None
+    pedidos = ctx.script_requests
+    if pedidos is None:
+        return False
+    estado = getattr(pedidos, "_state", None)
+    fila = getattr(getattr(pedidos, "_rerun_data", None), "fragment_id_queue", None)
+    if estado is None or fila is None:
+        _avisar_api_interna_ausente("ScriptRequests._state/_rerun_data.fragment_id_queue")
+        return None
+    if estado == ScriptRequestType.STOP:
+        return True
+    return estado == ScriptRequestType.RERUN and not fila
+
+
+def _snapshot_ao_vivo(enquete_id, user_voting_id=None):
+    # Nos reruns do fragmento a sessão espera no AgendadorAtualizacao até a
+    # hora de renderizar de novo. Se a versão ainda é a última que a sessão
+    # viu, reaproveita o snapshot anterior sem tocar no banco. No run
+    # completo lê na hora.
+    cache = get_cache_estado()
+    agendador = get_agendador_atualizacao()
+    anterior = st.session_state.get("_snapshot_visto")
+    if anterior is not None and (anterior["enquete_id"], anterior["user_voting_id"]) != (enquete_id, user_voting_id):
+        anterior = None
+    ctx = get_script_run_ctx()
+    if anterior is not None and ctx is not None and ctx.fragment_ids_this_run:
+        estado = st.session_state.setdefault("_agenda_ao_vivo", agendador.novo_estado())
+        # Sem como ver os cliques, a espera não passa de LIVE_WAIT_FALLBACK_SECONDS:
+        # o próximo tick retoma a mesma agenda
+        bloqueio_max = None if _sessao_tem_pedido_urgente(ctx) is not None else LIVE_WAIT_FALLBACK_SECONDS
+        if not agendador.aguardar(
+            estado, cache, enquete_id, anterior["versao"], lambda: _sessao_tem_pedido_urgente(ctx), bloqueio_max
+        ):
+            return anterior
+    else:
+        st.session_state["_agenda_ao_vivo"] = agendador.novo_estado()
+    with agendador.leitura():
+        snapshot = db_carregar_snapshot(enquete_id, user_voting_id)
+    st.session_state["_snapshot_visto"] = snapshot
+    return snapshot
+
+
+@st.experimental_fragment(run_every=LIVE_TICK_SECONDS)
+@medir_payload
+@medir
+def _fragmento_aguardando_enquete(enquete_id, user_voting_id):
+    if _snapshot_ao_vivo(enquete_id, user_voting_id)["ativa"]:
+        st.rerun()
+
+
+@st.experimental_fragment(run_every=LIVE_TICK_SECONDS)
+@medir_payload
+@medir
+def _fragmento_resultados_aluno(enquete_id, user_voting_id, pergunta, opcoes):
+    snapshot = _snapshot_ao_vivo(enquete_id, user_voting_id)
+    # Enquete desativada, trocada ou votos resetados: a página inteira muda
+    if (
+        not snapshot["ativa"]
+        or snapshot["pergunta"] != pergunta
+        or snapshot["opcoes"] != opcoes
+        or not snapshot["ja_votou"]
+    ):
+        st.rerun()
+    mostrar_resultados(snapshot, snapshot)
+
+
+def html_resultados(opcoes, votos, total_votos):
+    # Total e uma barra por opção num único bloco HTML (classes .res do
+    # _CSS): um elemento por rerun em vez de um st.write + st.progress por
+    # opção
+    partes = [f"<div class='res'><p><b>Total de votos: {total_votos}</b></p>"]
+    for i, opt_txt in enumerate(opcoes):
+        if opt_txt and opt_txt.strip():
+            v_count = votos[i] if i < len(votos) else 0
+            perc = (v_count / total_votos) * 100 if total_votos > 0 else 0
+            partes.append(
+                f"<p><b>{html_module.escape(opt_txt)}</b>: {v_count} ({perc:.1f}%)</p>"
+                f"<span><i style='width:{min(perc, 100.0):.1f}%'></i></span>"
+            )
+    partes.append("</div>")
+    return "".join(partes)
+
+
 def mostrar_resultados(dados_enquete_param, resultados_param):
     total_votos = resultados_param.get("total_votos", 0)
     opcoes = dados_enquete_param.get("opcoes", [])
@@ -705,82 +4105,108 @@ def mostrar_resultados(dados_enquete_param, resultados_param):
     if total_votos == 0:
         st.info("Ainda não há votos registrados.")
         return
+    st.markdown(html_resultados(opcoes, resultados_param.get("votos", []), total_votos), unsafe_allow_html=True)
 
-    votos = list(resultados_param.get("votos", []))
-    num_opcoes = len(opcoes)
 
-    if len(votos) < num_opcoes:
-        votos.extend([0] * (num_opcoes - len(votos)))
-    elif len(votos) > num_opcoes:
-        votos = votos[:num_opcoes]
+def serie_taxa_votos(baldes, opcoes):
+    # Votos por segundo de cada opção, ou por N minutos em enquetes longas
+    # (no máximo TAXA_VOTOS_MAX_PONTOS pontos). Agregação vetorizada com
+    # NumPy; pandas e NumPy só são importados aqui, fora da partida a frio.
+    rotulos = [(i, opt) for i, opt in enumerate(opcoes) if opt and opt.strip()]
+    if not baldes or not rotulos:
+        return None
+    import numpy as np
+    import pandas as pd
 
-    st.write(f"**Total de votos: {total_votos}**")
-    for i, opt_txt in enumerate(opcoes):
-        if opt_txt and opt_txt.strip():
-            v_count = votos[i] if i < len(votos) else 0
-            perc = (v_count / total_votos) * 100 if total_votos > 0 else 0
-            st.write(f"**{opt_txt}**: {v_count} ({perc:.1f}%)")
-            st.progress(min(perc / 100.0, 1.0))
+    dados = np.asarray(baldes, dtype=np.int64).reshape(-1, 3)
+    segundos, opcao, contagem = dados[:, 0], dados[:, 1], dados[:, 2]
+    inicio = int(segundos.min())
+    duracao = int(segundos.max()) - inicio + 1
+    passo = 1 if duracao <= TAXA_VOTOS_MAX_PONTOS else 60 * math.ceil(duracao / (60 * TAXA_VOTOS_MAX_PONTOS))
+    if passo > 1:
+        inicio -= inicio % 60
+    valido = (opcao >= 0) & (opcao < len(opcoes))
+    posicao = (segundos[valido] - inicio) // passo
+    matriz = np.zeros((int(posicao.max()) + 1 if len(posicao) else 1, len(opcoes)), dtype=np.int64)
+    np.add.at(matriz, (posicao, opcao[valido]), contagem[valido])
+    indice = pd.to_datetime(inicio + np.arange(len(matriz)) * passo, unit="s", utc=True).tz_convert(BR_TZ)
+    nomes = [opt for _, opt in rotulos]
+    colunas = [f"{opt} ({i+1})" if nomes.count(opt) > 1 else opt for i, opt in rotulos]
+    serie = pd.DataFrame(matriz[:, [i for i, _ in rotulos]], index=indice, columns=colunas)
+    return {"passo": passo, "serie": serie}
+
+
+def mostrar_taxa_votos(taxa):
+    if taxa is None:
+        return
+    passo = taxa["passo"]
+    unidade = "segundo" if passo == 1 else ("minuto" if passo == 60 else f"{passo // 60} minutos")
+    st.write(f"**Votos por {unidade}**")
+    st.line_chart(taxa["serie"])
 
 
 def mostrar_enquete_historico(id_historico):
-    dados_enquete = db_carregar_enquete_historico_por_id(id_historico)
+    dados_enquete = db_carregar_enquete_historico_renderizada(id_historico)
     if not dados_enquete:
         st.error("Enquete não encontrada no histórico.")
         if st.button("⬅️ Voltar à página principal", key="voltar_hist_err"):
-            st.query_params.clear()
+            limpar_query_params()
             st.rerun()
         return
 
     st.title("📜 Histórico da Enquete")
     st.subheader(f"Pergunta: {dados_enquete['pergunta']}")
-    st.caption(f"Realizada em: {format_timestamp_br(dados_enquete['timestamp'])}")
+    st.caption(f"Realizada em: {dados_enquete['data_br']}")
     st.divider()
 
-    total_votos_hist = dados_enquete.get("total_votos", 0)
-    opcoes_hist = dados_enquete.get("opcoes", [])
-    votos_hist = list(dados_enquete.get("votos", []))
-
-    if not opcoes_hist:
+    if not dados_enquete["opcoes"]:
         st.info("Não há opções definidas para esta enquete do histórico.")
-    elif total_votos_hist == 0:
+    elif dados_enquete["total_votos"] == 0:
         st.info("Não houve votos registrados para esta enquete.")
     else:
-        num_opcoes_hist = len(opcoes_hist)
-        if len(votos_hist) < num_opcoes_hist:
-            votos_hist.extend([0] * (num_opcoes_hist - len(votos_hist)))
-        elif len(votos_hist) > num_opcoes_hist:
-            votos_hist = votos_hist[:num_opcoes_hist]
-
-        st.write(f"**Total de votos: {total_votos_hist}**")
-        for i, opt_txt in enumerate(opcoes_hist):
-            if opt_txt and opt_txt.strip():
-                v_count = votos_hist[i] if i < len(votos_hist) else 0
-                perc = (v_count / total_votos_hist) * 100 if total_votos_hist > 0 else 0
-                st.write(f"**{opt_txt}**: {v_count} ({perc:.1f}%)")
-                st.progress(min(perc / 100.0, 1.0))
+        st.markdown(dados_enquete["html"], unsafe_allow_html=True)
+        mostrar_taxa_votos(dados_enquete["taxa"])
 
     st.divider()
     if st.button("⬅️ Voltar à página principal", key="voltar_hist_main"):
-        st.query_params.clear()
+        limpar_query_params()
         st.rerun()
 
 
 def mostrar_rodape():
     # Rodapé único, exibido em todas as telas (professor, aluno e histórico)
     st.markdown(
-        '<hr><div style="text-align:center; margin-top:40px; padding:10px; color:#000000; font-size:16px;">'
-        "<h4>📊 Enquete App</h4>Sua enquete em tempo real<br>"
-        '<em>por <a href="https://www.linkedin.com/in/aryribeiro" target="_blank" rel="noopener" '
-        'style="text-decoration:none; color:inherit;"><strong>Ary Ribeiro</strong></a></em></div>',
+        "<hr><div class='rodape'><h4>📊 Enquete App</h4>Sua enquete em tempo real<br>"
+        "<em>por <a href='https://www.linkedin.com/in/aryribeiro' target='_blank' rel='noopener'>"
+        "<strong>Ary Ribeiro</strong></a></em></div>",
         unsafe_allow_html=True,
     )
 
 
 # --- Router Principal ---
+@medir_payload
+@medir
 def app_router():
+    # Primeiro comando st do run. Fica aqui, e não no topo do módulo, para
+    # `import app` (CLI, benchmarks) não tocar no Streamlit.
+    st.set_page_config(
+        page_title="Enquete App | Sua enquete em tempo real",
+        page_icon="📊",
+        layout="centered",
+        initial_sidebar_state="collapsed",
+    )
+    st.markdown(_CSS, unsafe_allow_html=True)
     initialize_session_state()
     _init_db_once()
+    # Apaga exportações vencidas antes de um reinício e as próximas no prazo
+    get_limpeza_exportacoes()
+
+    # Sala vem da URL (?sala=); sem parâmetro, cai na sala padrão. Salas
+    # novas só nascem no painel do professor
+    st.session_state.sala = normalizar_sala(st.query_params.get("sala"))
+    st.session_state.enquete_id = db_obter_enquete_id(
+        st.session_state.sala, criar=st.session_state.get("modo") == "professor"
+    )
 
     # Identificador de voto = IP público do cliente: estável entre F5,
     # abas e navegadores diferentes do mesmo usuário. Fallback por sessão
@@ -804,13 +4230,13 @@ def app_router():
             except ValueError:
                 st.error("ID de enquete do histórico inválido.")
                 if st.button("⬅️ Voltar"):
-                    st.query_params.clear()
+                    limpar_query_params()
                     st.rerun()
                 return
         else:
             st.warning("ID da enquete do histórico não fornecido.")
             if st.button("⬅️ Voltar"):
-                st.query_params.clear()
+                limpar_query_params()
                 st.rerun()
             return
 
@@ -819,12 +4245,12 @@ def app_router():
         if st.button("Professor", key="sidebar_prof_vfinal", use_container_width=True):
             current_mode = st.session_state.get("modo")
             if current_mode not in ("professor", "login_professor"):
-                st.query_params.clear()
+                limpar_query_params()
                 st.session_state.modo = "login_professor"
                 st.session_state.pagina_professor = "painel"
                 st.rerun()
             elif current_mode == "login_professor":
-                st.query_params.clear()
+                limpar_query_params()
                 st.rerun()
 
         if st.session_state.modo != "professor":
@@ -832,7 +4258,7 @@ def app_router():
             with col_sb1:
                 if st.button("Aluno", key="sidebar_aluno_vfinal", use_container_width=True):
                     if st.session_state.modo != "aluno":
-                        st.query_params.clear()
+                        limpar_query_params()
                         st.session_state.modo = "aluno"
                         st.rerun()
             with col_sb2:
@@ -842,20 +4268,56 @@ def app_router():
 
         st.divider()
         st.title("Histórico")
-        historico_enquetes = db_carregar_historico(limite=HISTORICO_LIMIT)
-        if historico_enquetes:
-            for item_hist in historico_enquetes:
-                pergunta_raw = item_hist["pergunta"]
-                pergunta_curta = pergunta_raw[:25] + "..." if len(pergunta_raw) > 25 else pergunta_raw
-                pergunta_escaped = html_module.escape(pergunta_curta)
-                ts_formatado = format_timestamp_br_short(item_hist["timestamp"])
-                link_html = (
-                    f"<a href='?page=historico_view&enquete_id={int(item_hist['id'])}' target='_self'>"
-                    f"📊 {pergunta_escaped} ({ts_formatado})</a>"
-                )
-                st.markdown(f"<div class='sidebar-history-link'>{link_html}</div>", unsafe_allow_html=True)
+        if st.session_state.enquete_id is None:
+            st.caption("Sala inexistente")
         else:
-            st.sidebar.caption("Nenhuma enquete no histórico")
+            busca_historico = st.text_input(
+                "Buscar no histórico",
+                key="sidebar_historico_busca",
+                placeholder="Palavras da pergunta ou das opções",
+            )
+            # Pilha de cursores (ts_ms, id): o topo marca onde a página atual
+            # começa; volta ao início se a sala ou a busca mudar
+            filtro_historico = (st.session_state.sala, busca_historico)
+            if st.session_state.get("historico_filtro") != filtro_historico:
+                st.session_state.historico_filtro = filtro_historico
+                st.session_state.historico_cursores = []
+            cursores = st.session_state.historico_cursores
+            pagina_historico = db_carregar_historico(
+                st.session_state.enquete_id,
+                limite=HISTORICO_PAGE_SIZE + 1,
+                antes=cursores[-1] if cursores else None,
+                busca=busca_historico,
+            )
+            tem_mais_antigas = len(pagina_historico) > HISTORICO_PAGE_SIZE
+            historico_enquetes = pagina_historico[:HISTORICO_PAGE_SIZE]
+            if historico_enquetes:
+                for item_hist in historico_enquetes:
+                    pergunta_raw = item_hist["pergunta"]
+                    pergunta_curta = pergunta_raw[:25] + "..." if len(pergunta_raw) > 25 else pergunta_raw
+                    pergunta_escaped = html_module.escape(pergunta_curta)
+                    link_html = (
+                        f"<a href='?sala={st.session_state.sala}&page=historico_view"
+                        f"&enquete_id={int(item_hist['id'])}' target='_self'>"
+                        f"📊 {pergunta_escaped} ({item_hist['data_br_curta']})</a>"
+                    )
+                    st.markdown(f"<div class='sidebar-history-link'>{link_html}</div>", unsafe_allow_html=True)
+                if cursores or tem_mais_antigas:
+                    col_hist1, col_hist2 = st.columns(2)
+                    with col_hist1:
+                        # Callbacks mexem na pilha antes do rerun do clique (sem st.rerun extra)
+                        if cursores:
+                            st.button("◀ Recentes", key="sidebar_historico_recentes", use_container_width=True,
+                                      on_click=cursores.pop)
+                    with col_hist2:
+                        if tem_mais_antigas:
+                            ultimo = historico_enquetes[-1]
+                            st.button("Antigas ▶", key="sidebar_historico_antigas", use_container_width=True,
+                                      on_click=cursores.append, args=((ultimo["ts_ms"], ultimo["id"]),))
+            elif busca_historico:
+                st.sidebar.caption("Nenhuma enquete encontrada")
+            else:
+                st.sidebar.caption("Nenhuma enquete no histórico")
 
     modo_atual = st.session_state.get("modo")
     if modo_atual == "login_professor":
@@ -865,9 +4327,14 @@ def app_router():
             mostrar_painel_professor()
         elif st.session_state.pagina_professor == "alterar_senha":
             mostrar_tela_alterar_senha()
+        elif st.session_state.pagina_professor == "metricas" and METRICS_ENABLED:
+            mostrar_tela_metricas()
         else:
             st.session_state.pagina_professor = "painel"
             st.rerun()
+    elif modo_atual == "aluno" and st.session_state.enquete_id is None:
+        st.title("🚪 Sala inexistente")
+        st.info(f"A sala \"{st.session_state.sala}\" não existe. Confira o link com o professor.")
     elif modo_atual == "aluno":
         mostrar_tela_aluno()
     else:
@@ -876,41 +4343,150 @@ def app_router():
 
     mostrar_rodape()
 
-    st.markdown("""
-<style>
-    .main {
-        background-color: #ffffff;
-        color: #333333;
-    }
-    .block-container {
-        padding-top: 1rem;
-        padding-bottom: 0rem;
-    }
-    header {display: none !important;}
-    footer {display: none !important;}
-    #MainMenu {display: none !important;}
-    div[data-testid="stAppViewBlockContainer"] {
-        padding-top: 0 !important;
-        padding-bottom: 0 !important;
-    }
-    div[data-testid="stVerticalBlock"] {
-        gap: 0 !important;
-        padding-top: 0 !important;
-        padding-bottom: 0 !important;
-    }
-    .element-container {
-        margin-top: 0 !important;
-        margin-bottom: 0 !important;
-    }
-</style>
-""", unsafe_allow_html=True)
 
-    # Auto-refresh das telas do aluno: dorme só DEPOIS de renderizar tudo
-    # (inclusive o rodapé), para nenhum elemento ficar órfão entre os runs
-    if st.session_state.pop("_auto_refresh", False):
-        time.sleep(AUTO_REFRESH_SECONDS)
-        st.rerun()
+# --- Linha de comando ---
+# Vários processos num host: N workers `streamlit run` (portas porta_base..)
+# atrás de um balanceador TCP local, fixo por IP do cliente (como o ip_hash do
+# nginx), para o websocket de uma sessão e as reconexões dela caírem sempre no
+# mesmo processo. Todos usam o mesmo arquivo SQLite em WAL; os caches de cada
+# processo ficam coerentes pelas VersoesCompartilhadas.
+async def _copiar_fluxo(leitor, escritor):
+    try:
+        while dados := await leitor.read(65536):
+            escritor.write(dados)
+            await escritor.drain()
+    except ConnectionError:
+        pass
+    finally:
+        escritor.close()
+
+
+def _cabecalho_encaminhado(cabecalho, ip):
+    # X-Forwarded-For no fim do cabeçalho: os workers confiam neste salto
+    # (127.0.0.1 no TRUSTED_PROXIES deles). Só o primeiro pedido da conexão é lido aqui; depois
+    # os bytes passam direto. Um handshake de websocket vira um fluxo só de
+    # frames, então basta; qualquer outro pedido leva "Connection: close",
+    # e o próximo pedido do navegador vem numa conexão nova, também com o cabeçalho
+    linhas = cabecalho[:-4].split(b"\r\n")
+    if not any(linha.lower().startswith(b"upgrade:") for linha in linhas[1:]):
+        linhas = [linhas[0]] + [
+            linha for linha in linhas[1:] if not linha.lower().startswith((b"connection:", b"keep-alive:"))
+        ]
+        linhas.append(b"Connection: close")
+    linhas.append(f"X-Forwarded-For: {ip}".encode())
+    return b"\r\n".join(linhas) + b"\r\n\r\n"
+
+
+async def _atender_balanceado(leitor_cliente, escritor_cliente, portas):
+    ip = escritor_cliente.get_extra_info("peername")[0]
+    inicio = int.from_bytes(hashlib.blake2b(ip.encode(), digest_size=4).digest(), "big")
+    # Worker fora do ar (subindo ou reiniciando): tenta o próximo
+    for tentativa in range(len(portas)):
+        try:
+            leitor_worker, escritor_worker = await asyncio.open_connection(
+                "127.0.0.1", portas[(inicio + tentativa) % len(portas)]
+            )
+            break
+        except OSError:
+            continue
+    else:
+        escritor_cliente.close()
+        return
+    try:
+        cabecalho = await leitor_cliente.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        escritor_cliente.close()
+        escritor_worker.close()
+        return
+    escritor_worker.write(_cabecalho_encaminhado(cabecalho, ip))
+    await asyncio.gather(
+        _copiar_fluxo(leitor_cliente, escritor_worker), _copiar_fluxo(leitor_worker, escritor_cliente)
+    )
+
+
+def _subir_worker(porta):
+    comando = [sys.executable, "-m", "streamlit", "run", os.path.abspath(__file__)]
+    comando += ["--server.port", str(porta), "--server.address", "127.0.0.1", "--server.headless", "true"]
+    # O balanceador sempre acrescenta o X-Forwarded-For: os workers confiam
+    # nele (127.0.0.1), além dos proxies já configurados
+    ambiente = dict(os.environ)
+    ambiente["TRUSTED_PROXIES"] = ",".join(rede for rede in (TRUSTED_PROXIES, "127.0.0.1") if rede)
+    # cwd no diretório do app: mesmo DB_NAME e mesmo .streamlit/config.toml em todos
+    return subprocess.Popen(comando, cwd=os.path.dirname(os.path.abspath(__file__)), env=ambiente)
+
+
+async def _balancear(endereco, porta, portas):
+    # SIGTERM (systemd, docker stop) também derruba os workers
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass
+    workers = {p: _subir_worker(p) for p in portas}
+    servidor = await asyncio.start_server(
+        lambda leitor, escritor: _atender_balanceado(leitor, escritor, portas), endereco, porta
+    )
+    print(f"{len(portas)} processos (portas {portas[0]}-{portas[-1]}) em http://{endereco}:{porta}", file=sys.stderr)
+    try:
+        async with servidor:
+            while True:
+                await asyncio.sleep(1)
+                for p, worker in workers.items():
+                    if worker.poll() is not None:
+                        print(f"worker da porta {p} saiu (código {worker.returncode}); reiniciando", file=sys.stderr)
+                        workers[p] = _subir_worker(p)
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.wait()
+
+
+def servir(processos, porta, endereco="0.0.0.0", porta_base=None):
+    # Migra o banco uma vez, antes de subir os workers
+    _init_db_once()
+    porta_base = porta_base or porta + 1
+    try:
+        asyncio.run(_balancear(endereco, porta, list(range(porta_base, porta_base + processos))))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+
+
+def main_cli(argv=None):
+    # python app.py exportar {historico,ritmo} [--formato csv|parquet] [--saida arquivo] [--sala s]
+    # python app.py servir [--processos N] [--porta 8501] [--endereco 0.0.0.0] [--porta-base 8502]
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python app.py", description="Enquete App: exportação de dados e servidor")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    exportacao = comandos.add_parser("exportar", help="exporta o histórico ou o ritmo de votação arquivado")
+    exportacao.add_argument("conjunto", choices=list(EXPORT_CONJUNTOS))
+    exportacao.add_argument("--formato", choices=list(EXPORT_FORMATOS), default="csv")
+    exportacao.add_argument("--saida", default="-", help="arquivo de saída; '-' (padrão) é a saída padrão, só em CSV")
+    exportacao.add_argument("--sala", default=None, help="só esta sala (padrão: todas)")
+    exportacao.add_argument("--lote", type=int, default=EXPORT_CHUNK_ROWS, help="itens do histórico lidos por vez")
+    servidor = comandos.add_parser("servir", help="sobe N processos Streamlit atrás de um balanceador local")
+    servidor.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    servidor.add_argument("--porta", type=int, default=8501, help="porta pública do balanceador")
+    servidor.add_argument("--endereco", default="0.0.0.0")
+    servidor.add_argument("--porta-base", type=int, default=None, help="porta do 1º worker (padrão: --porta + 1)")
+    args = parser.parse_args(argv)
+
+    if args.comando == "servir":
+        return servir(args.processos, args.porta, args.endereco, args.porta_base)
+    if args.saida == "-" and args.formato == "parquet":
+        parser.error("Parquet precisa de --saida <arquivo>")
+    _init_db_once()
+    sala = normalizar_sala(args.sala) if args.sala else None
+    destino = sys.stdout if args.saida == "-" else args.saida
+    linhas = exportar(args.conjunto, args.formato, destino, sala, args.lote)
+    print(f"{linhas} linhas exportadas", file=sys.stderr)
+    return 0
 
 
 if __name__ == "__main__":
-    app_router()
+    # `streamlit run app.py` sobe a interface; `python app.py ...` é a CLI
+    if runtime.exists():
+        app_router()
+    else:
+        sys.exit(main_cli())
@@ -0,0 +1,106 @@
+# Benchmark dos backends de armazenamento: votos/s e leitura do snapshot no
+# SQLite x backend chave-valor (substituto em processo do servidor KV), e
+# checagem de voto único com duas "réplicas" gravando no mesmo armazém.
+#
+# Uso: python benchmarks/bench_armazenamento.py [--votos 2000] [--threads 16]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _preparar(backend, caminho):
+    recursos.reiniciar(caminho, backend)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_salvar_dados_enquete(enquete_id, "Benchmark?", ["a", "b", "c", "d"])
+    app.db_limpar_votos_e_cookies(enquete_id, 4)
+    return enquete_id
+
+
+def _votar(registrar, enquete_id, total_votos, num_threads, prefixo="ip-arm"):
+    por_thread = total_votos // num_threads
+    aceitos = [0] * num_threads
+    barreira = threading.Barrier(num_threads + 1)
+
+    def worker(t):
+        barreira.wait()
+        for i in range(por_thread):
+            if registrar(enquete_id, i % 4, f"{prefixo}-{t}-{i}"):
+                aceitos[t] += 1
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+    for th in threads:
+        th.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for th in threads:
+        th.join()
+    return sum(aceitos), por_thread * num_threads, time.perf_counter() - inicio
+
+
+def _leituras(enquete_id, segundos):
+    # Snapshot direto no backend (sem o CacheEstado) para medir só a leitura
+    armazenamento = app.get_armazenamento()
+    n, fim = 0, time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        armazenamento.carregar_snapshot(enquete_id)
+        n += 1
+    return n / segundos
+
+
+def _replicas(num_replicas, votantes, num_threads):
+    # Réplicas = instâncias independentes do backend no mesmo armazém; cada
+    # votante tenta votar uma vez em CADA réplica ao mesmo tempo
+    armazem = app.ArmazemKVMemoria()
+    replicas = [app.ArmazenamentoKV(armazem) for _ in range(num_replicas)]
+    app.get_cache_estado.clear()
+    app.get_cache_historico.clear()
+    app.get_indice_votantes.clear()
+    enquete_id = replicas[0].criar_enquete(app.SALA_PADRAO)
+    replicas[0].limpar_votos(enquete_id, 2)
+    aceitos = [0] * (num_replicas * num_threads)
+    barreira = threading.Barrier(num_replicas * num_threads)
+
+    def worker(r, t):
+        barreira.wait()
+        for i in range(t, votantes, num_threads):
+            if replicas[r].registrar_voto(enquete_id, i % 2, f"ip-rep-{i}"):
+                aceitos[r * num_threads + t] += 1
+
+    threads = [threading.Thread(target=worker, args=(r, t)) for r in range(num_replicas) for t in range(num_threads)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    return sum(aceitos), replicas[-1].carregar_resultados(enquete_id, 2)["total_votos"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backends de armazenamento: SQLite x chave-valor")
+    parser.add_argument("--votos", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--segundos", type=float, default=1.0, help="duração da medição de leituras")
+    parser.add_argument("--replicas", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("sqlite", "kv"):
+            enquete_id = _preparar(backend, os.path.join(tmp, f"{backend}.db"))
+            ok, total, dur = _votar(app.db_registrar_voto, enquete_id, args.votos, args.threads)
+            leituras = _leituras(enquete_id, args.segundos)
+            print(f"{backend:>6}: {ok}/{total} votos em {dur:.2f}s -> {ok / dur:,.0f} votos/s | snapshot: {leituras:,.0f} leituras/s")
+
+    aceitos, contagem = _replicas(args.replicas, args.votos, args.threads)
+    status = "OK" if aceitos == contagem == args.votos else "FALHOU"
+    print(f"voto único com {args.replicas} réplicas: {aceitos} aceitos, contagem {contagem}, esperado {args.votos} -> {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Simulação do auto-refresh: N sessões ao vivo (threads) com o tick de
+# LIVE_TICK_SECONDS do navegador, numa rajada de votos seguida de um período
+# parado. Compara a espera fixa anterior (acorda a cada mudança, teto de
+# AUTO_REFRESH_SECONDS) com o AgendadorAtualizacao: reruns e leituras do
+# snapshot por segundo em cada fase e o pico de reruns numa janela de
+# 100 ms (sessões em sincronia). Com --em-fase todas as sessões têm o tick
+# alinhado, como depois de um run completo de todas (enquete ativada).
+#
+# Uso: python benchmarks/bench_atualizacao.py [--sessoes 500] [--votos-por-segundo 50]
+#                                             [--votacao 10] [--ocioso 60] [--sobrecarga] [--em-fase]
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _preparar(caminho):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_salvar_dados_enquete(enquete_id, "Simulação?", ["a", "b", "c"])
+    app.db_limpar_votos_e_cookies(enquete_id, 3)
+    app.db_salvar_enquete_ativa(enquete_id, True)
+    return enquete_id
+
+
+def _espera_fixa(cache, enquete_id, fim):
+    def esperar(estado, versao_vista):
+        teto = min(app.AUTO_REFRESH_SECONDS, fim - time.monotonic())
+        cache.difusor.aguardar(enquete_id, versao_vista, max(0.0, teto))
+        return cache.versao(enquete_id) != versao_vista
+
+    return esperar
+
+
+def _espera_adaptativa(cache, enquete_id, fim):
+    agendador = app.get_agendador_atualizacao()
+
+    def esperar(estado, versao_vista):
+        # O fim da simulação faz o papel do "pedido urgente" da sessão
+        return agendador.aguardar(estado, cache, enquete_id, versao_vista, lambda: time.monotonic() >= fim)
+
+    return esperar
+
+
+def _simular(esquema, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        enquete_id = _preparar(os.path.join(tmp, "atualizacao.db"))
+        cache = app.get_cache_estado()
+        agendador = app.get_agendador_atualizacao()
+        inicio = time.monotonic()
+        fim_votacao = inicio + args.votacao
+        fim = fim_votacao + args.ocioso
+        esperar = esquema(cache, enquete_id, fim)
+        reruns, leituras = [], []
+        lock = threading.Lock()
+
+        def sessao(k):
+            fase = 0.0 if args.em_fase else random.random() * app.LIVE_TICK_SECONDS
+            estado = agendador.novo_estado()
+            versao = app.db_carregar_snapshot(enquete_id)["versao"]
+            while True:
+                # Próximo tick do navegador (os do meio se acumulam num só)
+                decorrido = time.monotonic() - inicio - fase
+                tick = inicio + fase + math.ceil(max(decorrido, 0) / app.LIVE_TICK_SECONDS) * app.LIVE_TICK_SECONDS
+                if tick >= fim:
+                    return
+                time.sleep(max(0.0, tick - time.monotonic()))
+                mudou = esperar(estado, versao)
+                agora = time.monotonic()
+                if agora >= fim:
+                    return
+                with lock:
+                    reruns.append(agora)
+                if mudou:
+                    with agendador.leitura():
+                        versao = app.db_carregar_snapshot(enquete_id)["versao"]
+                    with lock:
+                        leituras.append(agora)
+
+        def votante():
+            i = 0
+            while time.monotonic() < fim_votacao:
+                app.db_registrar_voto(enquete_id, i % 3, f"sim-{i}")
+                i += 1
+                time.sleep(1 / args.votos_por_segundo)
+
+        threads = [threading.Thread(target=sessao, args=(k,), daemon=True) for k in range(args.sessoes)]
+        threads.append(threading.Thread(target=votante, daemon=True))
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+
+    def fase(eventos, de, ate):
+        return [t for t in eventos if de <= t < ate]
+
+    for nome, de, ate in (("votação", inicio, fim_votacao), ("parado", fim_votacao, fim)):
+        r, lidas = fase(reruns, de, ate), fase(leituras, de, ate)
+        janelas = {}
+        for t in r:
+            janelas[int((t - de) * 10)] = janelas.get(int((t - de) * 10), 0) + 1
+        pico = max(janelas.values(), default=0)
+        print(
+            f"  {nome:<8}: {len(r) / (ate - de):8.1f} reruns/s, {len(lidas) / (ate - de):8.1f} leituras/s, "
+            f"pico {pico:>4} reruns em 100 ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Auto-refresh: espera fixa x agendador adaptativo")
+    parser.add_argument("--sessoes", type=int, default=500)
+    parser.add_argument("--votos-por-segundo", type=float, default=50)
+    parser.add_argument("--votacao", type=float, default=10, help="segundos de votação")
+    parser.add_argument("--ocioso", type=float, default=60, help="segundos sem mudança depois da votação")
+    parser.add_argument("--sobrecarga", action="store_true", help="força o agendador a se considerar sobrecarregado")
+    parser.add_argument("--em-fase", action="store_true", help="ticks de todas as sessões alinhados")
+    args = parser.parse_args()
+
+    if args.sobrecarga:
+        app.AUTO_REFRESH_OVERLOAD_MS = -1
+    print(f"{args.sessoes} sessões, {args.votos_por_segundo:g} votos/s por {args.votacao:g}s, {args.ocioso:g}s parado")
+    for nome, esquema in (("espera fixa", _espera_fixa), ("adaptativo", _espera_adaptativa)):
+        print(f"[{nome}]")
+        _simular(esquema, args)
+
+
+if __name__ == "__main__":
+    main()
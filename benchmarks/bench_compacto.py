@@ -0,0 +1,168 @@
+# Formato dos votantes e das datas: texto (até a migração 6: "ip-<endereço>"
+# / "sessao-<uuid>" e datas ISO-8601 numa tabela com rowid) x compacto (IP em
+# 4/16 bytes, sessão em 17 bytes, epoch ms, votantes WITHOUT ROWID). Mede o
+# tamanho de cada tabela e índice (dbstat) e a latência de "já votou?" por
+# chave primária (com a conversão da chave incluída) e de uma página funda do
+# histórico por cursor, com os dados todos no cache de páginas do SQLite e
+# com o cache padrão de 2 MiB (as páginas que faltam vêm do cache do SO).
+#
+# Uso: python benchmarks/bench_compacto.py [--votantes 1000000] [--historico 100000]
+import argparse
+import ipaddress
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+ESQUEMAS = {
+    "texto": (
+        """CREATE TABLE votantes (
+            enquete_id INTEGER NOT NULL,
+            epoca INTEGER NOT NULL,
+            user_voting_id TEXT NOT NULL,
+            vote_timestamp TEXT,
+            PRIMARY KEY (enquete_id, epoca, user_voting_id)
+        )""",
+        """CREATE TABLE historico (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sala TEXT NOT NULL,
+            timestamp TEXT,
+            pergunta TEXT
+        )""",
+        "CREATE INDEX idx_historico ON historico (sala, timestamp DESC, id DESC)",
+    ),
+    "compacto": (
+        """CREATE TABLE votantes (
+            enquete_id INTEGER NOT NULL,
+            epoca INTEGER NOT NULL,
+            user_voting_id BLOB NOT NULL,
+            vote_ts_ms INTEGER,
+            PRIMARY KEY (enquete_id, epoca, user_voting_id)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE historico (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sala TEXT NOT NULL,
+            ts_ms INTEGER,
+            pergunta TEXT
+        )""",
+        "CREATE INDEX idx_historico ON historico (sala, ts_ms DESC, id DESC)",
+    ),
+}
+
+
+def _votantes(n):
+    # Mistura de IPv4, IPv6 e sessões, como numa sala real
+    aleatorio = random.Random(42)
+    for i in range(n):
+        sorteio = aleatorio.random()
+        if sorteio < 0.6:
+            yield f"ip-{ipaddress.IPv4Address(aleatorio.getrandbits(32))}"
+        elif sorteio < 0.7:
+            yield f"ip-{ipaddress.IPv6Address(aleatorio.getrandbits(128))}"
+        else:
+            yield f"sessao-{uuid.UUID(int=aleatorio.getrandbits(128), version=4)}"
+
+
+def _preparar(formato, caminho, ids, num_historico):
+    conn = sqlite3.connect(caminho)
+    for ddl in ESQUEMAS[formato]:
+        conn.execute(ddl)
+    # Um voto a cada 10 ms e uma enquete arquivada por minuto, até agora
+    inicio_ms = app.agora_ms() - len(ids) * 10
+    if formato == "texto":
+        votantes = (
+            (1, 0, v, datetime.fromtimestamp((inicio_ms + i * 10) / 1000, timezone.utc).isoformat())
+            for i, v in enumerate(ids)
+        )
+        datas = (app.iso_de_ms(inicio_ms + i * 60_000) for i in range(num_historico))
+    else:
+        votantes = ((1, 0, app.codificar_votante(v), inicio_ms + i * 10) for i, v in enumerate(ids))
+        datas = (inicio_ms + i * 60_000 for i in range(num_historico))
+    conn.executemany("INSERT OR IGNORE INTO votantes VALUES (?, ?, ?, ?)", votantes)
+    conn.executemany(
+        "INSERT INTO historico (sala, pergunta, %s) VALUES (?, ?, ?)" % _coluna_data(formato),
+        ((app.SALA_PADRAO, f"Pergunta {i}", data) for i, data in enumerate(datas)),
+    )
+    conn.commit()
+    conn.execute("VACUUM")
+    return conn
+
+
+def _coluna_data(formato):
+    return "timestamp" if formato == "texto" else "ts_ms"
+
+
+def _tamanhos(conn):
+    return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall())
+
+
+def _medir(fn, repeticoes):
+    inicio = time.perf_counter()
+    for i in range(repeticoes):
+        fn(i)
+    return (time.perf_counter() - inicio) / repeticoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Votantes e datas: formato texto x compacto")
+    parser.add_argument("--votantes", type=int, default=1_000_000)
+    parser.add_argument("--historico", type=int, default=100_000)
+    parser.add_argument("--repeticoes", type=int, default=20_000)
+    args = parser.parse_args()
+
+    ids = list(_votantes(args.votantes))
+    consultas = random.Random(7).choices(ids, k=args.repeticoes)
+    with tempfile.TemporaryDirectory() as tmp:
+        for formato in ("texto", "compacto"):
+            caminho = os.path.join(tmp, f"{formato}.db")
+            conn = _preparar(formato, caminho, ids, args.historico)
+            tamanhos = _tamanhos(conn)
+            # Chave já no formato gravado: a conversão de cada busca entra na conta
+            converter = (lambda v: v) if formato == "texto" else app.codificar_votante
+
+            def ja_votou(i):
+                conn.execute(
+                    "SELECT 1 FROM votantes WHERE enquete_id = 1 AND epoca = 0 AND user_voting_id = ?",
+                    (converter(consultas[i]),),
+                ).fetchone()
+
+            coluna = _coluna_data(formato)
+            meio = conn.execute(
+                f"SELECT {coluna}, id FROM historico ORDER BY {coluna} DESC, id DESC LIMIT 1 OFFSET ?",
+                (args.historico // 2,),
+            ).fetchone()
+
+            def pagina(i):
+                conn.execute(
+                    f"SELECT id, pergunta, {coluna} FROM historico WHERE sala = ? AND ({coluna}, id) < (?, ?) "
+                    f"ORDER BY {coluna} DESC, id DESC LIMIT ?",
+                    (app.SALA_PADRAO, *meio, app.HISTORICO_PAGE_SIZE),
+                ).fetchall()
+
+            conn.close()
+            print(f"[{formato}] arquivo {os.path.getsize(caminho) / 1024 / 1024:.1f} MiB")
+            # Tabela com rowid + índice da chave primária (sqlite_autoindex_*)
+            # x só a árvore da chave primária (WITHOUT ROWID)
+            for nome in sorted(tamanhos):
+                if nome not in ("sqlite_schema", "sqlite_sequence"):
+                    print(f"  {nome:<32}: {tamanhos[nome] / 1024 / 1024:8.2f} MiB")
+            for cache, kib in (("256 MiB", 262_144), ("2 MiB", 2_000)):
+                conn = sqlite3.connect(caminho)
+                conn.execute(f"PRAGMA cache_size = -{kib}")
+                print(
+                    f"  cache {cache:<7}: já votou? {_medir(ja_votou, args.repeticoes):7.2f} µs, "
+                    f"página do meio do histórico {_medir(pagina, args.repeticoes // 10):7.2f} µs"
+                )
+                conn.close()
+
+
+if __name__ == "__main__":
+    main()
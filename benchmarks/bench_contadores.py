@@ -0,0 +1,65 @@
+# Benchmark de contenção dos contadores de voto: muitas threads gravando
+# votos ao mesmo tempo na mesma opção, com 1 fatia (linha quente única) x
+# K fatias por opção (VOTE_COUNTER_SHARDS).
+#
+# Uso: python benchmarks/bench_contadores.py [--threads 64] [--votos 4000] [--fatias 1 4 16]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _rodada(caminho, fatias, num_threads, total_votos):
+    app.VOTE_COUNTER_SHARDS = fatias
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_limpar_votos_e_cookies(enquete_id, 2)
+
+    por_thread = total_votos // num_threads
+    aceitos = [0] * num_threads
+    barreira = threading.Barrier(num_threads + 1)
+
+    def writer(t):
+        barreira.wait()
+        for i in range(por_thread):
+            # Todos votam na mesma opção: pior caso de linha quente
+            if app.db_registrar_voto(enquete_id, 0, f"ip-cont-{t}-{i}"):
+                aceitos[t] += 1
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(num_threads)]
+    for th in threads:
+        th.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for th in threads:
+        th.join()
+    duracao = time.perf_counter() - inicio
+    contagem = app.db_carregar_resultados(enquete_id, 2)["votos"][0]
+    return sum(aceitos), por_thread * num_threads, contagem, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contenção de escrita: contadores com 1 x K fatias")
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--votos", type=int, default=4000)
+    parser.add_argument("--fatias", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for fatias in args.fatias:
+            ok, total, contagem, dur = _rodada(os.path.join(tmp, f"fatias_{fatias}.db"), fatias, args.threads, args.votos)
+            print(
+                f"{fatias:>3} fatia(s): {ok}/{total} aceitos, contagem somada {contagem}, "
+                f"{dur:.2f}s -> {ok / dur:,.0f} votos/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# Microbenchmarks das funções db_* em volumes realistas, sem servidor
+# Streamlit: 1 mil, 100 mil e 1 milhão de votantes, com 10 a 100 mil enquetes
+# no histórico. A saída é JSON (uma entrada por função/caso/volume) para
+# comparar commits; --comparar mostra a variação contra um JSON anterior.
+#
+# Uso: python benchmarks/bench_db.py [--votantes 1000 100000 1000000]
+#          [--historico 10 1000 100000] [--saida atual.json] [--comparar base.json]
+import argparse
+import ipaddress
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+NUM_OPCOES = 4
+
+
+def _ip(i):
+    return f"ip-{ipaddress.IPv4Address(0x0A000000 + i)}"
+
+
+def _sessao(i):
+    return f"sessao-{uuid.UUID(int=i)}"
+
+
+def _preparar(caminho, num_votantes, num_historico):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_ativar_enquete(enquete_id, "Microbenchmark?", [f"opção {i}" for i in range(NUM_OPCOES)])
+    _popular_votantes(enquete_id, num_votantes)
+    # Uma enquete arquivada por minuto até agora, como num uso real
+    inicio_ms = app.agora_ms() - num_historico * 60_000
+    with app.get_db_pool().escrita() as conn:
+        conn.executemany(
+            "INSERT INTO historico_enquetes "
+            "(sala, ts_ms, data_br, data_br_curta, pergunta, opcoes_json, votos_json, total_votos, baldes_json) "
+            "VALUES (?, ?, ?, ?, ?, ?, '[15, 15, 15, 15]', 60, '[]')",
+            (
+                (
+                    app.SALA_PADRAO,
+                    ts_ms,
+                    app.format_timestamp_br(ts_ms),
+                    app.format_timestamp_br_short(ts_ms),
+                    f"Pergunta {i} sobre {'física' if i % 2 else 'química'}",
+                    json.dumps([f"opção {j}" for j in range(NUM_OPCOES)]),
+                )
+                for i in range(num_historico)
+                for ts_ms in [inicio_ms + i * 60_000]
+            ),
+        )
+        conn.commit()
+    return enquete_id
+
+
+def _popular_votantes(enquete_id, num_votantes):
+    # Votantes (IPs, no formato binário do app) e contagens direto nas
+    # tabelas da época atual
+    with app.get_db_pool().escrita() as conn:
+        epoca = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_ts_ms) "
+            "VALUES (?, ?, ?, 1704067200000)",
+            ((enquete_id, epoca, app.codificar_votante(_ip(i))) for i in range(num_votantes)),
+        )
+        conn.execute(
+            "UPDATE enquete_ativa_votos SET contagem = ? WHERE enquete_id = ? AND epoca = ? AND fatia = 0",
+            (num_votantes // NUM_OPCOES, enquete_id, epoca),
+        )
+        conn.commit()
+    app.get_indice_votantes().marcar_obsoleto()
+    app.get_cache_estado().invalidar(enquete_id)
+
+
+def _medir(fn, repeticoes, antes=None):
+    # `antes` roda fora da medição (ex.: invalidar um cache, repovoar)
+    tempos = []
+    for i in range(repeticoes):
+        if antes:
+            antes(i)
+        inicio = time.perf_counter_ns()
+        fn(i)
+        tempos.append((time.perf_counter_ns() - inicio) / 1e6)
+    tempos.sort()
+    return {
+        "repeticoes": repeticoes,
+        "media_ms": round(statistics.fmean(tempos), 4),
+        "p50_ms": round(tempos[len(tempos) // 2], 4),
+        "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 4),
+        "min_ms": round(tempos[0], 4),
+    }
+
+
+def _casos(enquete_id, num_votantes, num_historico, repeticoes):
+    cache_estado = app.get_cache_estado()
+    cache_historico = app.get_cache_historico()
+    indice = app.get_indice_votantes()
+    with app.get_db_pool().leitura() as conn:
+        meio = conn.execute(
+            "SELECT ts_ms, id FROM historico_enquetes ORDER BY ts_ms DESC, id DESC LIMIT 1 OFFSET ?",
+            (num_historico // 2,),
+        ).fetchone()
+    antes_meio = tuple(meio) if meio else None
+
+    def frio_resultados(i):
+        cache_estado.invalidar(enquete_id)
+
+    def frio_historico(i):
+        cache_historico.invalidar_lista(enquete_id)
+
+    def repovoar(i):
+        # A primeira repetição usa os votantes de _preparar
+        if i:
+            _popular_votantes(enquete_id, num_votantes)
+
+    # O reset fica por último: ele agenda a purga da época anterior, que
+    # concorreria com as medições seguintes
+    return [
+        (
+            "db_carregar_resultados",
+            "quente",
+            repeticoes * 10,
+            lambda i: app.db_carregar_resultados(enquete_id, NUM_OPCOES),
+            None,
+        ),
+        (
+            "db_carregar_resultados",
+            "frio",
+            repeticoes,
+            lambda i: app.db_carregar_resultados(enquete_id, NUM_OPCOES),
+            frio_resultados,
+        ),
+        (
+            "db_verificar_se_cookie_votou",
+            "índice frio",
+            3,
+            lambda i: app.db_verificar_se_cookie_votou(enquete_id, _ip(0)),
+            lambda i: indice.marcar_obsoleto(),
+        ),
+        (
+            "db_verificar_se_cookie_votou",
+            "já votou",
+            repeticoes * 10,
+            lambda i: app.db_verificar_se_cookie_votou(enquete_id, _ip(i % max(1, num_votantes))),
+            None,
+        ),
+        (
+            "db_verificar_se_cookie_votou",
+            "não votou",
+            repeticoes * 10,
+            lambda i: app.db_verificar_se_cookie_votou(enquete_id, _ip(num_votantes + i)),
+            None,
+        ),
+        (
+            "db_carregar_historico",
+            "primeira página, quente",
+            repeticoes * 10,
+            lambda i: app.db_carregar_historico(enquete_id),
+            None,
+        ),
+        (
+            "db_carregar_historico",
+            "primeira página, fria",
+            repeticoes,
+            lambda i: app.db_carregar_historico(enquete_id),
+            frio_historico,
+        ),
+        (
+            "db_carregar_historico",
+            "página do meio, fria",
+            repeticoes,
+            lambda i: app.db_carregar_historico(enquete_id, antes=antes_meio),
+            frio_historico,
+        ),
+        (
+            "db_carregar_historico",
+            "busca, fria",
+            repeticoes,
+            lambda i: app.db_carregar_historico(enquete_id, busca="fisica"),
+            frio_historico,
+        ),
+        (
+            "db_registrar_voto",
+            "novo votante",
+            repeticoes,
+            lambda i: app.db_registrar_voto(enquete_id, i % NUM_OPCOES, _sessao(i)),
+            None,
+        ),
+        (
+            "db_registrar_voto",
+            "voto repetido",
+            repeticoes,
+            lambda i: app.db_registrar_voto(enquete_id, 0, _sessao(0)),
+            None,
+        ),
+        (
+            "db_adicionar_ao_historico",
+            "",
+            repeticoes,
+            lambda i: app.db_adicionar_ao_historico(enquete_id, f"Nova {i}?", ["a", "b"], [1, 2], 3),
+            None,
+        ),
+        (
+            "db_limpar_votos_e_cookies",
+            "",
+            3,
+            lambda i: app.db_limpar_votos_e_cookies(enquete_id, NUM_OPCOES),
+            repovoar,
+        ),
+    ]
+
+
+def _versao_git():
+    try:
+        raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=raiz, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _comparar(resultados, caminho):
+    with open(caminho, encoding="utf-8") as f:
+        base = {(r["funcao"], r["caso"], r["votantes"], r["historico"]): r for r in json.load(f)["resultados"]}
+    for r in resultados:
+        anterior = base.get((r["funcao"], r["caso"], r["votantes"], r["historico"]))
+        if anterior and anterior["p50_ms"] > 0:
+            razao = r["p50_ms"] / anterior["p50_ms"]
+            print(
+                f"  {r['funcao']:<30} {r['caso']:<24} {r['votantes']:>8} vot. {r['historico']:>7} hist.: "
+                f"p50 {anterior['p50_ms']:9.4f} -> {r['p50_ms']:9.4f} ms ({razao:5.2f}x)",
+                file=sys.stderr,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks das funções db_* (saída JSON)")
+    parser.add_argument("--votantes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument(
+        "--historico", type=int, nargs="+", default=[10, 1_000, 100_000], help="um por volume de --votantes"
+    )
+    parser.add_argument("--repeticoes", type=int, default=50)
+    parser.add_argument("--saida", default="-", help="arquivo JSON; '-' (padrão) é a saída padrão")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+    if len(args.historico) != len(args.votantes):
+        parser.error("--historico precisa de um valor por volume de --votantes")
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_votantes, num_historico in zip(args.votantes, args.historico):
+            print(f"{num_votantes} votantes, {num_historico} no histórico", file=sys.stderr)
+            enquete_id = _preparar(os.path.join(tmp, f"bench-{num_votantes}.db"), num_votantes, num_historico)
+            for funcao, caso, repeticoes, fn, antes in _casos(enquete_id, num_votantes, num_historico, args.repeticoes):
+                medida = _medir(fn, repeticoes, antes)
+                resultados.append(
+                    dict(funcao=funcao, caso=caso, votantes=num_votantes, historico=num_historico, **medida)
+                )
+                print(
+                    f"  {funcao:<30} {caso:<24}: p50 {medida['p50_ms']:9.4f} ms, p95 {medida['p95_ms']:9.4f} ms",
+                    file=sys.stderr,
+                )
+
+    relatorio = {
+        "commit": _versao_git(),
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "vote_counter_shards": app.VOTE_COUNTER_SHARDS,
+        "resultados": resultados,
+    }
+    if args.saida == "-":
+        json.dump(relatorio, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    if args.comparar:
+        print(f"comparação com {args.comparar}", file=sys.stderr)
+        _comparar(resultados, args.comparar)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Benchmark da exportação: histórico de N enquetes (com baldes de ritmo)
+# exportado em CSV e Parquet pelo pipeline em lotes, com o pico de memória
+# (tracemalloc) comparado a carregar tudo de uma vez (fetchall + pandas).
+#
+# Uso: python benchmarks/bench_exportacao.py [--enquetes 100000] [--lote 1000]
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _preparar(caminho, n):
+    recursos.reiniciar(caminho)
+    baldes = json.dumps([[1_700_000_000 + s, s % 4, 3] for s in range(10)])
+    inicio_ms = app.agora_ms() - n * 60_000
+    with app.get_db_pool().escrita() as conn:
+        conn.executemany(
+            "INSERT INTO historico_enquetes (sala, ts_ms, pergunta, opcoes_json, votos_json, total_votos, baldes_json) "
+            "VALUES (?, ?, ?, ?, '[15, 15, 15, 15]', 60, ?)",
+            (
+                (
+                    app.SALA_PADRAO,
+                    inicio_ms + i * 60_000,
+                    f"Pergunta {i} de exportação",
+                    json.dumps([f"opção {j}" for j in range(4)]),
+                    baldes,
+                )
+                for i in range(n)
+            ),
+        )
+        conn.commit()
+
+
+def _medir(fn):
+    # Tempo numa passada sem tracemalloc (que deixa tudo várias vezes mais
+    # lento) e pico de memória numa segunda passada
+    inicio = time.perf_counter()
+    linhas = fn()
+    duracao = time.perf_counter() - inicio
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return linhas, duracao, pico / 1024 / 1024
+
+
+def _tudo_de_uma_vez(destino):
+    # Referência: materializa a tabela inteira antes de gravar
+    import pandas as pd
+
+    with app.get_db_pool().leitura() as conn:
+        rows = [dict(row) for row in conn.execute("SELECT * FROM historico_enquetes")]
+    pd.DataFrame(rows).to_csv(destino, index=False)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportação em lotes: tempo e pico de memória")
+    parser.add_argument("--enquetes", type=int, default=100_000)
+    parser.add_argument("--lote", type=int, default=app.EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _preparar(os.path.join(tmp, "exportacao.db"), args.enquetes)
+        print(f"{args.enquetes} enquetes no histórico, lotes de {args.lote}")
+        casos = [
+            ("historico", "csv"),
+            ("historico", "parquet"),
+            ("ritmo", "csv"),
+            ("ritmo", "parquet"),
+        ]
+        for conjunto, formato in casos:
+            destino = os.path.join(tmp, f"{conjunto}{app.EXPORT_FORMATOS[formato]}")
+            linhas, duracao, pico = _medir(lambda: app.exportar(conjunto, formato, destino, tamanho_lote=args.lote))
+            tamanho = os.path.getsize(destino) / 1024 / 1024
+            print(
+                f"  {conjunto:<9} {formato:<7}: {linhas:>9} linhas em {duracao:5.2f}s "
+                f"({linhas / duracao:>9,.0f} linhas/s), {tamanho:6.1f} MB, pico {pico:6.1f} MB"
+            )
+        destino = os.path.join(tmp, "tudo.csv")
+        linhas, duracao, pico = _medir(lambda: _tudo_de_uma_vez(destino))
+        print(f"  referência (fetchall + pandas, csv): {linhas} linhas em {duracao:5.2f}s, pico {pico:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Benchmark do histórico sem limite: N enquetes arquivadas, primeira página,
+# página profunda por cursor (keyset) x OFFSET, e busca textual, direto no
+# backend; e o mesmo pelo CacheHistorico (lista lateral e enquete renderizada).
+#
+# Uso: python benchmarks/bench_historico.py [--enquetes 100000] [--backend sqlite kv]
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+TEMAS = ["eleição", "matemática", "física", "história", "geografia", "química", "biologia", "literatura"]
+
+
+def _gerar(n):
+    # (ts_ms, pergunta, opcoes) em ordem cronológica, uma por minuto
+    inicio_ms = int(datetime(2024, 1, 1, tzinfo=app.UTC_TZ).timestamp()) * 1000
+    aleatorio = random.Random(42)
+    for i in range(n):
+        ts = inicio_ms + i * 60_000
+        tema = aleatorio.choice(TEMAS)
+        yield ts, f"Pergunta {i} sobre {tema}", [f"opção {tema} {j}" for j in range(4)]
+
+
+def _preparar(backend, caminho, n):
+    recursos.reiniciar(caminho, backend)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    inicio = time.perf_counter()
+    if backend == "sqlite":
+        # Inserção em massa direto na tabela; os triggers alimentam o FTS5
+        with app.get_db_pool().escrita() as conn:
+            conn.executemany(
+                "INSERT INTO historico_enquetes (sala, ts_ms, pergunta, opcoes_json, votos_json, total_votos) "
+                "VALUES (?, ?, ?, ?, '[0, 0, 0, 0]', 0)",
+                ((app.SALA_PADRAO, ts, pergunta, json.dumps(opcoes)) for ts, pergunta, opcoes in _gerar(n)),
+            )
+            conn.commit()
+    else:
+        armazenamento = app.get_armazenamento()
+        for _, pergunta, opcoes in _gerar(n):
+            armazenamento.adicionar_ao_historico(enquete_id, pergunta, opcoes, [0, 0, 0, 0], 0)
+    return enquete_id, time.perf_counter() - inicio
+
+
+def _medir(fn, repeticoes=50):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = fn()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def _offset(enquete_id, deslocamento):
+    with app.get_db_pool().leitura() as conn:
+        return conn.execute(
+            "SELECT id, pergunta, ts_ms FROM historico_enquetes WHERE sala = ? "
+            "ORDER BY ts_ms DESC, id DESC LIMIT ? OFFSET ?",
+            (app.SALA_PADRAO, app.HISTORICO_PAGE_SIZE, deslocamento),
+        ).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Histórico: paginação por cursor e busca textual")
+    parser.add_argument("--enquetes", type=int, default=100_000)
+    parser.add_argument("--backend", nargs="+", default=["sqlite", "kv"], choices=["sqlite", "kv"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backend:
+            enquete_id, carga = _preparar(backend, os.path.join(tmp, f"{backend}.db"), args.enquetes)
+            print(f"[{backend}] {args.enquetes} enquetes arquivadas em {carga:.1f}s")
+            armazenamento = app.get_armazenamento()
+            ms, _ = _medir(lambda: armazenamento.carregar_historico(enquete_id, app.HISTORICO_PAGE_SIZE))
+            print(f"  primeira página            : {ms:.3f} ms")
+            # Cursor perto do fim do arquivo (a página mais funda possível):
+            # os ids são sequenciais a partir de 1, em ordem cronológica
+            profundidade = args.enquetes - app.HISTORICO_PAGE_SIZE
+            id_cursor = args.enquetes - profundidade + 1
+            cursor = (app.db_carregar_enquete_historico_por_id(id_cursor)["ts_ms"], id_cursor)
+            ms, _ = _medir(lambda: armazenamento.carregar_historico(enquete_id, app.HISTORICO_PAGE_SIZE, cursor))
+            print(f"  após {profundidade:>7} itens (cursor): {ms:.3f} ms")
+            if backend == "sqlite":
+                ms, _ = _medir(lambda: _offset(enquete_id, profundidade), repeticoes=5)
+                print(f"  após {profundidade:>7} itens (OFFSET): {ms:.3f} ms")
+            for busca in ("física", "pergunta 4242"):
+                termos = app.termos_busca(busca)
+                ms, achados = _medir(
+                    lambda: armazenamento.buscar_historico(enquete_id, termos, app.HISTORICO_PAGE_SIZE)
+                )
+                print(f"  busca {busca!r:<19}: {ms:.3f} ms ({len(achados)} na 1ª página)")
+            # Mesmas leituras pela fachada: a primeira chamada preenche o cache
+            ms, _ = _medir(lambda: app.db_carregar_historico(enquete_id, busca="física"), repeticoes=1000)
+            print(f"  busca via CacheHistorico   : {ms:.4f} ms")
+            ms, _ = _medir(lambda: app.db_carregar_historico(enquete_id, antes=cursor), repeticoes=1000)
+            print(f"  cursor via CacheHistorico  : {ms:.4f} ms")
+            ms, _ = _medir(lambda: armazenamento.carregar_enquete_historico(id_cursor))
+            print(f"  enquete arquivada (backend): {ms:.3f} ms")
+            ms, _ = _medir(lambda: app.db_carregar_enquete_historico_renderizada(id_cursor), repeticoes=1000)
+            print(f"  enquete renderizada (cache): {ms:.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Custo da instrumentação: chamadas de uma função db_* com o cache quente
+# (o caso mais sensível: a função em si custa poucos µs) sem medição, que é
+# o que METRICS_ENABLED=0 executa (medir devolve a própria função), e com o
+# invólucro de medição (contador, histograma e janela de taxa).
+#
+# Uso: python benchmarks/bench_metricas.py [--chamadas 200000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _preparar(caminho):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_salvar_dados_enquete(enquete_id, "Benchmark?", ["a", "b"])
+    app.db_limpar_votos_e_cookies(enquete_id, 2)
+    return enquete_id
+
+
+def _medir(fn, chamadas):
+    inicio = time.perf_counter()
+    for _ in range(chamadas):
+        fn()
+    return (time.perf_counter() - inicio) / chamadas * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead da instrumentação de métricas")
+    parser.add_argument("--chamadas", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        enquete_id = _preparar(os.path.join(tmp, "metricas.db"))
+        # As db_* já podem vir decoradas (METRICS_ENABLED=1 no ambiente)
+        snapshot = getattr(app.db_carregar_snapshot, "__wrapped__", app.db_carregar_snapshot)
+        medido = app._envolver_medicao(snapshot)
+        snapshot(enquete_id)
+        print(f"db_carregar_snapshot com cache quente, {args.chamadas} chamadas")
+        sem = _medir(lambda: snapshot(enquete_id), args.chamadas)
+        com = _medir(lambda: medido(enquete_id), args.chamadas)
+        print(f"  desligado (função original): {sem:6.2f} µs/chamada")
+        print(f"  ligado (medida)            : {com:6.2f} µs/chamada (+{com - sem:.2f} µs)")
+        print(f"  exportação Prometheus      : {_medir(app.get_metricas().texto_prometheus, 1000):6.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Payload por rerun: bytes e elementos que cada tela envia ao navegador,
+# medidos pelo hook do app (PAYLOAD_METRICS=1) dirigindo o app_router pelo
+# AppTest. O fragmento de resultados é o que se repete a cada atualização ao
+# vivo; o run completo, a cada navegação.
+#
+# Uso: python benchmarks/bench_payload.py [--opcoes 2 6 10] [--alunos 20]
+import argparse
+import contextlib
+import io
+import os
+import re
+import tempfile
+import time
+
+os.environ["PAYLOAD_METRICS"] = "1"
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+import streamlit_js_eval  # noqa: E402
+from streamlit import config  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+# O IP do navegador vem de um componente JS; aqui cada sessão já nasce com o seu
+streamlit_js_eval.streamlit_js_eval = lambda **kwargs: None
+# Como no .streamlit/config.toml do app (o AppTest não o lê)
+config.set_option("browser.gatherUsageStats", False)
+
+LINHA = re.compile(r"\[payload\] (\w+): (\d+) bytes, (\d+) elementos")
+
+
+def _sessao(ip, modo=None):
+    at = AppTest.from_file(APP, default_timeout=30)
+    at.session_state["client_public_ip"] = ip
+    if modo:
+        at.session_state["modo"] = modo
+    return at
+
+
+def _medir(at):
+    # O hook reporta no stderr: uma linha por run completo e por fragmento
+    saida = io.StringIO()
+    with contextlib.redirect_stderr(saida):
+        at.run()
+    return {nome: (int(b), int(e)) for nome, b, e in LINHA.findall(saida.getvalue())}
+
+
+def _cenario(num_opcoes, num_alunos):
+    professor = _sessao("10.0.0.1", "professor")
+    professor.run()
+    professor.number_input(key="prof_num_opcoes_selector_v2").set_value(num_opcoes).run()
+    professor.text_input(key="painel_pergunta_db_vfinal").input(f"Enquete com {num_opcoes} opções?")
+    for i in range(num_opcoes):
+        professor.text_input(key=f"painel_opt_db_vfinal_{i}").input(f"Opção número {i + 1}")
+    professor.button[[b.label for b in professor.button].index("Salvar e Ativar Enquete")].click().run()
+    aluno = None
+    for k in range(num_alunos):
+        aluno = _sessao(f"10.1.{k // 250}.{k % 250}")
+        aluno.run()
+        aluno.radio[0].set_value(k % num_opcoes)
+        aluno.button(key="aluno_votar_db_vfinal_cookie").click().run()
+    time.sleep(0.6)
+    medidas = {
+        "aluno: run completo": _medir(aluno).get("app_router"),
+        "aluno: fragmento de resultados": _medir(aluno).get("_fragmento_resultados_aluno"),
+        "professor: run completo": _medir(professor).get("app_router"),
+        "professor: fragmento de resultados": _medir(professor).get("_fragmento_resultados_professor"),
+    }
+    professor.button(key="painel_desativar_db_vfinal").click().run()
+    historico = _sessao("10.0.0.2")
+    historico.query_params["page"] = "historico_view"
+    historico.query_params["enquete_id"] = "1"
+    medidas["histórico: run completo"] = _medir(historico).get("app_router")
+    return medidas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload (bytes/elementos) enviado por rerun")
+    parser.add_argument("--opcoes", type=int, nargs="+", default=[2, 6, 10])
+    parser.add_argument("--alunos", type=int, default=20)
+    args = parser.parse_args()
+
+    for num_opcoes in args.opcoes:
+        # Banco novo por cenário (o app usa DB_NAME relativo ao diretório atual)
+        os.chdir(tempfile.mkdtemp())
+        print(f"{num_opcoes} opções, {args.alunos} votos")
+        with contextlib.redirect_stderr(io.StringIO()):
+            medidas = _cenario(num_opcoes, args.alunos)
+        for tela, medida in medidas.items():
+            if medida:
+                print(f"  {tela:<36}: {medida[0]:>6} bytes, {medida[1]:>3} elementos")
+
+
+if __name__ == "__main__":
+    main()
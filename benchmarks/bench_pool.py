@@ -0,0 +1,79 @@
+# Benchmark do pool de conexões: leituras/s com 1..N threads leitoras enquanto
+# uma thread escritora grava votos sem parar, e as métricas do pool ao final.
+#
+# Uso: python benchmarks/bench_pool.py [--segundos 3] [--leitores 1 4 16] [--pool 8]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _rodada(caminho, num_leitores, tamanho_pool, segundos):
+    app.DB_READER_POOL_SIZE = tamanho_pool
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_limpar_votos_e_cookies(enquete_id, 4)
+    pool = app.get_db_pool()
+
+    parar = threading.Event()
+    leituras = [0] * num_leitores
+    escritas = [0]
+
+    def escritor():
+        i = 0
+        while not parar.is_set():
+            app.db_registrar_voto(enquete_id, i % 4, f"ip-pool-{i}")
+            escritas[0] += 1
+            i += 1
+
+    def leitor(t):
+        # Leitura direta no pool (sem o CacheEstado) para medir só o banco
+        while not parar.is_set():
+            with pool.leitura() as conn:
+                conn.execute(
+                    "SELECT opcao_indice, SUM(contagem) FROM enquete_ativa_votos WHERE enquete_id = ? "
+                    "AND epoca = (SELECT epoca FROM enquete_ativa_definicao WHERE id = ?) GROUP BY opcao_indice",
+                    (enquete_id, enquete_id),
+                ).fetchall()
+            leituras[t] += 1
+
+    threads = [threading.Thread(target=escritor)]
+    threads += [threading.Thread(target=leitor, args=(t,)) for t in range(num_leitores)]
+    for th in threads:
+        th.start()
+    time.sleep(segundos)
+    parar.set()
+    for th in threads:
+        th.join()
+    return sum(leituras) / segundos, escritas[0] / segundos, pool.metricas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leituras/s no pool com um escritor concorrente")
+    parser.add_argument("--segundos", type=float, default=3.0)
+    parser.add_argument("--leitores", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--pool", type=int, default=app.DB_READER_POOL_SIZE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for num_leitores in args.leitores:
+            leituras_s, escritas_s, metricas = _rodada(
+                os.path.join(tmp, f"pool_{num_leitores}.db"), num_leitores, args.pool, args.segundos
+            )
+            print(
+                f"{num_leitores:>3} leitor(es), pool={args.pool}: {leituras_s:,.0f} leituras/s, "
+                f"{escritas_s:,.0f} escritas/s | leitores abertos={metricas['leitores_abertos']}, "
+                f"leituras em espera={metricas['leituras_em_espera']}, "
+                f"espera leitura={metricas['espera_leitura_s']:.3f}s, espera escrita={metricas['espera_escrita_s']:.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Tempo até a primeira pintura e até o id de voto estável de um aluno novo:
+# IP pelo navegador (componente JS + api.ipify.org, o valor só chega num
+# rerun seguinte) x modo proxy confiável (TRUSTED_PROXIES, IP resolvido no
+# servidor já no primeiro run). O app_router roda pelo AppTest; a ida e
+# volta do navegador (fetch ao ipify + retorno do componente) é simulada com
+# --ipify-ms.
+#
+# Uso: python benchmarks/bench_primeira_pintura.py [--alunos 30] [--ipify-ms 250]
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+import streamlit_js_eval  # noqa: E402
+import streamlit.testing.v1.app_test as app_test  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+# O que o componente JS devolve no run atual (None = ainda não respondeu)
+RESPOSTA_JS = [None]
+streamlit_js_eval.streamlit_js_eval = lambda **kwargs: RESPOSTA_JS[0]
+
+# Conexão vista pelo servidor: o AppTest simula o Runtime com um MagicMock;
+# aqui ele passa a devolver a requisição que veio pelo proxy
+CONEXAO = [None]
+_MagicMock = app_test.MagicMock
+
+
+def _runtime_com_conexao(*args, **kwargs):
+    mock = _MagicMock(*args, **kwargs)
+    mock.get_client.side_effect = lambda session_id: SimpleNamespace(request=CONEXAO[0])
+    return mock
+
+
+app_test.MagicMock = _runtime_com_conexao
+
+
+def _aluno(k, modo, ipify_ms):
+    ip = f"198.51.{k // 250}.{k % 250 + 1}"
+    CONEXAO[0] = SimpleNamespace(remote_ip="10.0.0.2", headers={"X-Forwarded-For": ip})
+    RESPOSTA_JS[0] = None
+    at = AppTest.from_file(APP, default_timeout=30)
+    inicio = time.perf_counter()
+    at.run()
+    primeira_pintura = time.perf_counter() - inicio
+    runs = 1
+    if modo == "navegador":
+        # O navegador busca o IP e o componente devolve o valor: novo rerun
+        time.sleep(ipify_ms / 1000)
+        RESPOSTA_JS[0] = ip
+        at.run()
+        runs += 1
+    id_estavel = time.perf_counter() - inicio
+    assert at.session_state["user_voting_id"] == f"ip-{ip}", at.session_state["user_voting_id"]
+    return primeira_pintura, id_estavel, runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo até a primeira pintura: IP pelo navegador x proxy confiável")
+    parser.add_argument("--alunos", type=int, default=30)
+    parser.add_argument("--ipify-ms", type=float, default=250, help="ida e volta simulada do navegador ao ipify")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    print(f"{args.alunos} alunos novos, ida e volta do navegador simulada em {args.ipify_ms:g} ms")
+    for modo in ("navegador", "proxy"):
+        if modo == "proxy":
+            os.environ["TRUSTED_PROXIES"] = "10.0.0.0/8"
+        else:
+            os.environ.pop("TRUSTED_PROXIES", None)
+        _aluno(0, modo, args.ipify_ms)  # aquece o banco e os caches do processo
+        medidas = [_aluno(k, modo, args.ipify_ms) for k in range(1, args.alunos + 1)]
+        pinturas, estaveis, runs = zip(*medidas)
+        print(
+            f"  {modo:<9}: primeira pintura {statistics.median(pinturas) * 1000:7.1f} ms, "
+            f"id de voto estável {statistics.median(estaveis) * 1000:7.1f} ms (medianas), "
+            f"{sum(runs) / len(runs):.0f} run(s) completo(s) por aluno"
+        )
+
+
+if __name__ == "__main__":
+    main()
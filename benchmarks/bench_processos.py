@@ -0,0 +1,155 @@
+# Vários processos no mesmo arquivo SQLite (python app.py servir).
+#
+# 1) Coerência e leituras: um processo vota sem parar na sala "a" enquanto
+#    outro renderiza as salas "a" e "b" (snapshot, "já votou?" e histórico)
+#    a cada poucos ms, como as sessões dele fariam; a sala "b" já tem
+#    --votantes votantes. Compara as VersoesCompartilhadas com o PRAGMA
+#    data_version espaçado de antes (que recarrega o índice de votantes
+#    inteiro a cada mudança vista): leituras no banco por render de cada sala,
+#    tempo de render e quanto tempo o último voto leva para aparecer no outro
+#    processo.
+# 2) Vazão: o teste de carga (loadtest.py) com 1, 2, 4 e 8 processos no mesmo
+#    banco, reportando reruns/s, latência do voto e quantos alunos veem, no
+#    fim, o total com os votos de todos os processos.
+#
+# Uso: python benchmarks/bench_processos.py [--votos 200] [--votantes 100000] [--alunos 48] [--processos 1 2 4 8]
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+MODOS = (("VersoesCompartilhadas", True), ("PRAGMA data_version", False))
+
+
+def _preparar(caminho, compartilhadas):
+    app.SHARED_VERSIONS = compartilhadas
+    recursos.reiniciar(caminho)
+
+
+def _escritor(caminho, compartilhadas, num_votos, pronto, fim):
+    _preparar(caminho, compartilhadas)
+    enquete_id = app.db_obter_enquete_id("a", criar=True)
+    pronto.wait()
+    for i in range(num_votos):
+        app.db_registrar_voto(enquete_id, i % 2, f"ip-10.0.{i // 256}.{i % 256}")
+        time.sleep(0.005)
+    fim.value = time.time()
+
+
+def _popular_votantes(enquete_id, num_votantes):
+    with app.get_db_pool().escrita() as conn:
+        epoca = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_ts_ms) "
+            "VALUES (?, ?, ?, 1704067200000)",
+            ((enquete_id, epoca, app.codificar_votante(f"sessao-{uuid.UUID(int=i)}")) for i in range(num_votantes)),
+        )
+        conn.commit()
+    app.get_indice_votantes().marcar_obsoleto()
+
+
+def _coerencia(caminho, compartilhadas, num_votos, num_votantes):
+    _preparar(caminho, compartilhadas)
+    salas = {sala: app.db_obter_enquete_id(sala, criar=True) for sala in ("a", "b")}
+    for enquete_id in salas.values():
+        app.db_ativar_enquete(enquete_id, "Pergunta?", ["sim", "não"])
+    _popular_votantes(salas["b"], num_votantes)
+    ctx = multiprocessing.get_context("spawn")
+    pronto, fim = ctx.Event(), ctx.Value("d", 0.0)
+    escritor = ctx.Process(target=_escritor, args=(caminho, compartilhadas, num_votos, pronto, fim))
+    escritor.start()
+    # Índice de votantes e caches já aquecidos, como num processo em uso
+    for enquete_id in salas.values():
+        app.db_carregar_snapshot(enquete_id, "ip-192.0.2.1")
+    pool = app.get_db_pool()
+    leituras = {sala: 0 for sala in salas}
+    tempos = []
+    renders = 0
+    visto_em = None
+    pronto.set()
+    while visto_em is None or not fim.value:
+        for sala, enquete_id in salas.items():
+            antes = pool.metricas()["leituras"]
+            inicio = time.perf_counter()
+            snapshot = app.db_carregar_snapshot(enquete_id, "ip-192.0.2.1")
+            app.db_carregar_historico(enquete_id)
+            tempos.append(time.perf_counter() - inicio)
+            leituras[sala] += pool.metricas()["leituras"] - antes
+            if sala == "a" and snapshot["total_votos"] == num_votos and visto_em is None:
+                visto_em = time.time()
+        renders += 1
+        if visto_em is None and fim.value and time.time() - fim.value > 5:
+            break
+        time.sleep(0.005)
+    escritor.join()
+    atraso = (visto_em - fim.value) * 1000 if visto_em else float("inf")
+    tempos.sort()
+    return {
+        "leituras": {sala: n / renders for sala, n in leituras.items()},
+        "p50_ms": tempos[len(tempos) // 2] * 1000,
+        "p99_ms": tempos[int(len(tempos) * 0.99)] * 1000,
+        "atraso_ms": max(0.0, atraso),
+        "renders": renders,
+    }
+
+
+def _rodada_de_carga(num_alunos, processos, resultados):
+    import loadtest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        resultados.put(loadtest.executar(num_alunos, processos, rajada=4, refreshes=2, diretorio=tmp))
+
+
+def _vazao(num_alunos, lista_processos):
+    # Cada rodada num processo novo: o professor do loadtest roda no processo
+    # que chama executar(), e os recursos em cache dele apontariam para o
+    # banco da rodada anterior
+    ctx = multiprocessing.get_context("spawn")
+    for processos in lista_processos:
+        resultados = ctx.Queue()
+        rodada = ctx.Process(target=_rodada_de_carga, args=(num_alunos, processos, resultados))
+        rodada.start()
+        r = resultados.get()
+        rodada.join()
+        print(
+            f"  {processos} processo(s): {r['reruns_por_s']:6.1f} reruns/s, voto p50 {r['voto_p50_ms']:6.0f} ms "
+            f"p95 {r['voto_p95_ms']:6.0f} ms, {r['votos_aceitos']}/{num_alunos} votos, "
+            f"total coerente em {r['totais_coerentes']}/{r['totais_vistos']} alunos, "
+            f"{r['erros_lock']} erros de lock, RSS {r['rss_mb']:.0f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vários processos no mesmo SQLite: coerência dos caches e vazão")
+    parser.add_argument("--votos", type=int, default=200)
+    parser.add_argument("--votantes", type=int, default=100_000, help="votantes já gravados na sala b")
+    parser.add_argument("--alunos", type=int, default=48)
+    parser.add_argument("--processos", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"coerência: {args.votos} votos em outro processo na sala a; sala b parada, com {args.votantes} votantes")
+    with tempfile.TemporaryDirectory() as tmp:
+        for nome, compartilhadas in MODOS:
+            r = _coerencia(os.path.join(tmp, f"{compartilhadas}.db"), compartilhadas, args.votos, args.votantes)
+            print(
+                f"  {nome:<21}: leituras por render sala a {r['leituras']['a']:.2f}, sala b {r['leituras']['b']:.2f}; "
+                f"render p50 {r['p50_ms']:.2f} ms, p99 {r['p99_ms']:.1f} ms; "
+                f"último voto visível em {r['atraso_ms']:.1f} ms ({r['renders']} renders)"
+            )
+
+    print(f"vazão: {args.alunos} alunos, {os.cpu_count()} CPUs")
+    _vazao(args.alunos, args.processos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Reset dos votos com muitos votantes: DELETE das linhas no lock do escritor
+# (como era) x abrir uma época nova e deixar a PurgaEpocas apagar as antigas
+# em lotes. Um aluno continua votando o tempo todo; mede-se a duração do
+# reset e a pior latência de voto até as linhas antigas sumirem.
+#
+# Uso: python benchmarks/bench_reset.py [--votantes 100000] [--lote 500]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+NUM_OPCOES = 4
+
+
+def _preparar(caminho, num_votantes):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.get_armazenamento().transicionar_enquete(enquete_id, ativa=True, pergunta="Reset?", opcoes_lista=list("abcd"))
+    with app.get_db_pool().escrita() as conn:
+        epoca = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO enquete_ativa_cookie_votantes (enquete_id, epoca, user_voting_id, vote_ts_ms) "
+            "VALUES (?, ?, ?, 1704067200000)",
+            ((enquete_id, epoca, app.codificar_votante(f"sessao-{uuid.UUID(int=i)}")) for i in range(num_votantes)),
+        )
+        conn.commit()
+    return enquete_id
+
+
+def _reset_com_delete(enquete_id):
+    # Referência: o reset de antes, apagando tudo na mesma transação
+    with app.get_db_pool().escrita() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        epoca = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()[0]
+        for tabela, _ in app._TABELAS_POR_EPOCA:
+            conn.execute(f"DELETE FROM {tabela} WHERE enquete_id = ?", (enquete_id,))
+        conn.executemany(
+            "INSERT INTO enquete_ativa_votos (enquete_id, epoca, opcao_indice, fatia, contagem) VALUES (?, ?, ?, ?, 0)",
+            ((enquete_id, epoca, i, fatia) for i in range(NUM_OPCOES) for fatia in range(app.VOTE_COUNTER_SHARDS)),
+        )
+        conn.commit()
+
+
+def _reset_por_epoca(enquete_id):
+    app.get_armazenamento().limpar_votos(enquete_id, NUM_OPCOES)
+
+
+def _linhas_antigas(enquete_id):
+    with app.get_db_pool().leitura() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM enquete_ativa_cookie_votantes WHERE enquete_id = ? "
+            "AND epoca < (SELECT epoca FROM enquete_ativa_definicao WHERE id = ?)",
+            (enquete_id, enquete_id),
+        ).fetchone()[0]
+
+
+def _medir(resetar, enquete_id):
+    armazenamento = app.get_armazenamento()
+    parar = threading.Event()
+    latencias = []
+
+    def aluno():
+        n = 0
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            armazenamento.registrar_voto(enquete_id, n % NUM_OPCOES, f"ip-novo-{n}")
+            latencias.append(time.perf_counter() - inicio)
+            n += 1
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=aluno)
+    thread.start()
+    time.sleep(0.2)
+    inicio = time.perf_counter()
+    resetar(enquete_id)
+    duracao_reset = time.perf_counter() - inicio
+    while _linhas_antigas(enquete_id):
+        time.sleep(0.01)
+    duracao_limpeza = time.perf_counter() - inicio
+    time.sleep(0.2)
+    parar.set()
+    thread.join()
+    return duracao_reset, duracao_limpeza, max(latencias), len(latencias)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reset dos votos: DELETE x época + purga em lotes")
+    parser.add_argument("--votantes", type=int, default=100_000)
+    parser.add_argument("--lote", type=int, default=app.EPOCH_PURGE_BATCH_ROWS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.votantes} votantes na enquete, purga em lotes de {args.lote}")
+        for nome, resetar in (("DELETE", _reset_com_delete), ("época + purga", _reset_por_epoca)):
+            enquete_id = _preparar(os.path.join(tmp, f"{nome}.db"), args.votantes)
+            app.get_purga_epocas().lote = args.lote
+            reset, limpeza, pior, votos = _medir(resetar, enquete_id)
+            print(
+                f"  {nome:<14}: reset {reset * 1000:7.1f} ms, linhas antigas apagadas em {limpeza * 1000:7.1f} ms, "
+                f"pior latência de voto {pior * 1000:6.1f} ms ({votos} votos)"
+            )
+
+
+if __name__ == "__main__":
+    main()
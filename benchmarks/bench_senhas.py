@@ -0,0 +1,135 @@
+# Login sob rajada: N tentativas simultâneas com o hash na própria thread de
+# cada sessão (como era) x no PoolSenhas, enquanto uma thread simula os reruns
+# das outras sessões (Python puro, preso ao GIL). Mede a latência desses
+# reruns durante a rajada, quantas tentativas o pool recusou por estar
+# lotado e o custo de uma tentativa barrada pelo LimitadorTentativas. Antes,
+# o custo de um hash em cada configuração de KDF.
+#
+# Uso: python benchmarks/bench_senhas.py [--tentativas 32] [--workers 2]
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+KDFS = (
+    ("pbkdf2", "PASSWORD_PBKDF2_ITERATIONS", 100_000),
+    ("pbkdf2", "PASSWORD_PBKDF2_ITERATIONS", 300_000),
+    ("scrypt", "PASSWORD_SCRYPT_N", 2**14),
+    ("scrypt", "PASSWORD_SCRYPT_N", 2**15),
+)
+
+
+def _custo_kdfs():
+    armazenado = app.hash_password("senha-do-professor")
+    for kdf, constante, valor in KDFS:
+        app.PASSWORD_KDF = kdf
+        setattr(app, constante, valor)
+        inicio = time.perf_counter()
+        novo = app.hash_password("senha-do-professor")
+        ms = (time.perf_counter() - inicio) * 1000
+        # O hash gravado antes continua válido com a configuração nova
+        assert app.verificar_senha("senha-do-professor", armazenado) and app.verificar_senha("senha-do-professor", novo)
+        print(f"  {kdf:<7} {constante.split('_')[-1].lower():<10} = {valor:>7}: {ms:7.1f} ms por hash")
+    app.PASSWORD_KDF, app.PASSWORD_PBKDF2_ITERATIONS = "pbkdf2", 100_000
+
+
+def _rerun():
+    # ~1 ms de Python puro, como um rerun leve de outra sessão
+    total = 0
+    for i in range(20_000):
+        total += i * i
+    return total
+
+
+def _rajada(verificar, num_tentativas):
+    armazenado = app.hash_password("senha-do-professor")
+    parar = threading.Event()
+    latencias = []
+    resultados = []
+
+    def outras_sessoes():
+        while not parar.is_set():
+            inicio = time.perf_counter()
+            _rerun()
+            latencias.append(time.perf_counter() - inicio)
+
+    def tentativa(i):
+        resultados.append(verificar("senha-errada", armazenado))
+
+    base = []
+    for _ in range(200):
+        inicio = time.perf_counter()
+        _rerun()
+        base.append(time.perf_counter() - inicio)
+    thread = threading.Thread(target=outras_sessoes)
+    thread.start()
+    inicio = time.perf_counter()
+    tentativas = [threading.Thread(target=tentativa, args=(i,)) for i in range(num_tentativas)]
+    for th in tentativas:
+        th.start()
+    for th in tentativas:
+        th.join()
+    duracao = time.perf_counter() - inicio
+    parar.set()
+    thread.join()
+    latencias.sort()
+    return {
+        "duracao": duracao,
+        "base_p50": statistics.median(base) * 1000,
+        "p50": latencias[len(latencias) // 2] * 1000,
+        "p95": latencias[int(len(latencias) * 0.95)] * 1000,
+        "reruns": len(latencias),
+        "recusadas": sum(r is None for r in resultados),
+    }
+
+
+def _no_pool(pool):
+    # A sessão não espera o Future (um fragmento confere depois); aqui a
+    # thread da tentativa espera, para medir a rajada inteira
+    def verificar(senha, armazenado):
+        futuro = pool.submeter(app.verificar_senha, senha, armazenado)
+        return None if futuro is None else futuro.result()
+
+    return verificar
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hash de senha: thread do script x PoolSenhas, e limitador de login")
+    parser.add_argument("--tentativas", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=app.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    print(f"custo de um hash ({os.cpu_count()} CPUs):")
+    _custo_kdfs()
+
+    pool = app.PoolSenhas(workers=args.workers)
+    print(f"rajada de {args.tentativas} tentativas simultâneas, reruns de outras sessões em paralelo:")
+    for nome, verificar in (
+        ("na thread do script", app.verificar_senha),
+        (f"PoolSenhas ({args.workers} workers)", _no_pool(pool)),
+    ):
+        r = _rajada(verificar, args.tentativas)
+        print(
+            f"  {nome:<24}: rajada em {r['duracao'] * 1000:7.1f} ms, rerun p50 {r['p50']:6.2f} ms "
+            f"(sem rajada {r['base_p50']:.2f} ms), p95 {r['p95']:6.2f} ms, {r['reruns']} reruns, "
+            f"{r['recusadas']} recusadas (pool lotado)"
+        )
+
+    limitador = app.LimitadorTentativas()
+    for _ in range(limitador.maximo):
+        limitador.reservar("ip-203.0.113.7")
+    repeticoes = 100_000
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        limitador.reservar("ip-203.0.113.7")
+    print(f"tentativa barrada pelo limitador: {(time.perf_counter() - inicio) / repeticoes * 1e6:.2f} µs, sem hash")
+
+
+if __name__ == "__main__":
+    main()
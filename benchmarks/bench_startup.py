@@ -0,0 +1,60 @@
+# Benchmark de partida a frio: tempo de `import app` e de `_init_db_once()`
+# num processo Python novo, com banco inexistente (primeira execução) e com
+# banco já migrado (partida a frio do app "dormindo" no Streamlit Cloud).
+#
+# Uso: python benchmarks/bench_startup.py [--repeticoes 5]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SONDA = """
+import json, sys, time
+t0 = time.perf_counter()
+sys.path.insert(0, {raiz!r})
+import app
+t1 = time.perf_counter()
+app.DB_NAME = {db!r}
+app._init_db_once()
+t2 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "init_db_s": t2 - t1, "modulos": len(sys.modules)}}))
+"""
+
+
+def _medir(db):
+    saida = subprocess.run(
+        [sys.executable, "-c", _SONDA.format(raiz=RAIZ, db=db)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de partida: import do app e init do banco")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        frios, mornos = [], []
+        for i in range(args.repeticoes):
+            db = os.path.join(tmp, f"startup_{i}.db")
+            frios.append(_medir(db))  # banco novo: cria o schema e semeia a senha
+            mornos.append(_medir(db))  # banco existente: só lê PRAGMA user_version
+        for nome, medidas in (("banco novo", frios), ("banco migrado", mornos)):
+            imp = statistics.median(m["import_s"] for m in medidas) * 1000
+            init = statistics.median(m["init_db_s"] for m in medidas) * 1000
+            print(
+                f"{nome:>14}: import app {imp:7.1f} ms | _init_db_once {init:7.1f} ms | "
+                f"{medidas[0]['modulos']} módulos carregados"
+            )
+
+
+if __name__ == "__main__":
+    main()
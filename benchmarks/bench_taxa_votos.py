@@ -0,0 +1,81 @@
+# Benchmark do ritmo de votação: custo de montar a série de votos/segundo a
+# partir do log bruto de eventos x baldes compactados, e da agregação
+# vetorizada (NumPy/pandas) que alimenta o gráfico.
+#
+# Uso: python benchmarks/bench_taxa_votos.py [--votos 200000] [--minutos 45]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+OPCOES = ["a", "b", "c", "d"]
+
+
+def _preparar(caminho, votos, minutos):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_salvar_dados_enquete(enquete_id, "Benchmark?", OPCOES)
+    app.db_limpar_votos_e_cookies(enquete_id, len(OPCOES))
+    # Eventos espalhados pela duração da enquete, direto na tabela do log
+    inicio_ms = int(time.time() * 1000) - minutos * 60_000
+    aleatorio = random.Random(42)
+    with app.get_db_pool().escrita() as conn:
+        epoca = conn.execute("SELECT epoca FROM enquete_ativa_definicao WHERE id = ?", (enquete_id,)).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO votos_eventos (enquete_id, epoca, ts_ms, opcao_indice) VALUES (?, ?, ?, ?)",
+            (
+                (enquete_id, epoca, inicio_ms + aleatorio.randrange(minutos * 60_000), aleatorio.randrange(len(OPCOES)))
+                for _ in range(votos)
+            ),
+        )
+        conn.commit()
+    return enquete_id
+
+
+def _medir(fn, repeticoes=20):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        resultado = fn()
+    return (time.perf_counter() - inicio) / repeticoes * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ritmo de votação: log bruto x baldes compactados")
+    parser.add_argument("--votos", type=int, default=200_000)
+    parser.add_argument("--minutos", type=int, default=45)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        enquete_id = _preparar(os.path.join(tmp, "taxa.db"), args.votos, args.minutos)
+        armazenamento = app.get_armazenamento()
+        print(f"{args.votos} votos em {args.minutos} min")
+
+        ms, baldes = _medir(lambda: armazenamento.carregar_taxa_votos(enquete_id), repeticoes=5)
+        print(f"  leitura sem compactar (log bruto): {ms:8.2f} ms ({len(baldes)} baldes)")
+
+        with app.get_db_pool().escrita() as conn:
+            inicio = time.perf_counter()
+            armazenamento._compactar_eventos(conn)
+            conn.commit()
+            print(f"  compactação do log              : {(time.perf_counter() - inicio) * 1000:8.2f} ms")
+
+        ms, baldes = _medir(lambda: armazenamento.carregar_taxa_votos(enquete_id))
+        print(f"  leitura dos baldes compactados  : {ms:8.2f} ms ({len(baldes)} baldes)")
+
+        ms, taxa = _medir(lambda: app.serie_taxa_votos(baldes, OPCOES))
+        print(f"  série NumPy/pandas              : {ms:8.2f} ms ({len(taxa['serie'])} pontos, passo {taxa['passo']}s)")
+
+        app.db_carregar_taxa_votos(enquete_id, OPCOES)
+        ms, _ = _medir(lambda: app.db_carregar_taxa_votos(enquete_id, OPCOES), repeticoes=1000)
+        print(f"  série via CacheEstado (refresh) : {ms:8.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# Transições do ciclo de vida (ativar, desativar, arquivar e reiniciar) em
+# passos separados, como o painel fazia (até quatro commits), x numa única
+# transação. Duas checagens, em SQLite e no backend chave-valor:
+#  - leitores concorrentes (snapshot direto no backend, como os alunos sem o
+#    cache) nunca podem ver estado misto: pergunta nova com votos da anterior
+#    ou enquete inativa com votos;
+#  - com votos chegando durante as transições, todo voto aceito tem de estar
+#    no histórico ou na enquete em curso (nada se perde entre o arquivo e o
+#    reset).
+# Sai com código 1 se a versão atômica falhar em qualquer uma.
+#
+# Uso: python benchmarks/bench_transicoes.py [--transicoes 60] [--leitores 4]
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+NUM_OPCOES = 3
+
+
+def _preparar(backend, caminho):
+    recursos.reiniciar(caminho, backend)
+    return app.get_armazenamento(), app.db_obter_enquete_id(app.SALA_PADRAO)
+
+
+def _opcoes(k):
+    return [f"opção {i} da pergunta {k}" for i in range(NUM_OPCOES)]
+
+
+def _em_passos(armazenamento, enquete_id, ativa, pergunta=None, opcoes_lista=None):
+    # O fluxo antigo do painel: lê, arquiva, grava definição, status e zera
+    # os votos, cada passo com o seu commit
+    dados = armazenamento.carregar_dados_enquete(enquete_id)
+    if armazenamento.carregar_enquete_ativa(enquete_id) and dados["pergunta"].strip():
+        resultados = armazenamento.carregar_resultados(enquete_id, len(dados["opcoes"]))
+        armazenamento.adicionar_ao_historico(
+            enquete_id, dados["pergunta"], dados["opcoes"], resultados["votos"], resultados["total_votos"]
+        )
+    if pergunta is not None:
+        armazenamento.salvar_dados_enquete(enquete_id, pergunta, opcoes_lista)
+    if ativa is not None:
+        armazenamento.salvar_enquete_ativa(enquete_id, ativa)
+    armazenamento.limpar_votos(enquete_id, len(opcoes_lista or dados["opcoes"]))
+
+
+def _atomica(armazenamento, enquete_id, ativa, pergunta=None, opcoes_lista=None):
+    armazenamento.transicionar_enquete(enquete_id, ativa=ativa, pergunta=pergunta, opcoes_lista=opcoes_lista)
+
+
+def _misto(snapshot):
+    # Na fase k só se vota na opção k % NUM_OPCOES da "Pergunta k"
+    if not snapshot["ativa"]:
+        return snapshot["total_votos"] > 0
+    k = int(snapshot["pergunta"].split()[-1])
+    return snapshot["total_votos"] != snapshot["votos"][k % NUM_OPCOES]
+
+
+def _rodar(transicionar, armazenamento, enquete_id, num_transicoes, num_leitores, pausar_votos):
+    fase = {"k": 0, "ativa": False}
+    lock_votos = threading.Lock()
+    parar = threading.Event()
+    leituras, mistos, aceitos = [0] * num_leitores, [0] * num_leitores, [0]
+
+    def leitor(r):
+        while not parar.is_set():
+            if _misto(armazenamento.carregar_snapshot(enquete_id)):
+                mistos[r] += 1
+            leituras[r] += 1
+
+    def votante():
+        n = 0
+        while not parar.is_set():
+            # Com pausar_votos, nenhum voto cruza uma transição: o que os
+            # leitores acusarem vem só da própria transição
+            with lock_votos if pausar_votos else contextlib.nullcontext():
+                k, ativa = fase["k"], fase["ativa"]
+                if ativa and armazenamento.registrar_voto(enquete_id, k % NUM_OPCOES, f"votante-{n}"):
+                    aceitos[0] += 1
+            n += 1
+
+    threads = [threading.Thread(target=leitor, args=(r,)) for r in range(num_leitores)]
+    threads.append(threading.Thread(target=votante))
+    for th in threads:
+        th.start()
+    # Duas ativações e então, com os votos pausados, uma desativação; sem
+    # pausa, um "arquivar e reiniciar" (um voto que cruze uma desativação
+    # cairia numa enquete inativa e seria zerado na próxima ativação)
+    duracoes = []
+    for k in range(1, num_transicoes + 1):
+        time.sleep(0.005)
+        with lock_votos if pausar_votos else contextlib.nullcontext():
+            inicio = time.perf_counter()
+            if k % 3:
+                transicionar(armazenamento, enquete_id, True, f"Pergunta {k}", _opcoes(k))
+                fase.update(k=k, ativa=True)
+            elif pausar_votos:
+                transicionar(armazenamento, enquete_id, False)
+                fase.update(ativa=False)
+            else:
+                transicionar(armazenamento, enquete_id, None)
+            duracoes.append(time.perf_counter() - inicio)
+    parar.set()
+    for th in threads:
+        th.join()
+
+    # Todo voto aceito está no histórico ou na enquete em curso
+    arquivados = sum(item["total_votos"] for item in armazenamento.exportar_historico(None, 0, 1_000_000))
+    em_curso = armazenamento.carregar_snapshot(enquete_id)["total_votos"]
+    return {
+        "leituras": sum(leituras),
+        "mistos": sum(mistos),
+        "ms": 1000 * sum(duracoes) / len(duracoes),
+        "perdidos": aceitos[0] - arquivados - em_curso,
+        "aceitos": aceitos[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transições do ciclo de vida: em passos x numa única transação")
+    parser.add_argument("--transicoes", type=int, default=60)
+    parser.add_argument("--leitores", type=int, default=4)
+    args = parser.parse_args()
+
+    # Trocas de thread bem mais frequentes que os 5 ms padrão, para os
+    # leitores caírem também no meio dos passos curtos do backend em memória
+    sys.setswitchinterval(1e-5)
+    falhou = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("sqlite", "kv"):
+            for nome, transicionar in (("em passos", _em_passos), ("atômica", _atomica)):
+                armazenamento, enquete_id = _preparar(backend, os.path.join(tmp, f"{backend}-{nome}-leitura.db"))
+                leitura = _rodar(transicionar, armazenamento, enquete_id, args.transicoes, args.leitores, True)
+                armazenamento, enquete_id = _preparar(backend, os.path.join(tmp, f"{backend}-{nome}-votos.db"))
+                votos = _rodar(transicionar, armazenamento, enquete_id, args.transicoes, args.leitores, False)
+                ok = leitura["mistos"] == 0 and votos["perdidos"] == 0
+                if transicionar is _atomica and not ok:
+                    falhou = True
+                print(
+                    f"{backend:>6} {nome:<9}: {leitura['ms']:6.2f} ms/transição | "
+                    f"{leitura['mistos']:>5}/{leitura['leituras']} snapshots mistos | "
+                    f"{votos['perdidos']:>4}/{votos['aceitos']} votos perdidos -> {'OK' if ok else 'FALHOU'}"
+                )
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
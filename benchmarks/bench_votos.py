@@ -0,0 +1,69 @@
+# Benchmark de ingestão de votos: caminho por voto (db_registrar_voto, um
+# commit por voto) x fila com group commit (FilaVotos).
+#
+# Uso: python benchmarks/bench_votos.py [--votos 3000] [--threads 32]
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+
+def _preparar_banco(caminho, num_opcoes):
+    recursos.reiniciar(caminho)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_limpar_votos_e_cookies(enquete_id, num_opcoes)
+    return enquete_id
+
+
+def _disparar(registrar, enquete_id, total_votos, num_threads, num_opcoes):
+    # Cada thread simula uma sessão do Streamlit clicando em "Votar"
+    por_thread = total_votos // num_threads
+    aceitos = [0] * num_threads
+    barreira = threading.Barrier(num_threads + 1)
+
+    def worker(t):
+        barreira.wait()
+        for i in range(por_thread):
+            if registrar(enquete_id, i % num_opcoes, f"ip-bench-{t}-{i}"):
+                aceitos[t] += 1
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+    for th in threads:
+        th.start()
+    barreira.wait()
+    inicio = time.perf_counter()
+    for th in threads:
+        th.join()
+    duracao = time.perf_counter() - inicio
+    return sum(aceitos), por_thread * num_threads, duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Votos/s: caminho por voto x group commit")
+    parser.add_argument("--votos", type=int, default=3000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--opcoes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        enquete_id = _preparar_banco(os.path.join(tmp, "por_voto.db"), args.opcoes)
+        ok, total, dur = _disparar(app.db_registrar_voto, enquete_id, args.votos, args.threads, args.opcoes)
+        print(f"por voto     : {ok}/{total} aceitos em {dur:.2f}s -> {ok / dur:,.0f} votos/s")
+
+        enquete_id = _preparar_banco(os.path.join(tmp, "fila.db"), args.opcoes)
+        fila = app.FilaVotos(app.db_registrar_votos_em_lote)
+        ok, total, dur = _disparar(fila.registrar, enquete_id, args.votos, args.threads, args.opcoes)
+        print(f"group commit : {ok}/{total} aceitos em {dur:.2f}s -> {ok / dur:,.0f} votos/s")
+        resultados = app.db_carregar_resultados(enquete_id, args.opcoes)
+        print(f"contagem gravada: {resultados['total_votos']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+# Teste de carga: N alunos virtuais + 1 professor dirigindo o app_router pelo
+# AppTest do Streamlit (sem servidor, sem navegador, sem rede). Cada aluno é
+# uma sessão com seu próprio user_voting_id; o componente JS que busca o IP
+# no navegador é substituído por um stub, então roda totalmente offline.
+#
+# O AppTest troca o Runtime global a cada run e não pode rodar sessões em
+# paralelo no mesmo processo; a concorrência vem de --processos workers, cada
+# um com sua fatia de alunos, todos no mesmo arquivo SQLite (como réplicas).
+#
+# Fluxo: todos abrem o app -> professor ativa a enquete -> alunos carregam a
+# enquete e votam em rajadas sincronizadas -> auto-refresh -> professor
+# desativa. Reporta reruns/s, latência do voto (p50/p95/p99), erros de lock,
+# RSS somado dos processos e a coerência entre eles: quantos alunos, no último
+# refresh, veem o total com os votos de todos os processos.
+#
+# Uso: python benchmarks/loadtest.py [--alunos 50] [--processos 4] [--rajada 5] [--refreshes 2]
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(RAIZ, "app.py")
+
+
+def _stub_ip_do_navegador():
+    # get_browser_public_ip() chama streamlit_js_eval(); sem navegador o valor
+    # nunca chegaria. O IP de cada aluno vai direto no session_state.
+    import streamlit_js_eval
+
+    streamlit_js_eval.streamlit_js_eval = lambda **kwargs: None
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _nova_sessao(ip, modo=None, timeout=60):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.session_state["client_public_ip"] = ip
+    if modo:
+        at.session_state["modo"] = modo
+    return at
+
+
+def _ip_aluno(i):
+    return f"100.{64 + i // 65536}.{(i // 256) % 256}.{i % 256}"
+
+
+class _Contador:
+    def __init__(self):
+        self.reruns = 0
+        self.erros_lock = 0
+        self.excecoes = 0
+        self.latencias_voto = []
+        self.votos_aceitos = 0
+
+    def rodar(self, at, voto=False):
+        inicio = time.perf_counter()
+        at.run()
+        duracao = time.perf_counter() - inicio
+        self.reruns += 1
+        self.erros_lock += sum(1 for e in at.error if "locked" in e.value or "banco de dados" in e.value)
+        self.excecoes += len(at.exception)
+        if voto:
+            self.latencias_voto.append(duracao)
+            # Depois do st.rerun a tela já é a de "voto registrado"
+            if any("voto foi registrado" in s.value or "Voto registrado" in s.value for s in at.success):
+                self.votos_aceitos += 1
+
+    def votar(self, at):
+        # Sem as VersoesCompartilhadas (SHARED_VERSIONS=0), gravações de outro
+        # processo chegam pelo PRAGMA data_version, checado a cada
+        # DATA_VERSION_CHECK_SECONDS: a enquete pode levar um instante para
+        # aparecer, como no auto-refresh de um aluno real
+        for _ in range(10):
+            if at.radio:
+                break
+            time.sleep(0.2)
+            self.rodar(at)
+        else:
+            return
+        at.radio[0].set_value(random.randrange(len(at.radio[0].options)))
+        at.button(key="aluno_votar_db_vfinal_cookie").click()
+        self.rodar(at, voto=True)
+
+
+def _worker(indices, num_rajadas, rajada, refreshes, diretorio, barreira, resultados, timeout):
+    os.chdir(diretorio)
+    _stub_ip_do_navegador()
+    c = _Contador()
+    alunos = [_nova_sessao(_ip_aluno(i), timeout=timeout) for i in indices]
+    for at in alunos:  # 1) todos abrem o app
+        c.rodar(at)
+    barreira.wait()
+    barreira.wait()  # professor ativou
+    for at in alunos:  # 2) carregam a enquete
+        c.rodar(at)
+    for r in range(num_rajadas):  # 3) rajadas de votos alinhadas entre processos
+        barreira.wait()
+        for at in alunos[r * rajada : (r + 1) * rajada]:
+            c.votar(at)
+    barreira.wait()
+    for _ in range(refreshes):  # 4) auto-refresh
+        for at in alunos:
+            c.rodar(at)
+    totais_vistos = [_total_visto(at) for at in alunos]
+    resultados.put(
+        {
+            "reruns": c.reruns,
+            "erros_lock": c.erros_lock,
+            "excecoes": c.excecoes,
+            "latencias_voto": c.latencias_voto,
+            "votos_aceitos": c.votos_aceitos,
+            "rss_mb": _rss_mb(),
+            "totais_vistos": totais_vistos,
+        }
+    )
+
+
+def _total_visto(at):
+    for md in at.markdown:
+        encontrado = re.search(r"Total de votos: (\d+)", md.value)
+        if encontrado:
+            return int(encontrado.group(1))
+    return None
+
+
+def _percentil(valores, p):
+    if not valores:
+        return float("nan")
+    if len(valores) == 1:
+        return valores[0]
+    return statistics.quantiles(valores, n=100, method="inclusive")[p - 1]
+
+
+def executar(num_alunos, processos, rajada, refreshes, diretorio, timeout=60):
+    _stub_ip_do_navegador()
+    os.chdir(diretorio)
+    fatias = [list(range(p, num_alunos, processos)) for p in range(processos)]
+    num_rajadas = math.ceil(max(len(f) for f in fatias) / rajada)
+    ctx = multiprocessing.get_context("spawn")
+    barreira = ctx.Barrier(processos + 1)
+    resultados = ctx.Queue()
+    workers = [
+        ctx.Process(
+            target=_worker,
+            args=(fatia, num_rajadas, rajada, refreshes, diretorio, barreira, resultados, timeout),
+        )
+        for fatia in fatias
+    ]
+
+    # Workers primeiro: o AppTest troca o __main__ deste processo ao rodar
+    # o script, e o spawn precisa dele intacto para localizar _worker
+    for w in workers:
+        w.start()
+    prof = _nova_sessao("198.51.100.250", modo="professor", timeout=timeout)
+    prof.run()
+    barreira.wait()
+    inicio = time.perf_counter()
+    prof.text_input(key="painel_pergunta_db_vfinal").input("Pergunta do teste de carga?")
+    for i in range(2):
+        prof.text_input(key=f"painel_opt_db_vfinal_{i}").input(f"Opção {i + 1}")
+    next(b for b in prof.button if b.label == "Salvar e Ativar Enquete").click().run()
+    barreira.wait()
+    for _ in range(num_rajadas):
+        barreira.wait()
+    barreira.wait()
+    parciais = [resultados.get() for _ in workers]
+    for w in workers:
+        w.join()
+    duracao = time.perf_counter() - inicio
+    prof.run()
+    botoes = [b for b in prof.button if b.label == "Desativar Enquete"]
+    if botoes:
+        botoes[0].click().run()
+
+    latencias = sorted(x for p in parciais for x in p["latencias_voto"])
+    reruns = sum(p["reruns"] for p in parciais)
+    votos_aceitos = sum(p["votos_aceitos"] for p in parciais)
+    totais = [t for p in parciais for t in p["totais_vistos"] if t is not None]
+    return {
+        "alunos": num_alunos,
+        "processos": processos,
+        "duracao_s": duracao,
+        "reruns": reruns,
+        "reruns_por_s": reruns / duracao,
+        "votos_aceitos": votos_aceitos,
+        "totais_coerentes": sum(t == votos_aceitos for t in totais),
+        "totais_vistos": len(totais),
+        "voto_p50_ms": _percentil(latencias, 50) * 1000,
+        "voto_p95_ms": _percentil(latencias, 95) * 1000,
+        "voto_p99_ms": _percentil(latencias, 99) * 1000,
+        "erros_lock": sum(p["erros_lock"] for p in parciais),
+        "excecoes": sum(p["excecoes"] for p in parciais),
+        "rss_mb": _rss_mb() + sum(p["rss_mb"] for p in parciais),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga offline do app_router via AppTest")
+    parser.add_argument("--alunos", type=int, default=50)
+    parser.add_argument("--processos", type=int, default=4, help="workers votando ao mesmo tempo")
+    parser.add_argument("--rajada", type=int, default=5, help="alunos por worker em cada rajada de votos")
+    parser.add_argument("--refreshes", type=int, default=2, help="rodadas de auto-refresh após a votação")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # DB_NAME é relativo: cada execução usa um banco novo no diretório temporário
+        r = executar(args.alunos, args.processos, args.rajada, args.refreshes, tmp)
+
+    print(f"alunos={r['alunos']} processos={r['processos']} duração={r['duracao_s']:.1f}s")
+    print(f"reruns: {r['reruns']} ({r['reruns_por_s']:.1f}/s)")
+    print(f"votos aceitos: {r['votos_aceitos']}/{r['alunos']}")
+    print(f"total com os votos de todos os processos no último refresh: {r['totais_coerentes']}/{r['totais_vistos']}")
+    print(f"latência do voto: p50={r['voto_p50_ms']:.0f}ms p95={r['voto_p95_ms']:.0f}ms p99={r['voto_p99_ms']:.0f}ms")
+    print(f"erros de lock: {r['erros_lock']}  exceções: {r['excecoes']}  RSS: {r['rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+# Ajuda comum dos benchmarks e testes: aponta o processo para outro
+# banco/backend, descarta todos os singletons do app (pool, caches, índice,
+# filas, registrados por recurso_do_processo) e inicializa o banco novo.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def reiniciar(db_name, backend="sqlite"):
+    app.DB_NAME, app.STORAGE_BACKEND = db_name, backend
+    for recurso in app._RECURSOS_DO_PROCESSO:
+        recurso.clear()
+    return app._init_db_once()
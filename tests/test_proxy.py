@@ -0,0 +1,69 @@
+# IP do cliente atrás de proxies confiáveis (TRUSTED_PROXIES): o
+# X-Forwarded-For é lido da direita para a esquerda e só os saltos de um
+# proxy confiável são atravessados; o que o cliente escreve no próprio
+# cabeçalho nunca vira o IP dele.
+import ipaddress
+import os
+import sys
+
+import pytest
+from tornado.httputil import HTTPHeaders
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+REDES = (ipaddress.ip_network("10.0.0.0/8"), ipaddress.ip_network("127.0.0.1/32"))
+
+
+def _resolver(par, **headers):
+    cabecalhos = HTTPHeaders()
+    for nome, valor in headers.items():
+        for linha in valor if isinstance(valor, list) else [valor]:
+            cabecalhos.add(nome.replace("_", "-"), linha)
+    return app.resolver_ip_por_proxy(par, cabecalhos, REDES)
+
+
+@pytest.mark.parametrize(
+    "par, headers, esperado",
+    [
+        # Par fora dos proxies confiáveis: é o cliente, cabeçalhos ignorados
+        ("198.51.100.9", {"X_Forwarded_For": "203.0.113.7"}, "198.51.100.9"),
+        ("198.51.100.9", {"X_Real_Ip": "203.0.113.7"}, "198.51.100.9"),
+        ("198.51.100.9", {}, "198.51.100.9"),
+        # Um proxy confiável
+        ("10.0.0.1", {"X_Forwarded_For": "203.0.113.7"}, "203.0.113.7"),
+        # O cliente forja saltos à esquerda; o proxy acrescenta o real
+        ("10.0.0.1", {"X_Forwarded_For": "1.1.1.1, 10.9.9.9, 203.0.113.7"}, "203.0.113.7"),
+        # Vários proxies confiáveis em cadeia
+        ("127.0.0.1", {"X_Forwarded_For": "203.0.113.7, 10.0.0.5, 10.0.0.6"}, "203.0.113.7"),
+        # Cada proxy numa linha própria do cabeçalho (como o balanceador)
+        ("127.0.0.1", {"X_Forwarded_For": ["1.1.1.1", "203.0.113.7"]}, "203.0.113.7"),
+        # Todos os saltos confiáveis: fica o mais distante
+        ("10.0.0.1", {"X_Forwarded_For": "10.0.0.5"}, "10.0.0.5"),
+        ("10.0.0.1", {}, "10.0.0.1"),
+        # Par IPv4 mapeado em IPv6 conta como o IPv4
+        ("::ffff:10.0.0.1", {"X_Forwarded_For": "203.0.113.7"}, "203.0.113.7"),
+        ("10.0.0.1", {"X_Forwarded_For": "::ffff:203.0.113.7"}, "203.0.113.7"),
+        # X-Real-Ip só sem X-Forwarded-For
+        ("10.0.0.1", {"X_Real_Ip": "203.0.113.7"}, "203.0.113.7"),
+        ("10.0.0.1", {"X_Real_Ip": "1.1.1.1", "X_Forwarded_For": "203.0.113.7"}, "203.0.113.7"),
+        # Salto inválido antes do cliente: cadeia inválida
+        ("10.0.0.1", {"X_Forwarded_For": "203.0.113.7, lixo"}, None),
+        ("10.0.0.1", {"X_Real_Ip": "lixo"}, None),
+        # Lixo à esquerda do cliente nem chega a ser lido
+        ("10.0.0.1", {"X_Forwarded_For": "lixo, 203.0.113.7"}, "203.0.113.7"),
+        ("lixo", {}, None),
+        (None, {}, None),
+    ],
+)
+def test_resolver_ip_por_proxy(par, headers, esperado):
+    assert _resolver(par, **headers) == esperado
+
+
+def test_cadeia_longa_forjada():
+    forjada = ", ".join(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(10_000))
+    # Saltos confiáveis forjados à esquerda do cliente real não são lidos
+    assert _resolver("10.0.0.1", X_Forwarded_For=f"{forjada}, 203.0.113.7") == "203.0.113.7"
+    # Só confiáveis: o mais distante, sem erro
+    assert _resolver("10.0.0.1", X_Forwarded_For=forjada) == "10.0.0.0"
@@ -0,0 +1,137 @@
+# Hash de senha com KDF e custo gravados junto ("kdf$custo...$sal$hash"),
+# o formato antigo em hex puro, a conversão no login certo e o limitador de
+# tentativas. Custos baixos: o que se testa é o formato, não a força.
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+@pytest.fixture
+def pbkdf2_barato(monkeypatch):
+    monkeypatch.setattr(app, "PASSWORD_KDF", "pbkdf2")
+    monkeypatch.setattr(app, "PASSWORD_PBKDF2_ITERATIONS", 1000)
+
+
+def test_hash_atual(pbkdf2_barato):
+    armazenado = app.hash_password("segredo")
+    assert armazenado.startswith("pbkdf2_sha256$1000$")
+    assert app.verificar_senha("segredo", armazenado)
+    assert not app.verificar_senha("Segredo", armazenado)
+    assert not app.hash_senha_desatualizado(armazenado)
+    # Sal aleatório: a mesma senha gera outro hash
+    assert app.hash_password("segredo") != armazenado
+
+
+def test_hash_legado_em_hex(pbkdf2_barato):
+    legado = hashlib.pbkdf2_hmac("sha256", b"admin123", app.SALT_SECRET.encode(), iterations=100_000).hex()
+    assert app.verificar_senha("admin123", legado)
+    assert not app.verificar_senha("admin1234", legado)
+    assert app.hash_senha_desatualizado(legado)
+
+
+def test_troca_de_custo(monkeypatch, pbkdf2_barato):
+    antigo = app.hash_password("segredo")
+    monkeypatch.setattr(app, "PASSWORD_PBKDF2_ITERATIONS", 2000)
+    # Verificado com o custo gravado, e refeito com o atual
+    assert app.verificar_senha("segredo", antigo)
+    assert app.hash_senha_desatualizado(antigo)
+    novo = app.hash_password("segredo")
+    assert novo.startswith("pbkdf2_sha256$2000$")
+    assert not app.hash_senha_desatualizado(novo)
+
+
+def test_troca_de_kdf(monkeypatch, pbkdf2_barato):
+    pbkdf2 = app.hash_password("segredo")
+    monkeypatch.setattr(app, "PASSWORD_KDF", "scrypt")
+    monkeypatch.setattr(app, "PASSWORD_SCRYPT_N", 1024)
+    assert app.verificar_senha("segredo", pbkdf2)
+    assert app.hash_senha_desatualizado(pbkdf2)
+    scrypt = app.hash_password("segredo")
+    assert scrypt.startswith("scrypt$1024$8$1$")
+    assert app.verificar_senha("segredo", scrypt)
+    assert not app.verificar_senha("outra", scrypt)
+    assert not app.hash_senha_desatualizado(scrypt)
+    # De volta ao PBKDF2: o scrypt gravado continua valendo
+    monkeypatch.setattr(app, "PASSWORD_KDF", "pbkdf2")
+    assert app.verificar_senha("segredo", scrypt)
+    assert app.hash_senha_desatualizado(scrypt)
+
+
+@pytest.mark.parametrize(
+    "armazenado",
+    ["", "não é hex", "pbkdf2_sha256$mil$00$00", "md5$1$00$00", "pbkdf2_sha256$1000$zz$00", "scrypt$1024$00$00"],
+)
+def test_hash_invalido_nao_autentica(armazenado):
+    assert not app.verificar_senha("", armazenado)
+    assert not app.verificar_senha("segredo", armazenado)
+
+
+class _Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = _Relogio()
+    monkeypatch.setattr(app.time, "monotonic", relogio)
+    return relogio
+
+
+def test_limitador_janela_deslizante(relogio):
+    limitador = app.LimitadorTentativas(maximo=3, janela=60)
+    for _ in range(3):
+        assert limitador.reservar("ip-203.0.113.7") == 0
+        relogio.agora += 10
+    # Tentativas em 1000, 1010 e 1020; a próxima vaga abre em 1060
+    assert limitador.reservar("ip-203.0.113.7") == 30
+    # Outra chave tem a própria cota
+    assert limitador.reservar("ip-198.51.100.9") == 0
+    # A janela desliza: só a primeira tentativa sai
+    relogio.agora = 1060
+    assert limitador.reservar("ip-203.0.113.7") == 0
+    assert limitador.reservar("ip-203.0.113.7") == 10
+    # Uma janela inteira depois, a cota volta inteira
+    relogio.agora += 60
+    assert [limitador.reservar("ip-203.0.113.7") for _ in range(3)] == [0, 0, 0]
+
+
+def test_limitador_login_certo_zera(relogio):
+    limitador = app.LimitadorTentativas(maximo=2, janela=60)
+    limitador.reservar("sessao-a")
+    limitador.reservar("sessao-a")
+    assert limitador.reservar("sessao-a") > 0
+    limitador.limpar("sessao-a")
+    assert limitador.reservar("sessao-a") == 0
+
+
+@pytest.mark.parametrize(
+    "ip, chave",
+    [
+        ("8.8.8.8", "ip-8.8.8.8"),
+        ("2001:4860:4860::8888", "ip-2001:4860:4860::8888"),
+        # Endereço de proxy, de documentação ou nenhum: cota da sessão
+        ("10.0.0.1", "sessao-abc"),
+        ("127.0.0.1", "sessao-abc"),
+        ("203.0.113.7", "sessao-abc"),
+        (None, "sessao-abc"),
+    ],
+)
+def test_chave_do_limitador(monkeypatch, ip, chave):
+    # Cota por IP só com um IP público visto pelo servidor; nunca uma chave
+    # global que qualquer aluno esgotaria para o professor
+    class Ctx:
+        session_id = "abc"
+
+    monkeypatch.setattr(app, "get_script_run_ctx", lambda: Ctx())
+    monkeypatch.setattr(app, "ip_visto_pelo_servidor", lambda: ip)
+    assert app.chave_limite_login() == chave
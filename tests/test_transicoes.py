@@ -0,0 +1,153 @@
+# Transições do ciclo de vida (ativar, desativar, arquivar e reiniciar) com
+# leitores e votos concorrentes, em SQLite e no backend chave-valor. Nenhum
+# snapshot pode misturar versões (pergunta de uma, opções ou contagens de
+# outra) e nenhum voto aceito pode se perder entre o arquivo e o reset.
+import contextlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+import app  # noqa: E402
+import recursos  # noqa: E402
+
+NUM_TRANSICOES = 30
+NUM_LEITORES = 3
+
+
+def _opcoes(k):
+    # Quantidade e textos das opções mudam a cada pergunta
+    return [f"opção {i} da pergunta {k}" for i in range(2 + k % 3)]
+
+
+def _inconsistencia(snapshot):
+    # Na fase k só se vota na opção k % len(_opcoes(k)) da "Pergunta k"
+    if not snapshot["ativa"]:
+        return f"enquete inativa com {snapshot['total_votos']} votos" if snapshot["total_votos"] else None
+    k = int(snapshot["pergunta"].split()[-1])
+    opcoes = _opcoes(k)
+    if snapshot["opcoes"] != opcoes:
+        return f"{snapshot['pergunta']!r} com as opções {snapshot['opcoes']!r}"
+    if len(snapshot["votos"]) != len(opcoes):
+        return f"{snapshot['pergunta']!r} com {len(snapshot['votos'])} contagens"
+    if snapshot["total_votos"] != snapshot["votos"][k % len(opcoes)]:
+        return f"{snapshot['pergunta']!r} com os votos {snapshot['votos']!r}"
+    return None
+
+
+@pytest.fixture(params=["sqlite", "kv"])
+def enquete(request, tmp_path):
+    recursos.reiniciar(str(tmp_path / "enquete.db"), request.param)
+    # Trocas de thread bem mais frequentes que os 5 ms padrão, para os
+    # leitores caírem também no meio das transições
+    intervalo = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    yield app.db_obter_enquete_id(app.SALA_PADRAO)
+    sys.setswitchinterval(intervalo)
+
+
+def _rodar(enquete_id, pausar_votos):
+    fase = {"k": 0, "ativa": False}
+    lock_votos = threading.Lock()
+    parar = threading.Event()
+    erros, leituras, aceitos = [], [0] * NUM_LEITORES, [0]
+
+    def leitor(r):
+        # Alterna o snapshot direto no backend e o do app (CacheEstado e
+        # "já votou?" pelo IndiceVotantes ou na mesma transação)
+        while not parar.is_set():
+            for snapshot in (
+                app.get_armazenamento().carregar_snapshot(enquete_id),
+                app.db_carregar_snapshot(enquete_id, f"leitor-{r}"),
+            ):
+                erro = _inconsistencia(snapshot)
+                if erro:
+                    erros.append(erro)
+                leituras[r] += 1
+
+    def votante():
+        n = 0
+        while not parar.is_set():
+            # Com pausar_votos, nenhum voto cruza uma transição
+            with lock_votos if pausar_votos else contextlib.nullcontext():
+                k, ativa = fase["k"], fase["ativa"]
+                if ativa and app.db_registrar_voto(enquete_id, k % len(_opcoes(k)), f"votante-{n}"):
+                    aceitos[0] += 1
+            n += 1
+
+    threads = [threading.Thread(target=leitor, args=(r,)) for r in range(NUM_LEITORES)]
+    threads.append(threading.Thread(target=votante))
+    for th in threads:
+        th.start()
+    try:
+        # Duas ativações e então uma desativação (votos pausados) ou um
+        # "arquivar e reiniciar" (votos chegando)
+        for k in range(1, NUM_TRANSICOES + 1):
+            time.sleep(0.005)
+            with lock_votos if pausar_votos else contextlib.nullcontext():
+                if k % 3:
+                    app.db_ativar_enquete(enquete_id, f"Pergunta {k}", _opcoes(k))
+                    fase.update(k=k, ativa=True)
+                elif pausar_votos:
+                    app.db_desativar_enquete(enquete_id)
+                    fase.update(ativa=False)
+                else:
+                    app.db_arquivar_e_resetar(enquete_id)
+    finally:
+        parar.set()
+        for th in threads:
+            th.join()
+    return erros, sum(leituras), aceitos[0]
+
+
+def test_snapshots_nunca_misturam_versoes(enquete):
+    erros, leituras, aceitos = _rodar(enquete, pausar_votos=True)
+    assert leituras > NUM_TRANSICOES
+    assert aceitos > 0
+    assert erros == []
+
+
+def test_nenhum_voto_aceito_se_perde(enquete):
+    _, _, aceitos = _rodar(enquete, pausar_votos=False)
+    arquivados = sum(item["total_votos"] for item in app.get_armazenamento().exportar_historico(None, 0, 1_000_000))
+    em_curso = app.get_armazenamento().carregar_snapshot(enquete)["total_votos"]
+    assert aceitos > 0
+    assert arquivados + em_curso == aceitos
+
+
+def test_voto_kv_cruzando_transicao_de_outra_replica(tmp_path):
+    # Outra réplica (mesmo armazém) reinicia a enquete logo depois de o voto
+    # olhar o conjunto de votantes: o voto tem de ficar inteiro numa enquete
+    # só, e não com o votante na antiga e a contagem na nova
+    recursos.reiniciar(str(tmp_path / "enquete.db"), "kv")
+    armazenamento = app.get_armazenamento()
+    outra_replica = app.ArmazenamentoKV(armazenamento.kv)
+    enquete_id = app.db_obter_enquete_id(app.SALA_PADRAO)
+    app.db_ativar_enquete(enquete_id, "Pergunta 1", _opcoes(1))
+    kv = armazenamento.kv
+    transicoes = []
+
+    def com_transicao(metodo):
+        def chamar(*args):
+            resposta = metodo(*args)
+            if not transicoes:
+                transicoes.append(None)
+                transicoes[0] = outra_replica.transicionar_enquete(enquete_id)
+            return resposta
+
+        return chamar
+
+    kv.sadd, kv.sismember = com_transicao(kv.sadd), com_transicao(kv.sismember)
+    assert app.db_registrar_voto(enquete_id, 1, "votante-1")
+    del kv.sadd, kv.sismember
+    assert transicoes == [True]
+    snapshot = armazenamento.carregar_snapshot(enquete_id, "votante-1")
+    assert snapshot["votos"] == [0, 1, 0]
+    assert snapshot["ja_votou"]
+    assert not app.db_registrar_voto(enquete_id, 0, "votante-1")
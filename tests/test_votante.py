@@ -0,0 +1,78 @@
+# Formato compacto do id de voto (migração 7): IP em 4/16 bytes, sessão em
+# 17 (marca + UUID) e, para tudo o que não é canônico, o próprio texto. A
+# volta tem de devolver o texto original, e ids diferentes nunca colidem.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+UUID = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+
+@pytest.mark.parametrize(
+    "user_voting_id, tamanho",
+    [
+        ("ip-203.0.113.7", 4),
+        ("ip-0.0.0.0", 4),
+        ("ip-2001:db8::1", 16),
+        ("ip-::", 16),
+        ("ip-::ffff:203.0.113.7", 16),
+        (f"sessao-{UUID}", 17),
+        ("sessao-00000000-0000-0000-0000-000000000000", 17),
+    ],
+)
+def test_ida_e_volta_compacta(user_voting_id, tamanho):
+    codificado = app.codificar_votante(user_voting_id)
+    assert isinstance(codificado, bytes)
+    assert len(codificado) == tamanho
+    assert app.decodificar_votante(codificado) == user_voting_id
+
+
+@pytest.mark.parametrize(
+    "user_voting_id",
+    [
+        # IPv6 fora da forma canônica: o texto fica como veio, para a volta
+        # não trocar o id (e o voto já gravado continuar sendo encontrado)
+        "ip-2001:DB8::1",
+        "ip-2001:0db8:0:0:0:0:0:1",
+        "ip-::FFFF:203.0.113.7",
+        "ip-203.0.113.007",
+        "ip-não é ip",
+        "ip-",
+        f"sessao-{UUID.upper()}",
+        f"sessao-{UUID.replace('-', '')}",
+        "sessao-curta",
+        "sessao-",
+        "outro-formato",
+        "",
+    ],
+)
+def test_nao_canonico_fica_em_texto(user_voting_id):
+    assert app.codificar_votante(user_voting_id) == user_voting_id
+    assert app.decodificar_votante(app.codificar_votante(user_voting_id)) == user_voting_id
+
+
+def test_ids_diferentes_nao_colidem():
+    ids = [
+        "ip-203.0.113.7",
+        "ip-::ffff:203.0.113.7",
+        "ip-::cb00:7107",
+        "ip-2001:db8::1",
+        "ip-2001:DB8::1",
+        "ip-::",
+        "ip-0.0.0.0",
+        # 16 bytes de UUID contra um IPv6 com os mesmos bytes: a marca separa
+        f"sessao-{UUID}",
+        f"ip-{app.socket.inet_ntop(app.socket.AF_INET6, bytes.fromhex(UUID.replace('-', '')))}",
+        "sessao-00000000-0000-0000-0000-000000000000",
+        # O mesmo endereço em outra grafia fica em texto, ao lado do compacto
+        "ip-0:0:0:0:0:0:0:0",
+        f"sessao-{UUID.upper()}",
+    ]
+    codificados = [app.codificar_votante(i) for i in ids]
+    assert len(set(codificados)) == len(ids)
+    assert [app.decodificar_votante(c) for c in codificados] == ids